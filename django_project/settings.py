@@ -46,6 +46,7 @@ INSTALLED_APPS = [
     'django.contrib.sessions',
     'django.contrib.messages',
     'django.contrib.staticfiles',
+    'django.contrib.postgres', # Search lookups and pg_trgm operators
     'myapp',
     'ninja',        # Add Django Ninja
     'rest_framework_simplejwt', # Add Simple JWT
@@ -65,6 +66,92 @@ CELERY_TIMEZONE = 'Europe/Moscow'
 CELERY_TASK_TRACK_STARTED = True
 CELERY_TASK_TIME_LIMIT = 300 # Max 5 minutes for a task to run
 
+# Cache (Redis): cached API responses and the catalog version counter
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+        'LOCATION': os.environ.get('REDIS_CACHE_URL', 'redis://redis:6379/1'),
+    }
+}
+
+# Excel import configuration
+# Default import engine: 'bulk' (batched upserts) or 'copy' (COPY into a staging table)
+PRODUCT_IMPORT_ENGINE = os.environ.get('PRODUCT_IMPORT_ENGINE', 'bulk')
+# Number of rows written per INSERT ... ON CONFLICT statement (and per commit)
+PRODUCT_IMPORT_CHUNK_SIZE = int(os.environ.get('PRODUCT_IMPORT_CHUNK_SIZE', 2000))
+# Files with more data rows than this are split into row ranges of this size,
+# each imported by its own Celery subtask
+PRODUCT_IMPORT_PARALLEL_ROWS = int(os.environ.get('PRODUCT_IMPORT_PARALLEL_ROWS', 50000))
+# Upper bound on the number of those subtasks; larger files get larger ranges.
+# openpyxl cannot seek to a row, so every subtask parses the sheet from its
+# first row to the end of its range (and loads all shared strings): the total
+# parse work grows with the square of the number of ranges, about
+# (ranges + 1) / 2 times that of a single-task import
+PRODUCT_IMPORT_MAX_PARALLEL_TASKS = int(os.environ.get('PRODUCT_IMPORT_MAX_PARALLEL_TASKS', 8))
+# Import progress is written to the result backend at most once per this many rows
+# or milliseconds, whichever comes first
+PRODUCT_IMPORT_PROGRESS_EVERY_ROWS = int(os.environ.get('PRODUCT_IMPORT_PROGRESS_EVERY_ROWS', 5000))
+PRODUCT_IMPORT_PROGRESS_INTERVAL_MS = int(os.environ.get('PRODUCT_IMPORT_PROGRESS_INTERVAL_MS', 1000))
+# Values longer than their column are truncated (and listed in the rejects file
+# of the import); when False, their rows are rejected instead
+PRODUCT_IMPORT_TRUNCATE_LONG_VALUES = os.environ.get('PRODUCT_IMPORT_TRUNCATE_LONG_VALUES', 'True') == 'True'
+# Re-uploading a file identical to an already imported one returns the previous
+# result, as long as no product was written or deleted since
+PRODUCT_IMPORT_REUSE_IDENTICAL_FILES = os.environ.get('PRODUCT_IMPORT_REUSE_IDENTICAL_FILES', 'True') == 'True'
+# Uploaded Excel files are written here under unique names (shared with the Celery workers)
+PRODUCT_UPLOAD_DIR = os.path.join(MEDIA_ROOT, 'uploads')
+# Largest accepted upload, in bytes
+PRODUCT_UPLOAD_MAX_SIZE = int(os.environ.get('PRODUCT_UPLOAD_MAX_SIZE', 1024 * 1024 * 1024))
+# Chunk length of resumable uploads (/api/uploads), in bytes: a multiple of 1 MiB
+# (importers.HASH_BLOCK_SIZE), below client_max_body_size of /api/uploads/ in nginx
+PRODUCT_UPLOAD_CHUNK_SIZE = int(os.environ.get('PRODUCT_UPLOAD_CHUNK_SIZE', 8 * 1024 * 1024))
+# Resumable uploads receiving no chunk for this many hours are deleted
+PRODUCT_UPLOAD_EXPIRY_HOURS = int(os.environ.get('PRODUCT_UPLOAD_EXPIRY_HOURS', 24))
+# Catalog exports and the rejects files of imports are written here;
+# nginx serves them under /media/exports/
+PRODUCT_EXPORT_DIR = os.path.join(MEDIA_ROOT, 'exports')
+# Rows fetched per round trip by the server-side cursor of an export
+PRODUCT_EXPORT_CHUNK_SIZE = int(os.environ.get('PRODUCT_EXPORT_CHUNK_SIZE', 5000))
+# Exports and rejects files are deleted this many hours after they were written
+PRODUCT_EXPORT_EXPIRY_HOURS = int(os.environ.get('PRODUCT_EXPORT_EXPIRY_HOURS', 24))
+# Product group of rows without one; it is kept at the top level of the tree
+PRODUCT_IMPORT_DEFAULT_GROUP = "Автозапчасти"
+# Parent of each group, applied whenever an import references the group
+# (the parent group is created if needed). Other groups keep their parent.
+PRODUCT_GROUP_PARENTS = {
+    "Рулевое управление": "Автозапчасти",
+    "Подвеска колеса": "Автозапчасти",
+}
+
+# API configuration
+# Default and maximum page sizes of the keyset-paginated endpoints
+API_PAGE_SIZE = int(os.environ.get('API_PAGE_SIZE', 1000))
+API_MAX_PAGE_SIZE = int(os.environ.get('API_MAX_PAGE_SIZE', 10000))
+# Rows fetched per round trip by the server-side cursor of streaming endpoints
+API_STREAM_CHUNK_SIZE = int(os.environ.get('API_STREAM_CHUNK_SIZE', 2000))
+# Most frequent values per attribute in the facets of GET /api/products/filter
+API_MAX_FACET_VALUES = int(os.environ.get('API_MAX_FACET_VALUES', 50))
+# Maximum number of cross numbers accepted by POST /api/crosses/lookup
+API_MAX_LOOKUP_NUMBERS = int(os.environ.get('API_MAX_LOOKUP_NUMBERS', 1000))
+# Maximum number of articles accepted by POST /api/articles/batch_get
+API_MAX_BATCH_ARTICLES = int(os.environ.get('API_MAX_BATCH_ARTICLES', 5000))
+# Maximum number of items accepted by POST /api/articles/bulk_upsert,
+# and items written per SQL statement
+API_MAX_BULK_ITEMS = int(os.environ.get('API_MAX_BULK_ITEMS', 50000))
+API_BULK_CHUNK_SIZE = int(os.environ.get('API_BULK_CHUNK_SIZE', 1000))
+# Lifetime in seconds of cached catalog responses. Writes invalidate them right
+# away by bumping the catalog version, so this only bounds memory use in Redis
+API_CACHE_TTL = int(os.environ.get('API_CACHE_TTL', 3600))
+# GET /api/articles/changes only returns changes older than this many seconds,
+# to absorb clock skew between the application and database servers
+API_CHANGES_LAG_SECONDS = int(os.environ.get('API_CHANGES_LAG_SECONDS', 5))
+
+# Authenticate API calls from the JWT claims alone (TokenUser) instead of loading
+# the user row on every request; only the user's active status is checked,
+# through an in-process cache that entries leave after this many seconds
+API_JWT_STATELESS = os.environ.get('API_JWT_STATELESS', 'True') == 'True'
+API_USER_STATUS_CACHE_TTL = int(os.environ.get('API_USER_STATUS_CACHE_TTL', 60))
+
 # Django REST Framework Simple JWT Configuration
 # This is a basic configuration. Adjust as needed for production.
 SIMPLE_JWT = {
@@ -101,6 +188,7 @@ SIMPLE_JWT = {
 
 
 MIDDLEWARE = [
+    'myapp.middleware.MetricsMiddleware', # First, so the latency covers the other middleware
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -136,15 +224,32 @@ WSGI_APPLICATION = 'django_project.wsgi.application'
 
 DATABASES = {
     'default': {
-        'ENGINE': 'django.db.backends.postgresql',
-        'NAME': 'test_db',
-        'USER': 'chrono',
-        'PASSWORD': 'test_password',
-        'HOST': 'db',  # Use 'localhost' if PostgreSQL is on the same server
-        'PORT': '',           # PostgreSQL default port is 5432. Leave empty for default.
+        'ENGINE': 'myapp.db_backend', # django.db.backends.postgresql, timing connection acquisition
+        'NAME': os.environ.get('POSTGRES_DB', 'test_db'),
+        'USER': os.environ.get('POSTGRES_USER', 'chrono'),
+        'PASSWORD': os.environ.get('POSTGRES_PASSWORD', 'test_password'),
+        'HOST': os.environ.get('POSTGRES_HOST', 'db'),  # Use 'localhost' if PostgreSQL is on the same server
+        'PORT': os.environ.get('POSTGRES_PORT', ''),           # PostgreSQL default port is 5432. Leave empty for default.
+        # Seconds a connection stays open for reuse by later requests and Celery tasks;
+        # 0 closes it after each one. run_uvicorn.py defaults it to 0 (see the README)
+        'CONN_MAX_AGE': int(os.environ.get('POSTGRES_CONN_MAX_AGE', 60)),
+        # Check a reused connection with a cheap query before its first use in a request
+        'CONN_HEALTH_CHECKS': os.environ.get('POSTGRES_CONN_HEALTH_CHECKS', 'True') == 'True',
+        'OPTIONS': {
+            'connect_timeout': int(os.environ.get('POSTGRES_CONNECT_TIMEOUT', 5)), # Seconds
+        },
     }
 }
 
+# Opening a database connection slower than this is logged as a warning (milliseconds)
+DB_SLOW_CONNECT_MS = int(os.environ.get('DB_SLOW_CONNECT_MS', 100))
+
+# Metrics served by GET /api/metrics are summed over all processes in a hash in this
+# Redis database; when empty, each process only serves its own
+METRICS_REDIS_URL = os.environ.get('METRICS_REDIS_URL', os.environ.get('REDIS_CACHE_URL', 'redis://redis:6379/1'))
+# A process adds its metrics to the shared totals at most this often (seconds)
+METRICS_FLUSH_INTERVAL = int(os.environ.get('METRICS_FLUSH_INTERVAL', 10))
+
 # Password validation
 # https://docs.djangoproject.com/en/4.2/ref/settings/#auth-password-validators
 
@@ -0,0 +1,181 @@
+"""
+Load test comparing API latency under concurrency across deployments.
+
+Sends a mix of fast requests (GET /api/articles/{article}) and a small share of
+slow ones (the full catalog from GET /api/get_article_crosses/stream) from
+`--concurrency` keep-alive connections, then prints p50/p99 latency per kind.
+On the single-threaded bjoern server, every slow request stalls the fast ones
+queued behind it; under ASGI they keep being served.
+
+Usage (both servers against the same database):
+    python run_bjoern.py &
+    ASGI_PORT=8012 ASGI_WORKERS=1 python run_uvicorn.py &
+    python load_test.py --target bjoern=http://localhost:8011 --target uvicorn=http://localhost:8012 \
+        --username admin --password secret --concurrency 32 --requests 2000
+
+Only needs the standard library.
+"""
+import argparse
+import http.client
+import json
+import math
+import random
+import statistics
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import quote, urlsplit
+
+
+class Target:
+    def __init__(self, name, url):
+        self.name = name
+        parts = urlsplit(url)
+        self.host = parts.hostname
+        self.port = parts.port or 80
+
+    def connect(self, timeout):
+        return http.client.HTTPConnection(self.host, self.port, timeout=timeout)
+
+
+def request_json(connection, method, path, body=None, token=None):
+    headers = {'Content-Type': 'application/json'}
+    if token:
+        headers['Authorization'] = f"Bearer {token}"
+    connection.request(method, path, body=json.dumps(body) if body is not None else None, headers=headers)
+    response = connection.getresponse()
+    data = response.read()
+    if response.status != 200:
+        raise RuntimeError(f"{method} {path} returned {response.status}: {data[:200]!r}")
+    return json.loads(data)
+
+
+def prepare(target, username, password, sample_size, timeout):
+    """
+    Returns a JWT access token and a sample of existing articles for the fast requests.
+    """
+    connection = target.connect(timeout)
+    try:
+        token = request_json(
+            connection, 'POST', '/api/auth/token', {'username': username, 'password': password},
+        )['access_token']
+        page = request_json(connection, 'GET', f"/api/get_article_crosses/page?limit={sample_size}", token=token)
+    finally:
+        connection.close()
+    articles = [item['article'] for item in page['items']]
+    if not articles:
+        raise RuntimeError(f"{target.name}: the catalog is empty, import some products first.")
+    return token, articles
+
+
+def run(target, token, articles, options):
+    """
+    Sends options.requests requests from options.concurrency connections.
+
+    Returns:
+        tuple: List of (kind, seconds, ok) samples and the wall time in seconds.
+    """
+    samples = []
+    lock = threading.Lock()
+    remaining = iter(range(options.requests))
+
+    def worker(seed):
+        rng = random.Random(seed)
+        connection = target.connect(options.timeout)
+        headers = {'Authorization': f"Bearer {token}"}
+        local = []
+        while True:
+            with lock:
+                if next(remaining, None) is None:
+                    break
+            if rng.random() < options.slow_ratio:
+                kind, path = 'slow', '/api/get_article_crosses/stream'
+            else:
+                kind, path = 'fast', f"/api/articles/{quote(rng.choice(articles), safe='')}"
+            started = time.perf_counter()
+            try:
+                connection.request('GET', path, headers=headers)
+                response = connection.getresponse()
+                response.read()
+                ok = response.status in (200, 304)
+            except (OSError, http.client.HTTPException):
+                ok = False
+                connection.close()
+                connection = target.connect(options.timeout)
+            local.append((kind, time.perf_counter() - started, ok))
+        connection.close()
+        with lock:
+            samples.extend(local)
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=options.concurrency) as executor:
+        for seed in range(options.concurrency):
+            executor.submit(worker, options.seed + seed)
+    return samples, time.perf_counter() - started
+
+
+def percentile(values, share):
+    # Nearest-rank percentile of sorted values
+    return values[max(0, math.ceil(share * len(values)) - 1)]
+
+
+def summarize(samples, wall_time):
+    summary = {'requests': len(samples), 'requests_per_sec': round(len(samples) / wall_time, 1)}
+    for kind in ('fast', 'slow'):
+        latencies = sorted(seconds * 1000 for sample_kind, seconds, ok in samples if sample_kind == kind and ok)
+        errors = sum(1 for sample_kind, _, ok in samples if sample_kind == kind and not ok)
+        summary[kind] = {
+            'count': len(latencies),
+            'errors': errors,
+            'p50_ms': round(percentile(latencies, 0.50), 2) if latencies else None,
+            'p99_ms': round(percentile(latencies, 0.99), 2) if latencies else None,
+            'max_ms': round(latencies[-1], 2) if latencies else None,
+            'mean_ms': round(statistics.fmean(latencies), 2) if latencies else None,
+        }
+    return summary
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--target', action='append', required=True, metavar='NAME=URL',
+                        help='Deployment to test, e.g. bjoern=http://localhost:8011. Repeat to compare.')
+    parser.add_argument('--username', required=True)
+    parser.add_argument('--password', required=True)
+    parser.add_argument('--concurrency', type=int, default=32, help='Parallel keep-alive connections.')
+    parser.add_argument('--requests', type=int, default=2000, help='Requests per target.')
+    parser.add_argument('--slow-ratio', type=float, default=0.02, help='Share of full catalog stream requests.')
+    parser.add_argument('--warmup', type=int, default=200, help='Unmeasured requests per target (fills the cache).')
+    parser.add_argument('--sample-size', type=int, default=500, help='Articles to pick the fast requests from.')
+    parser.add_argument('--timeout', type=float, default=120.0)
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--json', dest='json_path', help='Also write the results to this JSON file.')
+    options = parser.parse_args()
+
+    results = {}
+    for spec in options.target:
+        name, _, url = spec.partition('=')
+        target = Target(name, url)
+        token, articles = prepare(target, options.username, options.password, options.sample_size, options.timeout)
+        warmup = argparse.Namespace(**{**vars(options), 'requests': options.warmup, 'slow_ratio': 0})
+        run(target, token, articles, warmup)
+        samples, wall_time = run(target, token, articles, options)
+        results[name] = summarize(samples, wall_time)
+
+    print(f"{'target':<12} {'kind':<5} {'count':>6} {'errors':>6} {'p50 ms':>9} {'p99 ms':>9} {'max ms':>9} {'req/s':>8}")
+    for name, summary in results.items():
+        for kind in ('fast', 'slow'):
+            row = summary[kind]
+            print(
+                f"{name:<12} {kind:<5} {row['count']:>6} {row['errors']:>6} "
+                f"{row['p50_ms'] if row['p50_ms'] is not None else '-':>9} "
+                f"{row['p99_ms'] if row['p99_ms'] is not None else '-':>9} "
+                f"{row['max_ms'] if row['max_ms'] is not None else '-':>9} "
+                f"{summary['requests_per_sec'] if kind == 'fast' else '':>8}"
+            )
+    if options.json_path:
+        with open(options.json_path, 'w') as f:
+            json.dump({'options': vars(options), 'results': results}, f, indent=2)
+
+
+if __name__ == '__main__':
+    main()
@@ -1,10 +1,35 @@
-from django.contrib.auth import authenticate
-from ninja import NinjaAPI, Schema
-from ninja.security import HttpBearer # Import HttpBearer for JWT authentication
+import csv
+import json
+import uuid
+from collections import defaultdict
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.contrib.auth import aauthenticate
+from django.core.handlers.asgi import ASGIRequest
+from django.http import HttpResponse, StreamingHttpResponse
+from ninja import Field, NinjaAPI, Query, Schema
 from rest_framework_simplejwt.tokens import AccessToken, RefreshToken
+from datetime import datetime
 from typing import Optional, List
-from django.shortcuts import get_object_or_404
-from myapp.models import Product # Import your Product model
+from django.db import transaction
+from myapp.auth import AsyncJWTAuth, async_django_auth
+from myapp.bulk import bulk_upsert_products
+from myapp.cache import abump_catalog_version, acached_json_response, get_cache_stats
+from myapp.changes import InvalidCursorError, get_changes
+from myapp.crosses import normalize_cross_number, sync_product_crosses
+from myapp.dbstats import get_db_stats
+from myapp.exports import EXPORT_FORMATS, EXPORT_XLSX, ExportTooLargeError, check_xlsx_size
+from myapp.groups import get_group_products, get_group_tree
+from myapp.importers import IMPORT_ENGINES, InvalidExcelFileError
+from myapp.metrics import PROMETHEUS_CONTENT_TYPE, render_metrics
+from myapp.models import Product, ProductCross, ProductGroup, ProductUpload # Import your Product model
+from myapp.progress import get_import_status, get_task_status
+from myapp.search import InvalidSearchCursorError, search_products
+from myapp.specs import InvalidSpecFilterError, filter_products, parse_spec_filters
+from myapp.tasks import export_catalog
+from myapp.uploads import (
+    UploadError, UploadOffsetError, UploadUnavailableError, append_chunk, complete_upload, create_upload, discard_upload,
+)
 import logging
 
 logger = logging.getLogger(__name__)
@@ -16,21 +41,8 @@ api = NinjaAPI(
     description="API for managing products and product groups, with JWT authentication."
 )
 
-# Custom authentication class for JWT using HttpBearer
-class JWTAuth(HttpBearer):
-    def authenticate(self, request, token):
-        try:
-            # Validate the token using Simple JWT's built-in validation
-            # This will raise an exception if the token is invalid or expired
-            from rest_framework_simplejwt.authentication import JWTAuthentication
-            validated_token = JWTAuthentication().get_validated_token(token)
-            user = JWTAuthentication().get_user(validated_token)
-            if user and user.is_active:
-                request.auth_user = user # Attach user to request for potential use in endpoints
-                return user
-        except Exception as e:
-            logger.error(f"JWT authentication failed: {e}")
-            return None # Authentication failed
+# All endpoints are async: under ASGI (run_uvicorn.py) a slow request only holds its own
+# coroutine and database thread, under WSGI (run_bjoern.py) Django runs them to completion
 
 # Schemas for authentication request (username and password)
 class AuthIn(Schema):
@@ -52,6 +64,104 @@ class ArticleCrossesOut(Schema):
     brand: str
     trading_numbers: str # Assuming "кроссы" are stored as a string in trading_numbers
 
+# Schema for one keyset-paginated page of articles and crosses
+class ArticleCrossesPageOut(Schema):
+    items: List[ArticleCrossesOut]
+    next_cursor: Optional[int] = None # Pass as `after` to get the next page; null on the last page
+
+# Query parameters for keyset pagination
+class PageIn(Schema):
+    after: int = 0 # Id of the last product of the previous page
+    limit: Optional[int] = Field(None, ge=1) # Defaults to settings.API_PAGE_SIZE, capped at settings.API_MAX_PAGE_SIZE
+
+# Schema for a changed article in a delta sync
+class ArticleChangeOut(Schema):
+    article: str
+    brand: str
+    trading_numbers: str
+    updated_at: datetime
+
+# Schema for a deleted article in a delta sync
+class ArticleDeletionOut(Schema):
+    article: str
+    deleted_at: datetime
+
+# Schema for one page of catalog changes
+class ArticleChangesOut(Schema):
+    changed: List[ArticleChangeOut] # In (updated_at, id) order
+    deleted: List[ArticleDeletionOut] # Apply before `changed`
+    next_cursor: str # Pass as `since` in the next call
+    has_more: bool # True if more changes are available right away
+
+# Query parameters for delta syncs
+class ChangesIn(Schema):
+    since: str = '' # Cursor from the previous call; empty for a full sync
+    limit: Optional[int] = Field(None, ge=1) # Defaults to settings.API_PAGE_SIZE, capped at settings.API_MAX_PAGE_SIZE
+
+# Query parameters for product search
+class ProductSearchIn(Schema):
+    q: str # Words for the full-text search, or (part of) an article or brand
+    brand: Optional[str] = None # Exact brand filter
+    group_id: Optional[int] = None # Product group filter
+    after: Optional[str] = None # `next_cursor` of the previous page
+    limit: Optional[int] = Field(None, ge=1) # Defaults to settings.API_PAGE_SIZE, capped at settings.API_MAX_PAGE_SIZE
+
+# Schema for one product search result
+class ProductSearchItemOut(Schema):
+    article: str
+    brand: str
+    trading_numbers: str
+    additional_name: str
+    description: str
+    product_group_id: Optional[int] = None
+    rank: float # Higher is more relevant
+
+# Schema for one page of product search results
+class ProductSearchOut(Schema):
+    items: List[ProductSearchItemOut] # Most relevant first
+    next_cursor: Optional[str] = None # Pass as `after` to get the next page; null on the last page
+
+# Schema for a node of the product group tree
+class GroupNodeOut(Schema):
+    id: int
+    name: str
+    children: List['GroupNodeOut'] # Sorted by name
+
+# Query parameters for listing the products of a group
+class GroupProductsIn(PageIn):
+    recursive: bool = False # Include the products of all subgroups
+
+# Query parameters for filtering products by specification attributes; the
+# attribute filters themselves are free-form `spec.<attribute>=<value>` parameters
+class ProductFilterIn(PageIn):
+    brand: Optional[str] = None # Exact brand filter
+    group_id: Optional[int] = None # Product group filter
+    facets: bool = False # Also count the matching products per attribute value
+
+# Schema for one product matching an attribute filter
+class ProductFilterItemOut(Schema):
+    article: str
+    brand: str
+    trading_numbers: str
+    specifications: str # As imported
+    spec_attributes: dict # Attributes parsed from specifications
+
+# Schema for the product count of one attribute value
+class SpecFacetValueOut(Schema):
+    value: str
+    count: int
+
+# Schema for the value counts of one attribute
+class SpecFacetOut(Schema):
+    key: str
+    values: List[SpecFacetValueOut] # Most frequent first, at most settings.API_MAX_FACET_VALUES
+
+# Schema for one page of products matching an attribute filter
+class ProductFilterOut(Schema):
+    items: List[ProductFilterItemOut]
+    next_cursor: Optional[int] = None # Pass as `after` to get the next page; null on the last page
+    facets: Optional[List[SpecFacetOut]] = None # Over all matching products; only with facets=true
+
 # Schema for adding a new article with crosses
 class AddArticleCrossIn(Schema):
     article: str
@@ -72,14 +182,133 @@ class UpdateArticleCrossIn(Schema):
     product_status: Optional[str] = None
     specifications: Optional[str] = None
 
+# Schema for the articles that cross to one number
+class CrossLookupOut(Schema):
+    number: str # As requested
+    normalized_number: str # Uppercase, without spaces, dashes and dots
+    articles: List[ArticleCrossesOut]
+
+# Schema for looking up many cross numbers in one call
+class CrossLookupBatchIn(Schema):
+    numbers: List[str]
+
+# Schema for fetching many articles in one call
+class ArticleBatchGetIn(Schema):
+    articles: List[str]
+
+# Schema for the batch article lookup result
+class ArticleBatchGetOut(Schema):
+    found: List[ArticleCrossesOut] # In the order requested
+    missing: List[str]
+
+# Schema for applying many additions and updates in one call
+class BulkUpsertIn(Schema):
+    add: List[AddArticleCrossIn] = []
+    update: List[UpdateArticleCrossIn] = [] # Only the provided (non-null) fields are written
+
+# Schema for the outcome of one bulk upsert item
+class BulkUpsertItemOut(Schema):
+    op: str # 'add' or 'update'
+    index: int # Position of the item in its list
+    article: str
+    status: str # created, updated, conflict, not_found or invalid
+    detail: Optional[str] = None
+
+# Schema for the response cache counters
+class CacheStatsOut(Schema):
+    catalog_version: int # Bumped by every write; part of every cache key
+    hits: int # Includes 304 Not Modified responses
+    misses: int
+    hit_ratio: Optional[float] = None
+
+# Schema for the database connection counters
+class DbStatsOut(Schema):
+    conn_max_age: Optional[int] = None # Seconds a connection is reused; null: unlimited
+    health_checks_enabled: bool
+    connects: int # New connections opened, by all processes
+    avg_connect_ms: Optional[float] = None
+    health_checks: int # Persistent connections checked before reuse
+    avg_health_check_ms: Optional[float] = None
+    health_check_failures: int # Dead connections replaced
+
+# Schema for the throttled progress of a running import
+class ImportProgressOut(Schema):
+    current_row: Optional[int] = None
+    processed_rows: int = 0
+    total_rows: Optional[int] = None
+    rows_per_sec: float = 0
+    eta_seconds: Optional[float] = None
+    errors: int = 0
+    chunks_done: Optional[int] = None # Only for imports split into parallel subtasks
+    chunks: Optional[int] = None
+
+# Schema for import status polling
+class ImportStatusOut(Schema):
+    task_id: str
+    state: str # Celery state: PENDING, STARTED, PROGRESS, SUCCESS or FAILURE
+    progress: Optional[ImportProgressOut] = None
+    result: Optional[dict] = None # Final import report once the task succeeded
+    error: Optional[str] = None
+
+
+# Schema for starting a resumable upload
+class UploadIn(Schema):
+    file_name: str
+    size: int # Total size of the file in bytes
+
+# Schema for the state of a resumable upload
+class UploadOut(Schema):
+    upload_id: str
+    file_name: str
+    size: int
+    received: int # Offset of the next chunk; resume from here after an interruption
+    chunk_size: int # Length of the chunks to send (the last one may be shorter)
+
+# Schema for a chunk sent at the wrong offset
+class UploadOffsetOut(Schema):
+    detail: str
+    received: int # Offset of the next chunk
+
+# Schema for completing a resumable upload
+class UploadCompleteIn(Schema):
+    engine: Optional[str] = None # 'bulk' or 'copy'; defaults to settings.PRODUCT_IMPORT_ENGINE
+
+# Schema for the import started by a completed upload
+class UploadCompleteOut(Schema):
+    task_id: str # Poll GET /import_status/{task_id}
+
+# Schema for starting a catalog export
+class ExportIn(Schema):
+    format: str = 'xlsx' # 'xlsx' or 'csv'
+
+# Schema for a started catalog export
+class ExportStartOut(Schema):
+    task_id: str # Poll GET /exports/{task_id}
+
+# Schema for a finished catalog export
+class ExportResultOut(Schema):
+    file_name: str
+    url: str # Download link, served by nginx
+    format: str
+    rows: int
+    size: int # Bytes
+    duration: float # Seconds
+
+# Schema for export status polling
+class ExportStatusOut(Schema):
+    task_id: str
+    state: str # Celery state: PENDING, STARTED, PROGRESS, SUCCESS or FAILURE
+    progress: Optional[ImportProgressOut] = None
+    result: Optional[ExportResultOut] = None
+    error: Optional[str] = None
 
 @api.post("/auth/token", response={200: AuthOut, 401: ErrorOut}, tags=["Authentication"])
-def get_jwt_token(request, auth_in: AuthIn):
+async def get_jwt_token(request, auth_in: AuthIn):
     """
     Retrieves JWT access and refresh tokens for a given username and password.
     """
     # Authenticate the user using Django's built-in authentication system
-    user = authenticate(username=auth_in.username, password=auth_in.password)
+    user = await aauthenticate(username=auth_in.username, password=auth_in.password)
 
     if user is not None:
         # If authentication is successful, generate access and refresh tokens
@@ -93,21 +322,131 @@ def get_jwt_token(request, auth_in: AuthIn):
         return 401, {"detail": "Invalid credentials"}
 
 
-@api.get("/get_article_crosses", response={200: List[ArticleCrossesOut], 401: ErrorOut}, auth=JWTAuth(), tags=["Articles and Crosses"])
-def get_article_crosses(request):
+@api.get("/get_article_crosses", response={200: List[ArticleCrossesOut], 304: None, 401: ErrorOut}, auth=AsyncJWTAuth(), tags=["Articles and Crosses"])
+async def get_article_crosses(request):
     """
     Returns articles, brands, and their crosses (trading numbers).
+    The serialized response is cached in Redis until the next catalog write;
+    send the returned ETag in If-None-Match to get a 304 while nothing changed.
     Requires JWT authentication.
     """
     # request.auth will contain the authenticated user if JWTAuth was successful
     # print(f"Authenticated user for GET /get_article_crosses: {request.auth.username}")
-    
-    products = Product.objects.all().values('article', 'brand', 'trading_numbers')
-    return list(products)
+
+    async def build():
+        return 200, [row async for row in Product.objects.all().values('article', 'brand', 'trading_numbers')]
+    return await acached_json_response(request, 'get_article_crosses', {}, build)
 
 
-@api.post("/add_article_crosses", response={201: ArticleCrossesOut, 400: ErrorOut, 401: ErrorOut, 409: ErrorOut}, auth=JWTAuth(), tags=["Articles and Crosses"])
-def add_article_crosses(request, data: AddArticleCrossIn):
+@api.get("/get_article_crosses/page", response={200: ArticleCrossesPageOut, 304: None, 401: ErrorOut}, auth=AsyncJWTAuth(), tags=["Articles and Crosses"])
+async def get_article_crosses_page(request, page: Query[PageIn]):
+    """
+    Returns one page of articles, brands and crosses, ordered by product id.
+    Uses keyset pagination (id > after), so every page costs the same
+    regardless of how deep into the catalog it is.
+    Requires JWT authentication.
+    """
+    limit = min(page.limit or settings.API_PAGE_SIZE, settings.API_MAX_PAGE_SIZE)
+
+    async def build():
+        # Fetch one extra row to know whether there is a next page
+        rows = [
+            row async for row in Product.objects.filter(id__gt=page.after).order_by('id')
+            .values('id', 'article', 'brand', 'trading_numbers')[:limit + 1]
+        ]
+        next_cursor = rows[limit - 1]['id'] if len(rows) > limit else None
+        items = [{key: row[key] for key in ('article', 'brand', 'trading_numbers')} for row in rows[:limit]]
+        return 200, {'items': items, 'next_cursor': next_cursor}
+    return await acached_json_response(request, 'get_article_crosses_page', {'after': page.after, 'limit': limit}, build)
+
+
+@api.get("/articles/changes", response={200: ArticleChangesOut, 400: ErrorOut, 401: ErrorOut}, auth=AsyncJWTAuth(), tags=["Articles and Crosses"])
+async def get_article_changes(request, params: Query[ChangesIn]):
+    """
+    Returns the articles created, updated and deleted since the `since` cursor,
+    plus the cursor to pass in the next call. Call again right away while
+    `has_more` is true. The cost is proportional to the number of changes,
+    not to the size of the catalog.
+    Requires JWT authentication.
+    """
+    limit = min(params.limit or settings.API_PAGE_SIZE, settings.API_MAX_PAGE_SIZE)
+    try:
+        return 200, await sync_to_async(get_changes)(params.since, limit)
+    except InvalidCursorError as e:
+        return 400, {"detail": str(e)}
+
+
+class _Echo:
+    """Pseudo-buffer for csv.writer that returns each written line instead of storing it."""
+    def write(self, value):
+        return value
+
+
+STREAM_FIELDS = ('article', 'brand', 'trading_numbers')
+
+
+def _stream_formatter(fmt):
+    """Returns the header line (None for NDJSON) and the function formatting one row dict."""
+    if fmt == 'csv':
+        writer = csv.writer(_Echo())
+        return writer.writerow(STREAM_FIELDS), lambda row: writer.writerow(row.values())
+    return None, lambda row: json.dumps(row, ensure_ascii=False) + '\n'
+
+
+def _stream_rows():
+    # values() rather than values_list(): only its iterator defers the query to the fetching thread
+    return Product.objects.order_by('id').values(*STREAM_FIELDS)
+
+
+def _stream_article_crosses(fmt):
+    header, format_row = _stream_formatter(fmt)
+    if header:
+        yield header
+    # .iterator() reads through a server-side cursor in chunks, so memory stays constant.
+    # Outside a transaction the cursor would be declared WITH HOLD, which PostgreSQL
+    # materializes whole as soon as the implicit transaction commits
+    with transaction.atomic():
+        for row in _stream_rows().iterator(chunk_size=settings.API_STREAM_CHUNK_SIZE):
+            yield format_row(row)
+
+
+async def _astream_article_crosses(fmt):
+    header, format_row = _stream_formatter(fmt)
+    if header:
+        yield header
+    # Same server-side cursor and transaction, each chunk fetched in the worker
+    # thread that holds the connection of the request
+    atomic = transaction.atomic()
+    await sync_to_async(atomic.__enter__)()
+    try:
+        async for row in _stream_rows().aiterator(chunk_size=settings.API_STREAM_CHUNK_SIZE):
+            yield format_row(row)
+    except BaseException as e:
+        await sync_to_async(atomic.__exit__)(type(e), e, e.__traceback__)
+        raise
+    await sync_to_async(atomic.__exit__)(None, None, None)
+
+
+@api.get("/get_article_crosses/stream", response={401: ErrorOut}, auth=AsyncJWTAuth(), tags=["Articles and Crosses"])
+async def get_article_crosses_stream(request, format: str = 'ndjson'):
+    """
+    Streams all articles, brands and crosses as NDJSON (default) or CSV (?format=csv).
+    Rows are read through a server-side cursor and written as they arrive,
+    so memory use does not depend on the size of the catalog.
+    Requires JWT authentication.
+    """
+    # Each server only streams iterators of its own kind; it would buffer the other kind whole
+    stream = _astream_article_crosses if isinstance(request, ASGIRequest) else _stream_article_crosses
+    if format == 'csv':
+        response = StreamingHttpResponse(stream('csv'), content_type='text/csv; charset=utf-8')
+        response['Content-Disposition'] = 'attachment; filename="article_crosses.csv"'
+    else:
+        response = StreamingHttpResponse(stream('ndjson'), content_type='application/x-ndjson')
+    return response
+
+
+@api.post("/add_article_crosses", response={201: ArticleCrossesOut, 400: ErrorOut, 401: ErrorOut, 409: ErrorOut}, auth=AsyncJWTAuth(), tags=["Articles and Crosses"])
+async def add_article_crosses(request, data: AddArticleCrossIn):
     """
     Adds a new article and its crosses.
     If the article already exists, it returns a 409 Conflict.
@@ -115,10 +454,21 @@ def add_article_crosses(request, data: AddArticleCrossIn):
     """
     # print(f"Authenticated user for POST /add_article_crosses: {request.auth.username}")
     
-    if Product.objects.filter(article=data.article).exists():
+    if await Product.objects.filter(article=data.article).aexists():
         return 409, {"detail": f"Article '{data.article}' already exists."}
 
     try:
+        product = await sync_to_async(_create_product)(data)
+        await abump_catalog_version()
+        return 201, product
+    except Exception as e:
+        logger.error(f"Error adding article cross: {e}", exc_info=True)
+        return 400, {"detail": f"Failed to add article: {e}"}
+
+
+def _create_product(data):
+    # Transactions are bound to one thread's connection, so the whole write runs in one sync call
+    with transaction.atomic():
         product = Product.objects.create(
             article=data.article,
             brand=data.brand,
@@ -129,14 +479,19 @@ def add_article_crosses(request, data: AddArticleCrossIn):
             specifications=data.specifications,
             # product_group is nullable, so we don't need to pass it if not provided
         )
-        return 201, product
-    except Exception as e:
-        logger.error(f"Error adding article cross: {e}", exc_info=True)
-        return 400, {"detail": f"Failed to add article: {e}"}
+        sync_product_crosses([(product.id, product.trading_numbers)])
+    return product
 
 
-@api.post("/update_article_crosses", response={200: ArticleCrossesOut, 400: ErrorOut, 401: ErrorOut, 404: ErrorOut}, auth=JWTAuth(), tags=["Articles and Crosses"])
-def update_article_crosses(request, data: UpdateArticleCrossIn):
+def _save_product(product, sync_crosses):
+    with transaction.atomic():
+        product.save()
+        if sync_crosses:
+            sync_product_crosses([(product.id, product.trading_numbers)])
+
+
+@api.post("/update_article_crosses", response={200: ArticleCrossesOut, 400: ErrorOut, 401: ErrorOut, 404: ErrorOut}, auth=AsyncJWTAuth(), tags=["Articles and Crosses"])
+async def update_article_crosses(request, data: UpdateArticleCrossIn):
     """
     Updates an existing article and its crosses.
     If the article does not exist, it returns a 404 Not Found.
@@ -144,7 +499,10 @@ def update_article_crosses(request, data: UpdateArticleCrossIn):
     """
     # print(f"Authenticated user for POST /update_article_crosses: {request.auth.username}")
 
-    product = get_object_or_404(Product, article=data.article)
+    try:
+        product = await Product.objects.aget(article=data.article)
+    except Product.DoesNotExist:
+        return 404, {"detail": "Not Found"}
 
     # Update fields only if they are provided in the request body (not None)
     if data.brand is not None:
@@ -159,10 +517,356 @@ def update_article_crosses(request, data: UpdateArticleCrossIn):
         product.product_status = data.product_status
     if data.specifications is not None:
         product.specifications = data.specifications
+    product.content_hash = None # The next import must write this product again
 
     try:
-        product.save()
+        await sync_to_async(_save_product)(product, data.trading_numbers is not None)
+        await abump_catalog_version()
         return 200, product
     except Exception as e:
         logger.error(f"Error updating article cross: {e}", exc_info=True)
         return 400, {"detail": f"Failed to update article: {e}"}
+
+
+@api.post("/articles/batch_get", response={200: ArticleBatchGetOut, 400: ErrorOut, 401: ErrorOut}, auth=AsyncJWTAuth(), tags=["Articles and Crosses"])
+async def batch_get_articles(request, data: ArticleBatchGetIn):
+    """
+    Returns up to settings.API_MAX_BATCH_ARTICLES articles with their brands and
+    crosses in one call, resolved with a single query against the unique index
+    on Product.article. Articles that do not exist are listed in `missing`.
+    Requires JWT authentication.
+    """
+    if len(data.articles) > settings.API_MAX_BATCH_ARTICLES:
+        return 400, {"detail": f"At most {settings.API_MAX_BATCH_ARTICLES} articles can be requested at once."}
+
+    requested = list(dict.fromkeys(data.articles)) # Drop repeats, keep the request order
+    products = {
+        product['article']: product
+        async for product in Product.objects.filter(article__in=requested).values('article', 'brand', 'trading_numbers')
+    }
+    return 200, {
+        'found': [products[article] for article in requested if article in products],
+        'missing': [article for article in requested if article not in products],
+    }
+
+
+@api.post("/articles/bulk_upsert", response={200: List[BulkUpsertItemOut], 400: ErrorOut, 401: ErrorOut}, auth=AsyncJWTAuth(), tags=["Articles and Crosses"])
+async def bulk_upsert_articles(request, data: BulkUpsertIn):
+    """
+    Adds and updates many articles in a single transaction.
+    Additions behave like /add_article_crosses (existing articles are conflicts),
+    updates like /update_article_crosses (only provided fields are written).
+    Writes are batched into one SQL statement per settings.API_BULK_CHUNK_SIZE items.
+    Returns a status per item. Requires JWT authentication.
+    """
+    if len(data.add) + len(data.update) > settings.API_MAX_BULK_ITEMS:
+        return 400, {"detail": f"At most {settings.API_MAX_BULK_ITEMS} items can be written at once."}
+    try:
+        results = await sync_to_async(bulk_upsert_products)(
+            [item.dict() for item in data.add],
+            [item.dict() for item in data.update],
+            settings.API_BULK_CHUNK_SIZE,
+        )
+        await abump_catalog_version()
+        return 200, results
+    except Exception as e:
+        logger.error(f"Error in bulk upsert: {e}", exc_info=True)
+        return 400, {"detail": f"Failed to write articles: {e}"}
+
+
+@api.get("/articles/{path:article}", response={200: ArticleCrossesOut, 304: None, 401: ErrorOut, 404: ErrorOut}, auth=AsyncJWTAuth(), tags=["Articles and Crosses"])
+async def get_article(request, article: str):
+    """
+    Returns one article with its brand and crosses, served from the response
+    cache until the next catalog write. Supports If-None-Match like /get_article_crosses.
+    Registered after the other /articles/... routes, which it would otherwise shadow.
+    Requires JWT authentication.
+    """
+    async def build():
+        product = await Product.objects.filter(article=article).values('article', 'brand', 'trading_numbers').afirst()
+        if product is None:
+            return 404, {"detail": f"Article '{article}' does not exist."}
+        return 200, product
+    return await acached_json_response(request, 'get_article', {'article': article}, build)
+
+
+async def _lookup_crosses(numbers):
+    """
+    Resolves cross numbers to the articles that list them, with one indexed
+    query on ProductCross.normalized_number for all numbers.
+    """
+    normalized = {number: normalize_cross_number(number) for number in numbers}
+    articles = defaultdict(list)
+    matches = (
+        ProductCross.objects.filter(normalized_number__in=set(normalized.values()) - {''})
+        .order_by('product__article')
+        .values('normalized_number', 'product__article', 'product__brand', 'product__trading_numbers')
+    )
+    async for match in matches:
+        articles[match['normalized_number']].append({
+            'article': match['product__article'],
+            'brand': match['product__brand'],
+            'trading_numbers': match['product__trading_numbers'],
+        })
+    return [
+        {'number': number, 'normalized_number': normalized_number, 'articles': articles[normalized_number]}
+        for number, normalized_number in normalized.items()
+    ]
+
+
+@api.get("/crosses/lookup", response={200: CrossLookupOut, 304: None, 401: ErrorOut}, auth=AsyncJWTAuth(), tags=["Articles and Crosses"])
+async def lookup_cross(request, number: str):
+    """
+    Returns the articles that cross to the given number.
+    Spaces, dashes, dots and letter case are ignored when matching.
+    Responses are cached until the next catalog write.
+    Requires JWT authentication.
+    """
+    async def build():
+        return 200, (await _lookup_crosses([number]))[0]
+    return await acached_json_response(request, 'lookup_cross', {'number': number}, build)
+
+
+@api.post("/crosses/lookup", response={200: List[CrossLookupOut], 400: ErrorOut, 401: ErrorOut}, auth=AsyncJWTAuth(), tags=["Articles and Crosses"])
+async def lookup_crosses_batch(request, data: CrossLookupBatchIn):
+    """
+    Batch variant of GET /crosses/lookup: resolves up to
+    settings.API_MAX_LOOKUP_NUMBERS numbers with a single query.
+    Requires JWT authentication.
+    """
+    if len(data.numbers) > settings.API_MAX_LOOKUP_NUMBERS:
+        return 400, {"detail": f"At most {settings.API_MAX_LOOKUP_NUMBERS} numbers can be looked up at once."}
+    return 200, await _lookup_crosses(data.numbers)
+
+
+@api.get("/groups/tree", response={200: List[GroupNodeOut], 304: None, 401: ErrorOut}, auth=AsyncJWTAuth(), tags=["Groups"])
+async def groups_tree(request):
+    """
+    Returns the whole product group tree, built from a single query and
+    cached until the next catalog write. Requires JWT authentication.
+    """
+    async def build():
+        return 200, await sync_to_async(get_group_tree)()
+    return await acached_json_response(request, 'groups_tree', {}, build)
+
+
+@api.get("/groups/{group_id}/products", response={200: ArticleCrossesPageOut, 401: ErrorOut, 404: ErrorOut}, auth=AsyncJWTAuth(), tags=["Groups"])
+async def group_products(request, group_id: int, page: Query[GroupProductsIn]):
+    """
+    Returns one keyset-paginated page of the products of a group, ordered by id.
+    With recursive=true, products of all subgroups are included, selected
+    through a prefix match on the indexed materialized group path.
+    Requires JWT authentication.
+    """
+    try:
+        group = await ProductGroup.objects.aget(id=group_id)
+    except ProductGroup.DoesNotExist:
+        return 404, {"detail": "Not Found"}
+    limit = min(page.limit or settings.API_PAGE_SIZE, settings.API_MAX_PAGE_SIZE)
+    return 200, await sync_to_async(get_group_products)(group, page.after, limit, recursive=page.recursive)
+
+
+@api.get("/products/search", response={200: ProductSearchOut, 400: ErrorOut, 401: ErrorOut}, auth=AsyncJWTAuth(), tags=["Search"])
+async def search(request, params: Query[ProductSearchIn]):
+    """
+    Searches products by the words of their additional name, description and
+    specifications (PostgreSQL full-text search, Russian stemming), and by fuzzy
+    match on article and brand (pg_trgm). Results are ranked by relevance and
+    paginated with a keyset cursor. Requires JWT authentication.
+    """
+    q = params.q.strip()
+    if not q:
+        return 400, {"detail": "The search text 'q' is empty."}
+    limit = min(params.limit or settings.API_PAGE_SIZE, settings.API_MAX_PAGE_SIZE)
+    try:
+        return 200, await sync_to_async(search_products)(q, limit, brand=params.brand, group_id=params.group_id, after=params.after)
+    except InvalidSearchCursorError as e:
+        return 400, {"detail": str(e)}
+
+
+@api.get("/products/filter", response={200: ProductFilterOut, 304: None, 400: ErrorOut, 401: ErrorOut}, auth=AsyncJWTAuth(), tags=["Search"])
+async def filter_by_attributes(request, params: Query[ProductFilterIn]):
+    """
+    Returns the products having the given specification attributes, e.g.
+    /products/filter?spec.Weight=1kg&spec.Color=red&brand=BOSCH. A repeated
+    attribute matches any of its values. The filters are JSONB containment
+    tests on the GIN-indexed spec_attributes column, evaluated by PostgreSQL.
+    With facets=true, the matching products are also counted per attribute
+    value in one aggregate query. Paginated with a keyset cursor on id and
+    cached until the next catalog write. Requires JWT authentication.
+    """
+    try:
+        spec_filters = parse_spec_filters(request.GET)
+    except InvalidSpecFilterError as e:
+        return 400, {"detail": str(e)}
+    limit = min(params.limit or settings.API_PAGE_SIZE, settings.API_MAX_PAGE_SIZE)
+
+    async def build():
+        return 200, await sync_to_async(filter_products)(
+            spec_filters, limit, brand=params.brand, group_id=params.group_id, after=params.after,
+            facets=params.facets, max_facet_values=settings.API_MAX_FACET_VALUES,
+        )
+    return await acached_json_response(
+        request, 'products_filter', {**params.dict(), 'limit': limit, 'spec': spec_filters}, build,
+    )
+
+
+@api.get("/import_status/{task_id}", response={200: ImportStatusOut, 401: ErrorOut}, auth=[AsyncJWTAuth(), async_django_auth], tags=["Imports"])
+async def import_status(request, task_id: str):
+    """
+    Returns the state and throttled progress of an Excel import.
+    Reads the Celery result backend, and the database only for results it no longer has.
+    Accepts JWT authentication or the session of the upload page.
+    """
+    # Celery's result API is synchronous
+    return 200, await sync_to_async(get_import_status)(task_id)
+
+
+def _upload_out(upload):
+    return {
+        'upload_id': str(upload.id),
+        'file_name': upload.file_name,
+        'size': upload.size,
+        'received': upload.received,
+        'chunk_size': settings.PRODUCT_UPLOAD_CHUNK_SIZE,
+    }
+
+
+@api.post("/uploads", response={201: UploadOut, 400: ErrorOut, 401: ErrorOut}, auth=[AsyncJWTAuth(), async_django_auth], tags=["Imports"])
+async def start_upload(request, data: UploadIn):
+    """
+    Starts a resumable upload of an Excel file for import, for files too large
+    to send in one request. Send the file in chunks with PUT /uploads/{upload_id},
+    then start the import with POST /uploads/{upload_id}/complete.
+    Accepts JWT authentication or the session of the upload page.
+    """
+    try:
+        upload = await sync_to_async(create_upload)(request.auth.id, data.file_name, data.size)
+    except UploadError as e:
+        return 400, {"detail": str(e)}
+    return 201, _upload_out(upload)
+
+
+@api.get("/uploads/{upload_id}", response={200: UploadOut, 401: ErrorOut, 404: ErrorOut}, auth=[AsyncJWTAuth(), async_django_auth], tags=["Imports"])
+async def get_upload(request, upload_id: uuid.UUID):
+    """
+    Returns the state of a resumable upload; `received` is where to resume.
+    """
+    try:
+        upload = await ProductUpload.objects.aget(id=upload_id, user_id=request.auth.id)
+    except ProductUpload.DoesNotExist:
+        return 404, {"detail": "Not Found"}
+    return 200, _upload_out(upload)
+
+
+@api.put("/uploads/{upload_id}", response={200: UploadOut, 400: ErrorOut, 401: ErrorOut, 404: ErrorOut, 409: UploadOffsetOut}, auth=[AsyncJWTAuth(), async_django_auth], tags=["Imports"])
+async def upload_chunk(request, upload_id: uuid.UUID, offset: int):
+    """
+    Appends the request body (application/octet-stream) to a resumable upload
+    at `offset`, which must be the `received` offset of the upload. The body is
+    written to the file as it is read, never held in memory as a whole.
+    """
+    length = request.META.get('CONTENT_LENGTH')
+    if not length:
+        return 400, {"detail": "Content-Length is required."}
+    try:
+        # File and database writes are synchronous
+        upload = await sync_to_async(append_chunk)(upload_id, request.auth.id, offset, request, int(length))
+    except ProductUpload.DoesNotExist:
+        return 404, {"detail": "Not Found"}
+    except UploadOffsetError as e:
+        return 409, {"detail": str(e), "received": e.received}
+    except UploadError as e:
+        return 400, {"detail": str(e)}
+    return 200, _upload_out(upload)
+
+
+@api.post("/uploads/{upload_id}/complete", response={202: UploadCompleteOut, 400: ErrorOut, 401: ErrorOut, 404: ErrorOut, 503: ErrorOut}, auth=[AsyncJWTAuth(), async_django_auth], tags=["Imports"])
+async def finish_upload(request, upload_id: uuid.UUID, data: UploadCompleteIn):
+    """
+    Checks the header row of a fully received upload and starts its import.
+    A file that cannot be imported is rejected with 400 and deleted. If the
+    import cannot be started right now, the answer is 503 and the call can be
+    repeated.
+    """
+    if data.engine is not None and data.engine not in IMPORT_ENGINES:
+        return 400, {"detail": f"Unknown engine '{data.engine}'."}
+    try:
+        result = await sync_to_async(complete_upload)(upload_id, request.auth.id, engine=data.engine)
+    except ProductUpload.DoesNotExist:
+        return 404, {"detail": "Not Found"}
+    except UploadUnavailableError as e:
+        return 503, {"detail": str(e)}
+    except (UploadError, InvalidExcelFileError) as e:
+        return 400, {"detail": str(e)}
+    return 202, {"task_id": result.id}
+
+
+@api.delete("/uploads/{upload_id}", response={204: None, 401: ErrorOut, 404: ErrorOut}, auth=[AsyncJWTAuth(), async_django_auth], tags=["Imports"])
+async def cancel_upload(request, upload_id: uuid.UUID):
+    """
+    Abandons a resumable upload and deletes what was received.
+    """
+    try:
+        upload = await ProductUpload.objects.aget(id=upload_id, user_id=request.auth.id)
+    except ProductUpload.DoesNotExist:
+        return 404, {"detail": "Not Found"}
+    await sync_to_async(discard_upload)(upload)
+    return 204, None
+
+@api.post("/exports", response={202: ExportStartOut, 400: ErrorOut, 401: ErrorOut}, auth=AsyncJWTAuth(), tags=["Exports"])
+async def start_export(request, data: ExportIn):
+    """
+    Starts a background export of the whole catalog as .xlsx or .csv, with the
+    headers of the Excel import, so the file can be edited and imported again.
+    Poll GET /exports/{task_id} for progress and the download URL.
+    Requires JWT authentication.
+    """
+    if data.format not in EXPORT_FORMATS:
+        return 400, {"detail": f"Unknown format '{data.format}', use one of: {', '.join(EXPORT_FORMATS)}."}
+    if data.format == EXPORT_XLSX:
+        try:
+            check_xlsx_size(await Product.objects.acount())
+        except ExportTooLargeError as e:
+            return 400, {"detail": str(e)}
+    # Sending the task goes through the synchronous Celery API
+    result = await sync_to_async(export_catalog.delay)(data.format)
+    return 202, {"task_id": result.id}
+
+
+@api.get("/exports/{task_id}", response={200: ExportStatusOut, 401: ErrorOut}, auth=AsyncJWTAuth(), tags=["Exports"])
+async def export_status(request, task_id: str):
+    """
+    Returns the state and throttled progress of a catalog export, and its
+    download URL once finished. Requires JWT authentication.
+    """
+    return 200, await sync_to_async(get_task_status)(task_id)
+
+@api.get("/cache/stats", response={200: CacheStatsOut, 401: ErrorOut}, auth=AsyncJWTAuth(), tags=["Cache"])
+async def cache_stats(request):
+    """
+    Returns the hit/miss counters of the API response cache, added up over all
+    processes through the metrics hash in Redis. Requires JWT authentication.
+    """
+    return 200, await sync_to_async(get_cache_stats)()
+
+
+@api.get("/db/stats", response={200: DbStatsOut, 401: ErrorOut}, auth=AsyncJWTAuth(), tags=["Database"])
+async def db_stats(request):
+    """
+    Returns how often database connections were opened or reused after a
+    health check, and how long that took on average, across all processes.
+    Requires JWT authentication.
+    """
+    return 200, await sync_to_async(get_db_stats)()
+
+
+@api.get("/metrics", include_in_schema=False)
+async def prometheus_metrics(request):
+    """
+    Serves the metrics of all processes in the Prometheus text format: requests,
+    latency and database queries per route, import stage timings, throughput
+    and errors, connection and cache counters. Not authenticated, for scrapers:
+    nginx refuses it from outside, so scrape the web service directly.
+    """
+    return HttpResponse(await sync_to_async(render_metrics)(), content_type=PROMETHEUS_CONTENT_TYPE)
@@ -4,3 +4,9 @@ from django.apps import AppConfig
 class MyappConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'myapp'
+
+    def ready(self):
+        # Connect the signal receivers that invalidate the API user status cache
+        from . import auth # noqa: F401
+        # Connect the receiver that records tombstones of deleted products
+        from . import changes # noqa: F401
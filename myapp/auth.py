@@ -0,0 +1,152 @@
+import threading
+import time
+import logging
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+from ninja.security import HttpBearer, SessionAuth # Import HttpBearer for JWT authentication
+from rest_framework_simplejwt.authentication import JWTAuthentication
+from rest_framework_simplejwt.models import TokenUser
+
+logger = logging.getLogger(__name__)
+
+# Shared validator: builds nothing per request, only checks signature and claims
+jwt_authentication = JWTAuthentication()
+
+
+class UserStatusCache:
+    """
+    Small in-process TTL cache of `is_active` per user id.
+
+    Lets the stateless auth mode reject deactivated users without a query on
+    auth_user for every API call. Entries are dropped explicitly when a user
+    is saved or deleted in this process; other processes notice the change
+    after at most `ttl` seconds.
+    """
+    def __init__(self, ttl):
+        self.ttl = ttl
+        self._entries = {}
+        self._lock = threading.Lock()
+
+    def _cached(self, user_id):
+        entry = self._entries.get(user_id)
+        if entry is not None and entry[1] > time.monotonic():
+            return entry[0]
+        return None
+
+    def _store(self, user_id, is_active):
+        with self._lock:
+            self._entries[user_id] = (is_active, time.monotonic() + self.ttl)
+        return is_active
+
+    def is_active(self, user_id):
+        # Token claims may carry the id as a string, so keys are always strings
+        user_id = str(user_id)
+        is_active = self._cached(user_id)
+        if is_active is not None:
+            return is_active
+        return self._store(user_id, bool(
+            get_user_model().objects.filter(pk=user_id).values_list('is_active', flat=True).first()
+        ))
+
+    async def ais_active(self, user_id):
+        """
+        Async variant of is_active(); the lookup on a miss uses the async ORM.
+        """
+        user_id = str(user_id)
+        is_active = self._cached(user_id)
+        if is_active is not None:
+            return is_active
+        return self._store(user_id, bool(
+            await get_user_model().objects.filter(pk=user_id).values_list('is_active', flat=True).afirst()
+        ))
+
+    def invalidate(self, user_id):
+        with self._lock:
+            self._entries.pop(str(user_id), None)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+user_status_cache = UserStatusCache(ttl=settings.API_USER_STATUS_CACHE_TTL)
+
+
+@receiver([post_save, post_delete], sender=settings.AUTH_USER_MODEL)
+def invalidate_user_status(sender, instance, **kwargs):
+    # A deactivated (or deleted) user must lose API access right away
+    user_status_cache.invalidate(instance.pk)
+
+
+# Custom authentication class for JWT using HttpBearer
+class JWTAuth(HttpBearer):
+    """
+    JWT bearer authentication for the Ninja API.
+
+    With settings.API_JWT_STATELESS (the default), the request principal is a
+    TokenUser built from the token claims, and only the user's active status is
+    checked, through user_status_cache. Otherwise the user row is fetched from
+    the database on every request.
+    """
+    def authenticate(self, request, token):
+        try:
+            # Validate the token using Simple JWT's built-in validation
+            # This will raise an exception if the token is invalid or expired
+            validated_token = jwt_authentication.get_validated_token(token)
+            if settings.API_JWT_STATELESS:
+                user = TokenUser(validated_token)
+                if not user_status_cache.is_active(user.id):
+                    return None
+            else:
+                user = jwt_authentication.get_user(validated_token)
+                if not (user and user.is_active):
+                    return None
+            request.auth_user = user # Attach user to request for potential use in endpoints
+            return user
+        except Exception as e:
+            logger.error(f"JWT authentication failed: {e}")
+            return None # Authentication failed
+
+
+class AsyncJWTAuth(JWTAuth):
+    """
+    JWTAuth for async endpoints. The token is checked on the event loop; only
+    the user lookups go to the database, through the async ORM or a worker thread.
+    """
+    is_async = True # Ninja awaits the result of __call__ (None without a bearer header)
+
+    async def authenticate(self, request, token):
+        try:
+            validated_token = jwt_authentication.get_validated_token(token)
+            if settings.API_JWT_STATELESS:
+                user = TokenUser(validated_token)
+                if not await user_status_cache.ais_active(user.id):
+                    return None
+            else:
+                user = await sync_to_async(jwt_authentication.get_user)(validated_token)
+                if not (user and user.is_active):
+                    return None
+            request.auth_user = user
+            return user
+        except Exception as e:
+            logger.error(f"JWT authentication failed: {e}")
+            return None
+
+
+class AsyncSessionAuth(SessionAuth):
+    """
+    Session authentication for async endpoints; loads request.user without
+    blocking the event loop.
+    """
+    is_async = True
+
+    async def authenticate(self, request, key):
+        user = await request.auser()
+        return user if user.is_authenticated else None
+
+
+async_django_auth = AsyncSessionAuth()
@@ -0,0 +1,165 @@
+import logging
+from collections import defaultdict
+
+from django.db import connection, transaction
+from psycopg2.extras import execute_values
+
+from .crosses import sync_product_crosses
+from .importers import PRODUCT_FIELDS
+from .models import Product
+
+logger = logging.getLogger(__name__)
+
+# Per-item statuses returned by bulk_upsert_products()
+STATUS_CREATED = 'created'
+STATUS_UPDATED = 'updated'
+STATUS_CONFLICT = 'conflict' # Article already exists (add), or repeated within the request
+STATUS_NOT_FOUND = 'not_found' # Article to update does not exist
+STATUS_INVALID = 'invalid' # Empty article or a value longer than its column allows
+
+
+def _validate(values):
+    """
+    Returns why `values` cannot be written, or None if they are valid.
+    """
+    if not values.get('article'):
+        return "'article' is missing or empty"
+    for field, value in values.items():
+        max_length = Product._meta.get_field(field).max_length
+        if max_length and value is not None and len(value) > max_length:
+            return f"'{field}' is longer than {max_length} characters"
+    return None
+
+
+def _chunks(items, size):
+    for start in range(0, len(items), size):
+        yield items[start:start + size]
+
+
+def _add_products(items, chunk_size):
+    """
+    Inserts new products with INSERT ... ON CONFLICT (article) DO NOTHING, one
+    statement per chunk. Items whose article already exists are conflicts.
+
+    Args:
+        items (list): (result, values) pairs; result dicts are updated in place.
+    """
+    qn = connection.ops.quote_name
+    columns = [Product._meta.get_field(field).column for field in PRODUCT_FIELDS]
+    sql = (
+        f"INSERT INTO {qn(Product._meta.db_table)} ({', '.join(qn(c) for c in columns)}) VALUES %s "
+        f"ON CONFLICT ({qn('article')}) DO NOTHING RETURNING id, {qn('article')}"
+    )
+    for chunk in _chunks(items, chunk_size):
+        with connection.cursor() as cursor:
+            created = dict((article, product_id) for product_id, article in execute_values(
+                cursor, sql, [tuple(values[field] or '' for field in PRODUCT_FIELDS) for _, values in chunk],
+                page_size=len(chunk), fetch=True,
+            ))
+        sync_product_crosses(
+            (created[values['article']], values['trading_numbers'] or '')
+            for _, values in chunk if values['article'] in created
+        )
+        for result, values in chunk:
+            if values['article'] in created:
+                result['status'] = STATUS_CREATED
+            else:
+                result['status'] = STATUS_CONFLICT
+                result['detail'] = f"Article '{values['article']}' already exists."
+
+
+def _update_products(items, chunk_size):
+    """
+    Updates existing products, writing only the fields each item provides.
+    Items are grouped by their set of provided fields, and every group is
+    written with one UPDATE ... FROM (VALUES ...) statement per chunk.
+
+    Args:
+        items (list): (result, values) pairs; values only hold the provided fields.
+    """
+    qn = connection.ops.quote_name
+    by_fields = defaultdict(list)
+    for result, values in items:
+        by_fields[tuple(field for field in PRODUCT_FIELDS if field in values)].append((result, values))
+
+    for fields, group_items in by_fields.items():
+        columns = [Product._meta.get_field(field).column for field in fields]
+        updated_columns = [column for column in columns if column != 'article']
+        if not updated_columns:
+            # Nothing to write: just report whether the articles exist
+            existing = set(Product.objects.filter(
+                article__in=[values['article'] for _, values in group_items]
+            ).values_list('article', flat=True))
+            for result, values in group_items:
+                if values['article'] in existing:
+                    result['status'] = STATUS_UPDATED
+                else:
+                    result['status'] = STATUS_NOT_FOUND
+                    result['detail'] = f"Article '{values['article']}' does not exist."
+            continue
+
+        sql = (
+            f"UPDATE {qn(Product._meta.db_table)} AS p SET "
+            + ', '.join(f"{qn(c)} = v.{qn(c)}" for c in updated_columns)
+            + f", {qn('updated_at')} = now(), {qn('content_hash')} = NULL"
+            + f" FROM (VALUES %s) AS v ({', '.join(qn(c) for c in columns)}) "
+            f"WHERE p.{qn('article')} = v.{qn('article')} "
+            f"RETURNING p.id, p.{qn('article')}, p.{qn('trading_numbers')}"
+        )
+        for chunk in _chunks(group_items, chunk_size):
+            with connection.cursor() as cursor:
+                updated = {article: (product_id, trading_numbers) for product_id, article, trading_numbers in execute_values(
+                    cursor, sql, [tuple(values[field] for field in fields) for _, values in chunk],
+                    page_size=len(chunk), fetch=True,
+                )}
+            if 'trading_numbers' in fields:
+                sync_product_crosses(updated.values())
+            for result, values in chunk:
+                if values['article'] in updated:
+                    result['status'] = STATUS_UPDATED
+                else:
+                    result['status'] = STATUS_NOT_FOUND
+                    result['detail'] = f"Article '{values['article']}' does not exist."
+
+
+def bulk_upsert_products(add_items, update_items, chunk_size):
+    """
+    Applies many article additions and partial updates in one transaction.
+
+    Additions are inserted with one INSERT ... ON CONFLICT DO NOTHING statement
+    per chunk; updates only write the fields that were provided (None means
+    "not provided"), with one UPDATE statement per chunk and field set.
+    Additions are applied before updates.
+
+    Args:
+        add_items (list): Dicts of Product fields for new articles.
+        update_items (list): Dicts of Product fields to update; None values are skipped.
+        chunk_size (int): Items per SQL statement.
+
+    Returns:
+        list: One result dict (op, index, article, status, detail) per item,
+            additions first, in request order.
+    """
+    results = []
+    valid = {'add': [], 'update': []}
+    for op, items in (('add', add_items), ('update', update_items)):
+        seen = set()
+        for index, values in enumerate(items):
+            if op == 'update':
+                values = {field: value for field, value in values.items() if value is not None}
+            result = {'op': op, 'index': index, 'article': values.get('article') or '', 'status': None, 'detail': None}
+            results.append(result)
+            error = _validate(values)
+            if error:
+                result['status'], result['detail'] = STATUS_INVALID, error
+            elif values['article'] in seen:
+                result['status'] = STATUS_CONFLICT
+                result['detail'] = f"Article '{values['article']}' is repeated in the request."
+            else:
+                seen.add(values['article'])
+                valid[op].append((result, values))
+
+    with transaction.atomic():
+        _add_products(valid['add'], chunk_size)
+        _update_products(valid['update'], chunk_size)
+    return results
@@ -0,0 +1,121 @@
+import hashlib
+import json
+import logging
+
+from django.conf import settings
+from django.core.cache import cache
+from django.http import HttpResponse, HttpResponseNotModified
+
+from .metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+# Catalog version counter; every cached API response is keyed by it, so bumping
+# it makes all cached entries stale at once without deleting anything
+CATALOG_VERSION_KEY = 'catalog:version'
+
+
+def get_catalog_version():
+    version = cache.get(CATALOG_VERSION_KEY)
+    if version is None:
+        cache.add(CATALOG_VERSION_KEY, 1, timeout=None)
+        version = cache.get(CATALOG_VERSION_KEY, 1)
+    return version
+
+
+async def aget_catalog_version():
+    version = await cache.aget(CATALOG_VERSION_KEY)
+    if version is None:
+        await cache.aadd(CATALOG_VERSION_KEY, 1, timeout=None)
+        version = await cache.aget(CATALOG_VERSION_KEY, 1)
+    return version
+
+
+def bump_catalog_version():
+    """
+    Invalidates every cached catalog response. Called after each committed write.
+    """
+    try:
+        cache.add(CATALOG_VERSION_KEY, 1, timeout=None)
+        return cache.incr(CATALOG_VERSION_KEY)
+    except Exception as e:
+        # Cached entries expire after API_CACHE_TTL anyway
+        logger.warning(f"Failed to bump the catalog version: {e}")
+
+
+async def abump_catalog_version():
+    try:
+        await cache.aadd(CATALOG_VERSION_KEY, 1, timeout=None)
+        return await cache.aincr(CATALOG_VERSION_KEY)
+    except Exception as e:
+        logger.warning(f"Failed to bump the catalog version: {e}")
+
+
+def get_cache_stats():
+    # Hits and misses are counted in memory by each process, see metrics.MetricsRegistry
+    totals = metrics.totals()
+    hits, misses = (int(totals.get(series, 0)) for series in ('api_cache_hits_total', 'api_cache_misses_total'))
+    return {
+        'catalog_version': get_catalog_version(),
+        'hits': hits,
+        'misses': misses,
+        'hit_ratio': round(hits / (hits + misses), 4) if hits + misses else None,
+    }
+
+
+async def acached_json_response(request, name, params, build):
+    """
+    Serves a JSON API response from the cache, building it on a miss.
+
+    The cache key and the ETag are derived from the endpoint name, its
+    parameters and the catalog version, so a client sending a matching
+    If-None-Match gets a 304 without the response being loaded at all.
+    The cache is read through Django's async cache API. Cache errors are
+    logged and the response is built from the database, as on a miss. Hits
+    and misses are counted in memory, through metrics.
+
+    Args:
+        request (HttpRequest): The current request.
+        name (str): Endpoint name, part of the cache key.
+        params (dict): JSON-serializable parameters the response depends on.
+        build (coroutine function): Returns (status, data) for the response.
+
+    Returns:
+        HttpResponse: The JSON response, or HttpResponseNotModified.
+    """
+    try:
+        version = await aget_catalog_version()
+    except Exception as e:
+        logger.warning(f"Response cache unavailable: {e}")
+        status, data = await build()
+        return HttpResponse(json.dumps(data), status=status, content_type='application/json')
+
+    digest = hashlib.sha1(json.dumps(params, sort_keys=True).encode()).hexdigest()
+    key = f"api:{name}:{version}:{digest}"
+    etag = f'"{version}-{digest[:16]}"'
+
+    if etag in request.headers.get('If-None-Match', ''):
+        metrics.inc('api_cache_hits_total')
+        return HttpResponseNotModified(headers={'ETag': etag})
+
+    try:
+        cached = await cache.aget(key)
+    except Exception as e:
+        logger.warning(f"Failed to read cached response {key}: {e}")
+        cached = None
+    if cached is not None:
+        metrics.inc('api_cache_hits_total')
+        status, body = cached
+    else:
+        metrics.inc('api_cache_misses_total')
+        status, data = await build()
+        body = json.dumps(data)
+        try:
+            await cache.aset(key, (status, body), timeout=settings.API_CACHE_TTL)
+        except Exception as e:
+            logger.warning(f"Failed to cache response {key}: {e}")
+
+    response = HttpResponse(body, status=status, content_type='application/json')
+    if status == 200:
+        response['ETag'] = etag
+    return response
@@ -0,0 +1,132 @@
+from datetime import datetime, timedelta, timezone
+
+from django.conf import settings
+from django.db import connection
+from django.db.models import Q
+from django.db.models.signals import post_delete
+from django.dispatch import receiver
+
+from .models import Product, ProductTombstone
+
+
+class InvalidCursorError(ValueError):
+    pass
+
+
+@receiver(post_delete, sender=Product)
+def record_product_tombstone(sender, instance, **kwargs):
+    # Queryset deletes send post_delete per product too
+    ProductTombstone.objects.create(product_id=instance.pk, article=instance.article)
+
+
+def get_product_deletions():
+    """
+    Returns how many DELETE or TRUNCATE statements ran on the product table,
+    as counted by a statement trigger (migration 0011). Unlike tombstones, it
+    covers raw SQL deletes too, and it is read without scanning the table.
+    """
+    with connection.cursor() as cursor:
+        # last_value is 1 both before and after the first nextval()
+        cursor.execute("SELECT last_value - 1 + is_called::int FROM myapp_product_deletions")
+        return cursor.fetchone()[0]
+
+
+def encode_cursor(timestamp, product_id):
+    """
+    Returns the opaque `since` cursor for a position in (updated_at, id) order.
+    """
+    micros = (timestamp - datetime(1970, 1, 1, tzinfo=timezone.utc)) // timedelta(microseconds=1)
+    return f"{micros}-{product_id}"
+
+
+def decode_cursor(cursor):
+    """
+    Parses a cursor from encode_cursor(); an empty cursor means "from the beginning".
+
+    Raises:
+        InvalidCursorError: If the cursor is malformed.
+    """
+    if not cursor:
+        return datetime.min.replace(tzinfo=timezone.utc), 0
+    try:
+        micros, product_id = (int(part) for part in cursor.split('-'))
+        return datetime(1970, 1, 1, tzinfo=timezone.utc) + timedelta(microseconds=micros), product_id
+    except (ValueError, OverflowError):
+        raise InvalidCursorError(f"Invalid cursor '{cursor}'.")
+
+
+def _watermark():
+    """
+    Returns the time before which no more changes can appear.
+
+    updated_at is set when a row is written, but the row only becomes visible
+    when its transaction commits, possibly much later (a COPY merge runs in one
+    long transaction). Changes are therefore only returned up to the start of
+    the oldest transaction that is still writing, and at least
+    settings.API_CHANGES_LAG_SECONDS in the past to absorb clock skew between
+    the application and the database.
+    """
+    with connection.cursor() as cursor:
+        cursor.execute(
+            "SELECT LEAST(now() - make_interval(secs => %s), ("
+            "SELECT min(xact_start) FROM pg_stat_activity "
+            "WHERE backend_xid IS NOT NULL AND pid <> pg_backend_pid()))",
+            [settings.API_CHANGES_LAG_SECONDS],
+        )
+        return cursor.fetchone()[0]
+
+
+def get_changes(since, limit):
+    """
+    Returns the products changed and deleted after the `since` cursor.
+
+    Products are read in (updated_at, id) order through the matching index, so
+    the cost depends on the number of changes, not on the size of the catalog.
+    Tombstones are returned for the same time window as the products of the page,
+    so clients can apply the deletions of a page first, then its changes.
+
+    Args:
+        since (str): Cursor from a previous call; empty for a full sync.
+        limit (int): Maximum number of changed products.
+
+    Returns:
+        dict: 'changed', 'deleted', 'next_cursor' and 'has_more'.
+    """
+    since_at, since_id = decode_cursor(since)
+    watermark = _watermark()
+    rows = list(
+        Product.objects
+        # The plain range on updated_at keeps the OR condition within an index range scan
+        .filter(updated_at__gte=since_at, updated_at__lt=watermark)
+        .filter(Q(updated_at__gt=since_at) | Q(id__gt=since_id))
+        .order_by('updated_at', 'id')
+        .values('id', 'article', 'brand', 'trading_numbers', 'updated_at')[:limit + 1]
+    )
+    has_more = len(rows) > limit
+    rows = rows[:limit]
+    if has_more:
+        # Continue right after the last product of this page
+        next_cursor = encode_cursor(rows[-1]['updated_at'], rows[-1]['id'])
+        until = rows[-1]['updated_at']
+    else:
+        next_cursor = encode_cursor(watermark, 0)
+        until = watermark
+    deleted = []
+    if since: # A full sync has nothing to delete
+        # Consecutive pages cover consecutive [since, until) windows, so every tombstone is returned once
+        changed_at = {row['article']: row['updated_at'] for row in rows}
+        deleted = [
+            tombstone for tombstone in
+            ProductTombstone.objects.filter(deleted_at__gte=since_at, deleted_at__lt=until)
+            .order_by('deleted_at', 'id').values('article', 'deleted_at')
+            # Skip deletions already superseded by a re-created product in this page
+            if not changed_at.get(tombstone['article'], tombstone['deleted_at']) > tombstone['deleted_at']
+        ]
+    return {
+        'changed': [
+            {key: row[key] for key in ('article', 'brand', 'trading_numbers', 'updated_at')} for row in rows
+        ],
+        'deleted': deleted,
+        'next_cursor': next_cursor,
+        'has_more': has_more,
+    }
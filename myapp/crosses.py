@@ -0,0 +1,52 @@
+import re
+
+from django.db import transaction
+
+from .models import ProductCross
+
+# Characters ignored when comparing cross numbers: whitespace, dashes and dots
+_IGNORED_CHARS = re.compile(r'[\s.\-]+')
+
+
+def normalize_cross_number(number):
+    """
+    Returns the canonical form of a cross number used for indexed lookups:
+    uppercase, without spaces, dashes and dots ("hu 711/51-x" -> "HU711/51X").
+    """
+    return _IGNORED_CHARS.sub('', number).upper()
+
+
+def split_trading_numbers(trading_numbers):
+    """
+    Splits the comma-separated Product.trading_numbers text into
+    (number, normalized_number) pairs, skipping empty entries and
+    entries that normalize to the same value.
+    """
+    pairs = {}
+    for number in (trading_numbers or '').split(','):
+        number = number.strip()
+        normalized = normalize_cross_number(number)
+        if normalized and normalized not in pairs:
+            pairs[normalized] = number
+    return [(number, normalized) for normalized, number in pairs.items()]
+
+
+def sync_product_crosses(products):
+    """
+    Replaces the ProductCross rows of the given products with the crosses
+    parsed from their trading numbers: one DELETE and one bulk INSERT.
+
+    Args:
+        products (iterable): (product_id, trading_numbers) pairs.
+    """
+    products = list(products)
+    if not products:
+        return
+    crosses = [
+        ProductCross(product_id=product_id, number=number, normalized_number=normalized)
+        for product_id, trading_numbers in products
+        for number, normalized in split_trading_numbers(trading_numbers)
+    ]
+    with transaction.atomic():
+        ProductCross.objects.filter(product_id__in=[product_id for product_id, _ in products]).delete()
+        ProductCross.objects.bulk_create(crosses)
@@ -0,0 +1,28 @@
+import time
+
+from django.db.backends.postgresql import base
+
+from myapp.dbstats import record_connect, record_health_check
+from myapp.metrics import record_query
+
+
+class DatabaseWrapper(base.DatabaseWrapper):
+    """
+    PostgreSQL backend that times connection acquisition: opening a new
+    connection, or the health check of a persistent one before its reuse.
+    The queries of HTTP requests are counted and timed for the metrics.
+    """
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.execute_wrappers.append(record_query)
+
+    def connect(self):
+        started = time.perf_counter()
+        super().connect()
+        record_connect(time.perf_counter() - started)
+
+    def is_usable(self):
+        started = time.perf_counter()
+        usable = super().is_usable()
+        record_health_check(time.perf_counter() - started, usable)
+        return usable
@@ -0,0 +1,52 @@
+import logging
+
+from django.conf import settings
+
+from .metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+# Metric series of connection acquisition, see metrics.METRICS
+CONNECT_SERIES = ('db_connections_opened_total', 'db_connect_seconds_total')
+HEALTH_CHECK_SERIES = ('db_health_checks_total', 'db_health_check_seconds_total', 'db_health_check_failures_total')
+
+
+def record_connect(seconds):
+    """
+    Counts a new database connection and the time it took to open. Like all
+    metrics, this only updates memory; see metrics.MetricsRegistry.
+    """
+    if seconds * 1000 >= settings.DB_SLOW_CONNECT_MS:
+        logger.warning(f"Opening a database connection took {seconds * 1000:.1f} ms")
+    metrics.inc('db_connections_opened_total')
+    metrics.inc('db_connect_seconds_total', seconds)
+
+
+def record_health_check(seconds, usable):
+    """Counts a health check of a persistent connection, and its failure."""
+    metrics.inc('db_health_checks_total')
+    metrics.inc('db_health_check_seconds_total', seconds)
+    if not usable:
+        metrics.inc('db_health_check_failures_total')
+
+
+def get_db_stats():
+    """
+    Returns the connection settings and acquisition counters of all processes.
+    Other processes add their counts at most every settings.METRICS_FLUSH_INTERVAL
+    seconds.
+    """
+    totals = metrics.totals()
+    connects, connect_seconds, health_checks, health_check_seconds, health_check_failures = (
+        totals.get(series, 0) for series in CONNECT_SERIES + HEALTH_CHECK_SERIES
+    )
+    database = settings.DATABASES['default']
+    return {
+        'conn_max_age': database.get('CONN_MAX_AGE', 0),
+        'health_checks_enabled': database.get('CONN_HEALTH_CHECKS', False),
+        'connects': int(connects),
+        'avg_connect_ms': round(connect_seconds / connects * 1000, 3) if connects else None,
+        'health_checks': int(health_checks),
+        'avg_health_check_ms': round(health_check_seconds / health_checks * 1000, 3) if health_checks else None,
+        'health_check_failures': int(health_check_failures),
+    }
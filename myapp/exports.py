@@ -0,0 +1,179 @@
+import csv
+import logging
+import os
+import time
+from datetime import timedelta
+from uuid import uuid4
+
+import openpyxl
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+from openpyxl.cell import WriteOnlyCell
+from openpyxl.cell.cell import ILLEGAL_CHARACTERS_RE
+
+from .importers import COLUMN_MAPPING
+from .models import Product
+
+logger = logging.getLogger(__name__)
+
+EXPORT_XLSX = 'xlsx'
+EXPORT_CSV = 'csv'
+EXPORT_FORMATS = (EXPORT_XLSX, EXPORT_CSV)
+
+# Columns of an export: the headers the importers expect, so an exported file can
+# be imported again as is. Query paths of the Product fields, in the same order.
+EXPORT_HEADERS = [title.capitalize() for title in COLUMN_MAPPING]
+EXPORT_FIELDS = [
+    'product_group__name' if field == 'product_group_name' else field
+    for field in COLUMN_MAPPING.values()
+]
+
+# Rows of an Excel sheet, the header row included
+XLSX_MAX_ROWS = 1048576
+
+
+class ExportTooLargeError(ValueError):
+    """Raised when the rows of an export do not fit in an .xlsx sheet."""
+
+
+def export_url(file_path):
+    """Returns the URL under which nginx serves an export from MEDIA_ROOT."""
+    return settings.MEDIA_URL + os.path.relpath(file_path, settings.MEDIA_ROOT).replace(os.sep, '/')
+
+
+def delete_expired_exports():
+    """
+    Deletes the exports, and the rejects files of imports, older than
+    settings.PRODUCT_EXPORT_EXPIRY_HOURS.
+    """
+    if not os.path.isdir(settings.PRODUCT_EXPORT_DIR):
+        return
+    cutoff = (timezone.now() - timedelta(hours=settings.PRODUCT_EXPORT_EXPIRY_HOURS)).timestamp()
+    for entry in os.scandir(settings.PRODUCT_EXPORT_DIR):
+        if entry.is_file() and entry.stat().st_mtime < cutoff:
+            os.remove(entry.path)
+            logger.info(f"Deleted expired export {entry.name}")
+
+
+def _xlsx_value(sheet, value):
+    if not isinstance(value, str):
+        return value
+    # Control characters are not allowed in the sheet XML; openpyxl raises on them
+    value = ILLEGAL_CHARACTERS_RE.sub('', value)
+    if value.startswith('='):
+        # openpyxl would write a formula, evaluated when the file is opened
+        cell = WriteOnlyCell(sheet, value)
+        cell.data_type = 's'
+        return cell
+    return value
+
+
+def _write_xlsx(file_path, rows):
+    # write_only: every row is serialized to the sheet XML as it is appended
+    workbook = openpyxl.Workbook(write_only=True)
+    sheet = workbook.create_sheet()
+    sheet.append(EXPORT_HEADERS)
+    too_large = False
+    for row_number, row in enumerate(rows, start=2):
+        # Excel would drop the rows past the end of the sheet, and so would a re-import
+        if row_number > XLSX_MAX_ROWS:
+            too_large = True
+            break
+        sheet.append([_xlsx_value(sheet, value) for value in row])
+    # Saved either way: an unsaved write-only workbook leaves its temporary file behind
+    workbook.save(file_path)
+    if too_large:
+        raise ExportTooLargeError(f"More than {XLSX_MAX_ROWS - 1} rows do not fit in an .xlsx sheet, use CSV.")
+
+
+def _write_csv(file_path, rows):
+    # The BOM makes Excel read the file as UTF-8
+    with open(file_path, 'w', newline='', encoding='utf-8-sig') as f:
+        writer = csv.writer(f)
+        writer.writerow(EXPORT_HEADERS)
+        writer.writerows(rows)
+
+
+def write_catalog_file(file_path, file_format, rows):
+    """
+    Writes rows of EXPORT_FIELDS values, under the EXPORT_HEADERS, to an .xlsx
+    or .csv file as they are consumed. Values starting with '=' are written to
+    .xlsx files as text, never as formulas.
+
+    Raises:
+        ExportTooLargeError: If the rows do not fit in an .xlsx sheet.
+    """
+    write = _write_xlsx if file_format == EXPORT_XLSX else _write_csv
+    write(file_path, rows)
+
+
+def check_xlsx_size(row_count):
+    """
+    Raises ExportTooLargeError if `row_count` data rows do not fit in an .xlsx sheet.
+    """
+    if row_count > XLSX_MAX_ROWS - 1:
+        raise ExportTooLargeError(
+            f"{row_count} rows do not fit in an .xlsx sheet (at most {XLSX_MAX_ROWS - 1}), use CSV."
+        )
+
+
+def export_products(file_format, progress=None, chunk_size=None):
+    """
+    Writes the whole catalog to a new file under settings.PRODUCT_EXPORT_DIR,
+    in the column layout of the Excel import.
+
+    Products are read in id order, joined with their group, through a server-side
+    cursor fetching `chunk_size` rows at a time, and every row is written as soon
+    as it is fetched, so memory use does not depend on the size of the catalog.
+    The cursor runs in a transaction: the export is a consistent snapshot, and
+    PostgreSQL does not materialize the result as it would for a cursor held
+    across commits. The file only gets its final name once complete.
+
+    Args:
+        file_format (str): 'xlsx' or 'csv'.
+        progress (ProgressReporter): Advanced by one per exported product.
+        chunk_size (int): Rows per fetch; defaults to settings.PRODUCT_EXPORT_CHUNK_SIZE.
+
+    Returns:
+        dict: 'file_name', 'url', 'format', 'rows', 'size' (bytes) and 'duration' (seconds).
+
+    Raises:
+        ExportTooLargeError: If an .xlsx export would have more rows than a sheet holds.
+    """
+    started_at = time.monotonic()
+    os.makedirs(settings.PRODUCT_EXPORT_DIR, exist_ok=True)
+    file_name = f"catalog_{timezone.localtime():%Y%m%d_%H%M%S}_{uuid4().hex[:8]}.{file_format}"
+    file_path = os.path.join(settings.PRODUCT_EXPORT_DIR, file_name)
+    partial_path = file_path + '.part'
+
+    exported = 0
+
+    def rows():
+        nonlocal exported
+        products = Product.objects.order_by('id').values_list(*EXPORT_FIELDS)
+        for row in products.iterator(chunk_size=chunk_size or settings.PRODUCT_EXPORT_CHUNK_SIZE):
+            yield ['' if value is None else value for value in row]
+            exported += 1
+            if progress is not None:
+                progress.advance(1)
+
+    try:
+        with transaction.atomic():
+            # Checked up front rather than after writing a million rows
+            if file_format == EXPORT_XLSX:
+                check_xlsx_size(Product.objects.count())
+            write_catalog_file(partial_path, file_format, rows())
+        os.replace(partial_path, file_path)
+    finally:
+        if os.path.exists(partial_path):
+            os.remove(partial_path)
+
+    return {
+        'file_name': file_name,
+        'url': export_url(file_path),
+        'format': file_format,
+        'rows': exported,
+        'size': os.path.getsize(file_path),
+        'duration': round(time.monotonic() - started_at, 3),
+    }
@@ -1,12 +1,27 @@
 from django import forms
+from django.conf import settings
 from django.contrib.auth.forms import UserCreationForm, AuthenticationForm
 from django.contrib.auth.models import User
+from .importers import ENGINE_BULK, ENGINE_COPY
 
 class ExcelUploadForm(forms.Form):
     excel_file = forms.FileField(
         label='Select an Excel file',
         help_text='Only .xlsx files with a single sheet are supported.'
     )
+    engine = forms.ChoiceField(
+        label='Import engine',
+        choices=[
+            (ENGINE_BULK, 'Batched upsert'),
+            (ENGINE_COPY, 'PostgreSQL COPY (very large files)'),
+        ],
+        required=False,
+        help_text='Leave the default unless the file has millions of rows.'
+    )
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.fields['engine'].initial = settings.PRODUCT_IMPORT_ENGINE
 
 class UserRegistrationForm(UserCreationForm):
     """
@@ -0,0 +1,82 @@
+from django.db import connection
+
+from .models import Product, ProductGroup
+
+# Recomputes every materialized path from parent_id in one statement. Groups whose
+# parent does not exist are roots; groups on a parent_id cycle (unreachable from
+# any root) become roots too. Only rows whose path changes are written.
+REFRESH_GROUP_PATHS_SQL = """
+    WITH RECURSIVE tree (id, path) AS (
+        SELECT g.id, '/' || g.id || '/' FROM myapp_productgroup g
+        WHERE g.parent_id IS NULL
+            OR NOT EXISTS (SELECT 1 FROM myapp_productgroup p WHERE p.id = g.parent_id)
+        UNION ALL
+        SELECT g.id, t.path || g.id || '/' FROM myapp_productgroup g JOIN tree t ON g.parent_id = t.id
+    ), paths AS (
+        SELECT g.id, COALESCE(t.path, '/' || g.id || '/') AS path
+        FROM myapp_productgroup g LEFT JOIN tree t ON t.id = g.id
+    )
+    UPDATE myapp_productgroup g SET path = paths.path FROM paths
+    WHERE g.id = paths.id AND g.path IS DISTINCT FROM paths.path
+"""
+
+
+def refresh_group_paths():
+    """
+    Brings ProductGroup.path up to date after groups were created or re-parented.
+
+    Returns:
+        int: Number of groups whose path changed.
+    """
+    with connection.cursor() as cursor:
+        cursor.execute(REFRESH_GROUP_PATHS_SQL)
+        return cursor.rowcount
+
+
+def get_group_tree():
+    """
+    Returns all product groups as a nested tree, read with a single query.
+
+    Returns:
+        list: Root group dicts (id, name, children), children sorted by name.
+    """
+    nodes = {}
+    roots = []
+    groups = list(ProductGroup.objects.order_by('name').values('id', 'name', 'path'))
+    # Visiting groups by depth adds every parent before its children (the sort is stable)
+    groups.sort(key=lambda group: (group['path'] or '').count('/'))
+    for group in groups:
+        node = nodes[group['id']] = {'id': group['id'], 'name': group['name'], 'children': []}
+        parent_ids = (group['path'] or '').strip('/').split('/')
+        parent = nodes.get(int(parent_ids[-2])) if len(parent_ids) > 1 else None
+        (parent['children'] if parent else roots).append(node)
+    return roots
+
+
+def get_group_products(group, after, limit, recursive=False):
+    """
+    Returns one keyset-paginated page of the products of a group.
+
+    With `recursive`, the products of all its subgroups are included, matched
+    with one prefix condition on the indexed materialized path.
+
+    Args:
+        group (ProductGroup): The group.
+        after (int): Id of the last product of the previous page.
+        limit (int): Page size.
+        recursive (bool): Include the products of all subgroups.
+
+    Returns:
+        dict: 'items' and 'next_cursor' (None on the last page).
+    """
+    if recursive and group.path:
+        products = Product.objects.filter(product_group__path__startswith=group.path)
+    else:
+        products = Product.objects.filter(product_group_id=group.id)
+    # Fetch one extra row to know whether there is a next page
+    rows = list(
+        products.filter(id__gt=after).order_by('id')
+        .values('id', 'article', 'brand', 'trading_numbers')[:limit + 1]
+    )
+    next_cursor = rows[limit - 1]['id'] if len(rows) > limit else None
+    return {'items': rows[:limit], 'next_cursor': next_cursor}
@@ -0,0 +1,1084 @@
+import csv
+import hashlib
+import logging
+import os
+import posixpath
+import re
+import time
+import uuid
+import zipfile
+from collections import namedtuple
+from contextlib import contextmanager
+from itertools import repeat
+from xml.etree.ElementTree import ParseError, iterparse
+
+import openpyxl
+from django.conf import settings
+from django.db import connection, transaction
+from psycopg2.extras import execute_values
+
+from .crosses import split_trading_numbers, sync_product_crosses
+from .groups import refresh_group_paths
+from .models import Product, ProductCross, ProductGroup
+
+logger = logging.getLogger(__name__)
+
+# Mapping from expected Excel column headers (in Russian, case-insensitive)
+# to Django model field names.
+COLUMN_MAPPING = {
+    'бренд': 'brand',
+    'уникальный артикул': 'article',
+    'торговые номера': 'trading_numbers',
+    'описание': 'description',
+    'дополнительное описание': 'additional_name',
+    'товарная группа': 'product_group_name', # Custom key for FK handling
+    'статус изделия': 'product_status',
+    'характеристики': 'specifications',
+}
+
+# Product columns written by the importers, in the order used for SQL statements
+PRODUCT_FIELDS = (
+    'article',
+    'brand',
+    'trading_numbers',
+    'description',
+    'additional_name',
+    'product_status',
+    'specifications',
+)
+
+# A normalized spreadsheet row. Columns missing from the file are None,
+# which means "not provided": they are left untouched on existing products.
+ProductRow = namedtuple('ProductRow', ('row_number',) + PRODUCT_FIELDS + ('product_group_name',))
+
+# Stages of an import timed by ImportReport: reading the sheet XML, normalizing and
+# validating rows, resolving product groups, and writing products
+IMPORT_STAGES = ('parse', 'normalize', 'groups', 'write')
+
+# Columns of the rejects file written next to an import report
+REJECTS_HEADER = ('row', 'article', 'reason')
+
+# Joins the cross numbers of a row in the COPY staging table (ASCII unit separator)
+CROSS_SEPARATOR = '\x1f'
+
+# PostgreSQL advisory lock key taken while creating product groups
+GROUP_CREATION_LOCK_ID = 0x6d7961707067
+
+# Upper bound on the number of per-row errors kept in the task result
+MAX_REPORTED_ERRORS = 1000
+
+# Available import engines: batched INSERT ... ON CONFLICT statements,
+# or COPY into an UNLOGGED staging table followed by one set-based merge
+ENGINE_BULK = 'bulk'
+ENGINE_COPY = 'copy'
+IMPORT_ENGINES = (ENGINE_BULK, ENGINE_COPY)
+
+
+def count_excel_rows(file_path):
+    """
+    Returns the number of data rows of the first sheet according to its stored
+    dimensions, without parsing the rows. Files without them, such as those
+    written by openpyxl in write-only mode (exports, generate_catalog), are
+    scanned for their last row instead. Either count may include blank rows.
+
+    Raises:
+        InvalidExcelFileError: If the file is not an .xlsx workbook.
+    """
+    max_row = read_sheet_head(file_path).max_row or _scan_last_row(file_path)
+    return max_row - 1 if max_row else None
+
+
+class ImportReport:
+    """
+    Accumulates counters and the per-row error report of a single import run.
+    Every failed, superseded or truncated row is also written to a CSV rejects
+    file at `rejects_path` (row, article, reason), created with the first one.
+    Unlike `errors`, the rejects file is not capped.
+    """
+    def __init__(self, rejects_path=None):
+        self.started_at = time.monotonic()
+        self.total_rows = 0
+        self.created = 0
+        self.updated = 0
+        self.failed = 0
+        self.duplicates = 0
+        self.unchanged = 0 # Rows identical to the stored product, not written
+        self.truncated = 0 # Values cut to the length of their column
+        self.completed = False # Set once the whole file (or row range) was processed
+        self.errors = []
+        self.timings = dict.fromkeys(IMPORT_STAGES, 0.0) # Seconds spent in each stage
+        self.rejects_path = rejects_path
+        self._rejects_file = None
+        self._rejects = None
+
+    def add_error(self, row_number, article, message):
+        self.failed += 1
+        if len(self.errors) < MAX_REPORTED_ERRORS:
+            self.errors.append({'row': row_number, 'article': article, 'error': message})
+        self.add_reject(row_number, article, message)
+
+    def add_reject(self, row_number, article, reason):
+        if self.rejects_path is None:
+            return
+        if self._rejects is None:
+            os.makedirs(os.path.dirname(self.rejects_path), exist_ok=True)
+            # The BOM makes Excel read the file as UTF-8
+            self._rejects_file = open(self.rejects_path, 'w', newline='', encoding='utf-8-sig')
+            self._rejects = csv.writer(self._rejects_file)
+            self._rejects.writerow(REJECTS_HEADER)
+        self._rejects.writerow((row_number, article, reason))
+
+    @contextmanager
+    def timing(self, stage):
+        """Adds the time spent in the `with` block to a stage."""
+        started_at = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.timings[stage] += time.perf_counter() - started_at
+
+    def close(self):
+        if self._rejects_file is not None:
+            self._rejects_file.close()
+
+    def as_dict(self):
+        duration = time.monotonic() - self.started_at
+        return {
+            'total_rows': self.total_rows,
+            'created': self.created,
+            'updated': self.updated,
+            'failed': self.failed,
+            'duplicates': self.duplicates,
+            'unchanged': self.unchanged,
+            'truncated': self.truncated,
+            'completed': self.completed,
+            'errors': self.errors,
+            'errors_truncated': self.failed > len(self.errors),
+            'rejects_file': os.path.basename(self.rejects_path) if self._rejects is not None else None,
+            'timings': {stage: round(seconds, 3) for stage, seconds in self.timings.items()},
+            'duration': round(duration, 3),
+            'rows_per_sec': round(self.total_rows / duration, 1) if duration > 0 else 0.0,
+        }
+
+
+def merge_import_results(results):
+    """
+    Aggregates the results of the subtasks of a split import into one report dict.
+    """
+    merged = {key: sum(result[key] for result in results) for key in (
+        'total_rows', 'created', 'updated', 'failed', 'duplicates', 'unchanged', 'truncated',
+    )}
+    merged['completed'] = all(result['completed'] for result in results)
+    errors = sorted((error for result in results for error in result['errors']), key=lambda e: e['row'])
+    merged['errors'] = errors[:MAX_REPORTED_ERRORS]
+    merged['errors_truncated'] = merged['failed'] > len(merged['errors'])
+    # Summed over parallel subtasks, so the stages may add up to more than the duration
+    merged['timings'] = {
+        stage: round(sum(result['timings'][stage] for result in results), 3) for stage in IMPORT_STAGES
+    }
+    merged['chunks'] = len(results)
+    return merged
+
+
+def merge_rejects_files(file_paths, target_path):
+    """
+    Concatenates the rejects files of the subtasks of a split import, in the
+    given order, into `target_path`, and removes them.
+
+    Returns:
+        bool: Whether there was anything to merge.
+    """
+    file_paths = [file_path for file_path in file_paths if os.path.exists(file_path)]
+    if not file_paths:
+        return False
+    with open(target_path, 'w', newline='', encoding='utf-8-sig') as target:
+        writer = csv.writer(target)
+        writer.writerow(REJECTS_HEADER)
+        for file_path in file_paths:
+            with open(file_path, newline='', encoding='utf-8-sig') as part:
+                reader = csv.reader(part)
+                next(reader, None) # Header
+                writer.writerows(reader)
+            os.remove(file_path)
+    return True
+
+
+# Size of the blocks hashed by FileHasher; chunked uploads are cut at multiples of it
+HASH_BLOCK_SIZE = 1024 * 1024
+
+
+class FileHasher:
+    """
+    Computes the hash stored in ProductImport.file_hash incrementally.
+
+    The hash is the SHA-256 of the concatenated SHA-256 digests of consecutive
+    HASH_BLOCK_SIZE blocks of the file. Unlike the state of a hashlib object, the
+    digests of the completed blocks can be saved, so a chunked upload received
+    by several processes is hashed as it arrives instead of being read again.
+    """
+    def __init__(self, block_digests=b''):
+        self.block_digests = bytearray(block_digests)
+        self.size = len(block_digests) // 32 * HASH_BLOCK_SIZE
+        self._block = hashlib.sha256()
+        self._block_size = 0
+
+    def update(self, data):
+        view = memoryview(data)
+        while view:
+            take = min(len(view), HASH_BLOCK_SIZE - self._block_size)
+            self._block.update(view[:take])
+            self._block_size += take
+            self.size += take
+            view = view[take:]
+            if self._block_size == HASH_BLOCK_SIZE:
+                self.block_digests += self._block.digest()
+                self._block = hashlib.sha256()
+                self._block_size = 0
+
+    @property
+    def at_block_boundary(self):
+        # Only then is block_digests the complete state
+        return self._block_size == 0
+
+    def hexdigest(self):
+        digests = self.block_digests + (self._block.digest() if self._block_size else b'')
+        return hashlib.sha256(digests).hexdigest()
+
+
+def hash_file(file_path):
+    """
+    Returns the FileHasher hex digest of a file, read in blocks.
+    """
+    hasher = FileHasher()
+    with open(file_path, 'rb') as f:
+        for block in iter(lambda: f.read(HASH_BLOCK_SIZE), b''):
+            hasher.update(block)
+    return hasher.hexdigest()
+
+
+def content_hash(row, update_fields):
+    """
+    Returns the hash stored in Product.content_hash for the values an import
+    writes from `row`: the columns present in the file and the group name.
+    Files with different sets of columns never produce the same hash.
+    """
+    values = [f"{field}={getattr(row, field) or ''}" for field in PRODUCT_FIELDS if field in update_fields]
+    values.append(f"product_group={row.product_group_name}")
+    return hashlib.blake2b('\x1f'.join(values).encode(), digest_size=16).hexdigest()
+
+
+class EmptyFileError(ValueError):
+    """Raised when the uploaded workbook has no header row."""
+
+
+class InvalidExcelFileError(ValueError):
+    """Raised when an uploaded file is not an .xlsx workbook the importers can read."""
+
+
+# First row and stored dimensions of the first sheet of a workbook
+SheetHead = namedtuple('SheetHead', ('header', 'max_row'))
+
+# Relationship attribute of <sheet> elements in xl/workbook.xml
+RELATIONSHIP_ID = '{http://schemas.openxmlformats.org/officeDocument/2006/relationships}id'
+
+
+def _local_name(tag):
+    return tag.rsplit('}', 1)[-1]
+
+
+def _column_index(cell_ref):
+    # 'C1' -> 2
+    index = 0
+    for char in cell_ref:
+        if not char.isalpha():
+            break
+        index = index * 26 + ord(char.upper()) - ord('A') + 1
+    return index - 1
+
+
+def _workbook_part(archive, name):
+    # Resolves the target of a relationship of xl/workbook.xml to an archive member name
+    if name.startswith('/'):
+        return name.lstrip('/')
+    return posixpath.normpath(posixpath.join('xl', name))
+
+
+def _read_shared_strings(archive, path, count):
+    """Returns the first `count` strings of the shared string table."""
+    strings = []
+    if count == 0 or path not in archive.namelist():
+        return strings
+    with archive.open(path) as f:
+        for _, element in iterparse(f):
+            if _local_name(element.tag) != 'si':
+                continue
+            # Plain <t>, or rich text runs <r><t>; phonetic hints (<rPh>) are not part of the value
+            text = []
+            for child in element:
+                name = _local_name(child.tag)
+                if name == 't':
+                    text.append(child.text or '')
+                elif name == 'r':
+                    text.extend(t.text or '' for t in child if _local_name(t.tag) == 't')
+            strings.append(''.join(text))
+            element.clear()
+            if len(strings) == count:
+                break
+    return strings
+
+
+def _first_sheet_parts(archive):
+    """Returns the archive member names of the first sheet and of the shared string table."""
+    with archive.open('xl/_rels/workbook.xml.rels') as f:
+        relationships = {
+            element.get('Id'): element for _, element in iterparse(f)
+            if _local_name(element.tag) == 'Relationship'
+        }
+    with archive.open('xl/workbook.xml') as f:
+        sheet_id = next(
+            (element.get(RELATIONSHIP_ID) for _, element in iterparse(f) if _local_name(element.tag) == 'sheet'),
+            None,
+        )
+    if sheet_id not in relationships:
+        raise InvalidExcelFileError("The workbook has no sheets.")
+    sheet_path = _workbook_part(archive, relationships[sheet_id].get('Target'))
+    strings_path = next((
+        _workbook_part(archive, element.get('Target')) for element in relationships.values()
+        if element.get('Type', '').endswith('/sharedStrings')
+    ), 'xl/sharedStrings.xml')
+    return sheet_path, strings_path
+
+
+# Start tag of a row of the sheet XML, with its attributes, and its row number attribute
+ROW_TAG_RE = re.compile(rb'<(?:[\w.-]+:)?row\b([^>]*)>')
+ROW_NUMBER_RE = re.compile(rb'\br="(\d+)"')
+
+
+def _scan_last_row(file_path):
+    """
+    Returns the number of the last row of the first sheet (None when it has no
+    rows) by scanning its decompressed XML for row start tags, without parsing
+    it: about as fast as decompressing the sheet.
+    """
+    last_row = 0
+    try:
+        with zipfile.ZipFile(file_path) as archive:
+            sheet_path, _ = _first_sheet_parts(archive)
+            with archive.open(sheet_path) as f:
+                tail = b''
+                for block in iter(lambda: f.read(1024 * 1024), b''):
+                    data = tail + block
+                    # A tag cut at the end of the block is completed by the next one
+                    cut = data.rfind(b'<')
+                    tail = data[cut:] if cut >= 0 and b'>' not in data[cut:] else b''
+                    for match in ROW_TAG_RE.finditer(data, 0, len(data) - len(tail)):
+                        # Rows without a number follow the previous one
+                        number = ROW_NUMBER_RE.search(match.group(1))
+                        last_row = int(number.group(1)) if number else last_row + 1
+    except InvalidExcelFileError:
+        raise
+    except (zipfile.BadZipFile, KeyError, ParseError, ValueError) as e:
+        raise InvalidExcelFileError(f"Not a readable .xlsx file: {e}")
+    return last_row or None
+
+
+def read_sheet_head(file_path):
+    """
+    Reads the first row and the stored dimensions of the first sheet of an .xlsx file.
+
+    Only the beginning of the sheet XML is parsed, and of the shared string table
+    only the strings up to the last one the first row uses (usually the first few),
+    so the cost does not depend on the size of the file. openpyxl would load the
+    whole shared string table just to open the workbook.
+
+    Returns:
+        SheetHead: Header values as strings ('' for empty cells; empty when the
+            first row is missing) and the last row number (None when not stored).
+
+    Raises:
+        InvalidExcelFileError: If the file is not an .xlsx workbook.
+    """
+    try:
+        with zipfile.ZipFile(file_path) as archive:
+            sheet_path, strings_path = _first_sheet_parts(archive)
+
+            max_row = None
+            cells = [] # (column index, type, value)
+            with archive.open(sheet_path) as f:
+                for event, element in iterparse(f, events=('start', 'end')):
+                    name = _local_name(element.tag)
+                    if event == 'start':
+                        if name == 'dimension':
+                            # e.g. ref="A1:H20001"
+                            digits = re.findall(r'\d+', element.get('ref', ''))
+                            max_row = int(digits[-1]) if digits else None
+                        continue
+                    if name == 'c':
+                        value = None
+                        cell_type = element.get('t', 'n')
+                        for child in element:
+                            child_name = _local_name(child.tag)
+                            if child_name == 'v':
+                                value = child.text
+                            elif child_name == 'is':
+                                value = ''.join(t.text or '' for t in child.iter() if _local_name(t.tag) == 't')
+                        ref = element.get('r')
+                        cells.append((_column_index(ref) if ref else len(cells), cell_type, value))
+                    elif name == 'row':
+                        if element.get('r', '1') != '1':
+                            cells = [] # The first row is blank
+                        break
+                    elif name == 'sheetData':
+                        break
+
+            shared_indexes = [int(value) for _, cell_type, value in cells if cell_type == 's' and value is not None]
+            shared = _read_shared_strings(archive, strings_path, max(shared_indexes) + 1 if shared_indexes else 0)
+    except InvalidExcelFileError:
+        raise
+    except (zipfile.BadZipFile, KeyError, ParseError, ValueError) as e:
+        raise InvalidExcelFileError(f"Not a readable .xlsx file: {e}")
+
+    header = [''] * (max((index for index, _, _ in cells), default=-1) + 1)
+    for index, cell_type, value in cells:
+        if cell_type == 's' and value is not None:
+            value = shared[int(value)] if int(value) < len(shared) else None
+        header[index] = _cell_to_str(value)
+    return SheetHead(header, max_row)
+
+
+def validate_excel_header(file_path):
+    """
+    Checks that the first sheet has a header row the importers can use, before
+    the file is handed to a worker.
+
+    Returns:
+        set: Model fields of the recognized columns.
+
+    Raises:
+        InvalidExcelFileError: If the file is not an .xlsx workbook, or its header
+            lacks the article column.
+    """
+    header = read_sheet_head(file_path).header
+    fields = {COLUMN_MAPPING[title.strip().lower()] for title in header if title.strip().lower() in COLUMN_MAPPING}
+    if 'article' not in fields:
+        required = next(title for title, field in COLUMN_MAPPING.items() if field == 'article')
+        raise InvalidExcelFileError(f"The first row of the sheet has no '{required}' column.")
+    return fields
+
+
+def _cell_to_str(value):
+    # Convert empty cells to empty strings and ensure all values are strings.
+    # Excel stores every number as a float: whole ones lose the '.0' str() gives them
+    if value is None:
+        return ''
+    if isinstance(value, str):
+        return value
+    if isinstance(value, float):
+        if value != value: # NaN
+            return ''
+        if value.is_integer():
+            return str(int(value))
+    return str(value)
+
+
+def _normalize_column(values):
+    # Most cells are strings already, which only need stripping
+    return [value.strip() if value.__class__ is str else _cell_to_str(value).strip() for value in values]
+
+
+# Length limits of the CharField columns, by ProductRow field
+CHAR_FIELD_LIMITS = {
+    **{
+        field: Product._meta.get_field(field).max_length
+        for field in PRODUCT_FIELDS if Product._meta.get_field(field).max_length
+    },
+    'product_group_name': ProductGroup._meta.get_field('name').max_length,
+}
+
+
+class ExcelBatchReader:
+    """
+    Streams the first sheet of an .xlsx file as batches of clean ProductRow tuples.
+
+    The workbook is opened with openpyxl in read-only mode, so rows are parsed
+    from the sheet XML as they are consumed and peak memory stays bounded by
+    the batch size rather than by the size of the file. Headers are normalized
+    (stripped, lowercased and mapped through COLUMN_MAPPING) once, up front.
+
+    Each batch of raw rows is then normalized and validated a column at a time
+    (see _normalize()), so the writers only get rows they can store:
+    - values are strings, stripped, with '' for empty cells and whole numbers
+      written without a trailing '.0';
+    - rows with an empty article, or one longer than its column, are rejected;
+    - other values longer than their column are truncated, or the row is
+      rejected if settings.PRODUCT_IMPORT_TRUNCATE_LONG_VALUES is off;
+    - when an article occurs several times in the row range, the last row wins:
+      earlier rows of the same batch are dropped, earlier batches were already
+      written and are overwritten by the later row.
+    Rejected, superseded and truncated rows are recorded in `report`.
+
+    Usage:
+        with ExcelBatchReader(file_path, batch_size=2000, report=report) as reader:
+            for batch in reader:
+                ...
+    """
+    def __init__(self, file_path, batch_size, start_row=None, end_row=None, report=None):
+        started_at = time.perf_counter()
+        self.batch_size = batch_size
+        self.report = report if report is not None else ImportReport()
+        # Excel rows are 1-indexed, and data starts from the second row (after headers)
+        self.start_row = start_row or 2
+        self.workbook = openpyxl.load_workbook(file_path, read_only=True, data_only=True)
+        sheet = self.workbook.worksheets[0]
+
+        # Assumes the first row contains headers.
+        header = next(sheet.iter_rows(min_row=1, max_row=1, values_only=True), None)
+        if header is None:
+            self.close()
+            raise EmptyFileError(f"The Excel file {file_path} is empty.")
+        positions = {}
+        for index, title in enumerate(header):
+            field = COLUMN_MAPPING.get(_cell_to_str(title).strip().lower())
+            if field and field not in positions:
+                positions[field] = index
+        self._positions = [positions.get(field) for field in ProductRow._fields[1:]]
+        self._width = max(positions.values()) + 1 if positions else 0
+        self._truncate = settings.PRODUCT_IMPORT_TRUNCATE_LONG_VALUES
+        # Row number of the last occurrence of every article seen so far
+        self._last_rows = {}
+
+        # Model fields present in the file
+        self.fields = set(positions)
+        # Row count taken from the sheet dimensions; may be None or include blank rows
+        last_row = min(end_row or sheet.max_row or 0, sheet.max_row or 0)
+        self.total_rows = last_row - self.start_row + 1 if last_row else None
+        self._rows = sheet.iter_rows(min_row=self.start_row, max_row=end_row, values_only=True)
+        # Opening the workbook loads its shared strings
+        self.report.timings['parse'] += time.perf_counter() - started_at
+
+    def _normalize(self, row_numbers, raw_rows):
+        """
+        Turns the raw cell values of a batch into ProductRow tuples.
+
+        The batch is transposed once, then every step works on a whole column:
+        one pass converts and strips it, length checks only look for offending
+        cells in columns whose longest value is over the limit, and the tuples
+        are built by zipping the columns back together.
+        """
+        report = self.report
+        width = self._width
+        # Read-only sheets may omit trailing empty cells
+        cells = list(zip(*(
+            values if len(values) >= width else values + (None,) * (width - len(values))
+            for values in raw_rows
+        )))
+        columns = [None if index is None else _normalize_column(cells[index]) for index in self._positions]
+        articles = columns[0] if columns[0] is not None else [''] * len(row_numbers)
+        rejected = set()
+
+        for index, article in enumerate(articles):
+            if not article:
+                rejected.add(index)
+                report.add_error(row_numbers[index], article, "'article' is missing or empty")
+
+        for field, column in zip(ProductRow._fields[1:], columns):
+            max_length = CHAR_FIELD_LIMITS.get(field)
+            if column is None or max_length is None or max(map(len, column)) <= max_length:
+                continue
+            for index, value in enumerate(column):
+                if len(value) <= max_length or index in rejected:
+                    continue
+                if field == 'article' or not self._truncate:
+                    rejected.add(index)
+                    report.add_error(
+                        row_numbers[index], articles[index], f"'{field}' is longer than {max_length} characters",
+                    )
+                else:
+                    column[index] = value[:max_length]
+                    report.truncated += 1
+                    report.add_reject(
+                        row_numbers[index], articles[index],
+                        f"'{field}' was truncated from {len(value)} to {max_length} characters",
+                    )
+
+        # The last occurrence of an article wins
+        last_rows = self._last_rows
+        in_batch = {}
+        for index, article in enumerate(articles):
+            if index in rejected:
+                continue
+            previous_row = last_rows.get(article)
+            if previous_row is not None:
+                report.duplicates += 1
+                report.add_reject(previous_row, article, f"Duplicate article, superseded by row {row_numbers[index]}")
+                if article in in_batch:
+                    rejected.add(in_batch[article])
+            in_batch[article] = index
+            last_rows[article] = row_numbers[index]
+
+        rows = map(ProductRow, row_numbers, *(repeat(None) if column is None else column for column in columns))
+        if rejected:
+            return [row for index, row in enumerate(rows) if index not in rejected]
+        return list(rows)
+
+    def __iter__(self):
+        row_numbers = []
+        raw_rows = []
+        # Time spent reading the sheet, not counting the consumer of the batches
+        parse_started_at = time.perf_counter()
+        for row_number, values in enumerate(self._rows, start=self.start_row):
+            if all(value is None for value in values):
+                continue # Skip blank rows
+            row_numbers.append(row_number)
+            raw_rows.append(values)
+            if len(raw_rows) >= self.batch_size:
+                self.report.timings['parse'] += time.perf_counter() - parse_started_at
+                batch = self._clean_batch(row_numbers, raw_rows)
+                if batch:
+                    yield batch
+                row_numbers = []
+                raw_rows = []
+                parse_started_at = time.perf_counter()
+        self.report.timings['parse'] += time.perf_counter() - parse_started_at
+        if raw_rows:
+            batch = self._clean_batch(row_numbers, raw_rows)
+            if batch:
+                yield batch
+
+    def _clean_batch(self, row_numbers, raw_rows):
+        self.report.total_rows += len(raw_rows)
+        with self.report.timing('normalize'):
+            return self._normalize(row_numbers, raw_rows)
+
+    def close(self):
+        self.workbook.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+def _lock_product_groups():
+    """
+    Serializes product group creation between concurrent imports for the rest of
+    the current transaction. ProductGroup.name is not unique, so two parallel
+    imports could otherwise create the same group twice.
+    """
+    if connection.vendor == 'postgresql':
+        with connection.cursor() as cursor:
+            cursor.execute("SELECT pg_advisory_xact_lock(%s)", [GROUP_CREATION_LOCK_ID])
+
+
+def resolve_product_groups(group_names, groups=None):
+    """
+    Gets or creates the product groups referenced by the file, in bulk.
+
+    Rows without a group fall back to settings.PRODUCT_IMPORT_DEFAULT_GROUP,
+    which is kept at the top level. Groups listed in settings.PRODUCT_GROUP_PARENTS
+    are linked to their configured parent, which is created as needed too.
+    Other groups are created as needed and their parent_id is left untouched.
+
+    All names missing from `groups` are handled together: one query for the
+    existing groups, one bulk_create() for the new ones, one UPDATE for the
+    parents to fix, and a refresh of the materialized paths if anything changed.
+
+    Args:
+        group_names (iterable): Distinct, already stripped group names ('' for none).
+        groups (dict): Mapping from a previous call; only names missing from it
+            are looked up, so it can be reused across the batches of a file.
+
+    Returns:
+        dict: Mapping of group name to ProductGroup id ('' maps to the default group).
+    """
+    if groups is None:
+        groups = {}
+    default_group = settings.PRODUCT_IMPORT_DEFAULT_GROUP
+    parents = settings.PRODUCT_GROUP_PARENTS
+
+    names = {name or default_group for name in group_names} | {default_group}
+    # Configured parents are resolved too, up their whole chain
+    pending = names
+    while pending:
+        pending = {parents[name] for name in pending if name in parents} - names
+        names |= pending
+
+    missing = names - set(groups)
+    if missing:
+        with transaction.atomic():
+            _lock_product_groups()
+            resolved = {}
+            # ProductGroup.name is not unique: like before, the oldest group of a name is used
+            for group in ProductGroup.objects.filter(name__in=missing).order_by('-id'):
+                resolved[group.name] = group
+            needs_path = any(group.path is None for group in resolved.values())
+            created = ProductGroup.objects.bulk_create(
+                [ProductGroup(name=name) for name in missing if name not in resolved]
+            )
+            resolved.update((group.name, group) for group in created)
+            ids = {**groups, **{name: group.id for name, group in resolved.items()}}
+
+            relinked = []
+            for name, group in resolved.items():
+                if name in parents:
+                    parent_id = ids[parents[name]]
+                elif name == default_group:
+                    parent_id = None # The default group must not be linked to anything
+                else:
+                    continue
+                if group.parent_id != parent_id:
+                    group.parent_id = parent_id
+                    relinked.append(group)
+            if relinked:
+                ProductGroup.objects.bulk_update(relinked, ['parent_id'])
+            if created or relinked or needs_path:
+                refresh_group_paths()
+        groups.update(ids)
+        if created or relinked:
+            logger.info(
+                f"Product groups: created {len(created)} ({', '.join(group.name for group in created)}), "
+                f"re-parented {len(relinked)}"
+            )
+    groups[''] = groups[default_group]
+    return groups
+
+
+def _on_conflict_sql(update_fields):
+    """
+    Builds the ON CONFLICT (article) DO UPDATE clause shared by both engines.
+    Only the columns present in the file are overwritten on existing products.
+
+    When an import is split across parallel subtasks, the same article may be
+    written by several of them in any order. The WHERE condition makes the
+    outcome deterministic: within one import run, a row only overwrites a
+    product last written from an earlier (or the same) spreadsheet row.
+    Rows identical to the stored product are not written, but in split imports
+    they still leave that mark, see _stamp_sql().
+    """
+    qn = connection.ops.quote_name
+    updated_columns = [
+        Product._meta.get_field(field).column for field in PRODUCT_FIELDS
+        if field in update_fields and field != 'article'
+    ] + ['product_group_id', 'import_id', 'import_row', 'content_hash']
+    return (
+        f"ON CONFLICT ({qn('article')}) DO UPDATE SET "
+        + ', '.join(f"{qn(c)} = EXCLUDED.{qn(c)}" for c in updated_columns)
+        + f", {qn('updated_at')} = now()"
+        + f" WHERE p.{qn('import_id')} IS DISTINCT FROM EXCLUDED.{qn('import_id')}"
+        f" OR p.{qn('import_row')} <= EXCLUDED.{qn('import_row')}"
+    )
+
+
+def _insert_columns_sql():
+    qn = connection.ops.quote_name
+    columns = [Product._meta.get_field(field).column for field in PRODUCT_FIELDS]
+    columns += ['product_group_id', 'import_id', 'import_row', 'content_hash']
+    return f"INSERT INTO {qn(Product._meta.db_table)} AS p ({', '.join(qn(c) for c in columns)})"
+
+
+def _stamp_sql():
+    """
+    Builds the UPDATE recording, on products identical to their row, that the
+    current import wrote them from that row (import_id/import_row), without
+    touching their content or updated_at.
+
+    Subtasks of a split import stamp their unchanged rows, so that an earlier,
+    different occurrence of the same article in another row range, written
+    later by a parallel subtask, is skipped by the ON CONFLICT condition. The
+    hash and group are checked again under the row lock: a product another
+    subtask changed in the meantime is not stamped and is returned from
+    neither query, so its row goes through the regular upsert.
+    """
+    qn = connection.ops.quote_name
+    return (
+        f"UPDATE {qn(Product._meta.db_table)} AS p SET {qn('import_id')} = v.import_id, {qn('import_row')} = v.import_row "
+        f"FROM (VALUES %s) AS v({qn('article')}, import_row, content_hash, group_id, import_id) "
+        f"WHERE p.{qn('article')} = v.{qn('article')} AND p.content_hash = v.content_hash "
+        f"AND p.product_group_id = v.group_id AND (p.{qn('import_id')} IS DISTINCT FROM v.import_id "
+        f"OR p.{qn('import_row')} <= v.import_row) RETURNING p.{qn('article')}"
+    )
+
+
+def _upsert_sql(update_fields):
+    """
+    Builds the INSERT ... ON CONFLICT (article) DO UPDATE statement for a chunk.
+    """
+    return (
+        f"{_insert_columns_sql()} VALUES %s "
+        f"{_on_conflict_sql(update_fields)} RETURNING id, {connection.ops.quote_name('article')}, (xmax = 0) AS inserted"
+    )
+
+
+def _row_values(row, groups, import_id, row_hash):
+    return tuple(getattr(row, field) or '' for field in PRODUCT_FIELDS) + (
+        # Rows of files without the group column go to the default group, like with COPY
+        groups[row.product_group_name or ''], import_id, row.row_number, row_hash,
+    )
+
+
+def upsert_products(rows, update_fields, groups, report, import_id, is_part=False):
+    """
+    Writes one chunk of rows with a single INSERT ... ON CONFLICT statement
+    and commits it. If the statement fails, the chunk is retried row by row so
+    that only the offending rows end up in the error report.
+
+    Rows whose content hash and group match the stored product are skipped
+    before the write, found with one indexed query per chunk, so re-importing
+    an unchanged catalog writes nothing. In the subtasks of a split import,
+    they are only stamped with the import and row instead, see _stamp_sql().
+
+    Args:
+        rows (list): ProductRow tuples of the chunk, in file order.
+        update_fields (set): Model fields present in the file.
+        groups (dict): Mapping returned by resolve_product_groups().
+        report (ImportReport): Receives the counters and per-row errors.
+        import_id (str): Identifier shared by all subtasks of one import run.
+        is_part (bool): Whether the rows are a range of a split import.
+    """
+    # ON CONFLICT cannot touch the same row twice in one statement,
+    # so the last occurrence of an article within the chunk wins.
+    latest = {}
+    for row in rows:
+        if not row.article:
+            report.add_error(row.row_number, row.article, "'article' is missing or empty")
+            continue
+        if row.article in latest:
+            report.duplicates += 1
+        latest[row.article] = row
+    if not latest:
+        return
+
+    hashes = {article: content_hash(row, update_fields) for article, row in latest.items()}
+    group_ids = {article: groups[row.product_group_name or ''] for article, row in latest.items()}
+    unchanged = [
+        article for article, stored_hash, group_id in Product.objects.filter(article__in=list(latest)).values_list(
+            'article', 'content_hash', 'product_group_id',
+        )
+        if stored_hash == hashes[article] and group_id == group_ids[article]
+    ]
+    if unchanged and is_part:
+        with transaction.atomic(), connection.cursor() as cursor:
+            unchanged = [article for (article,) in execute_values(
+                cursor, _stamp_sql(), [
+                    (article, latest[article].row_number, hashes[article], group_ids[article], import_id)
+                    for article in unchanged
+                ],
+                page_size=len(unchanged), fetch=True,
+            )]
+    for article in unchanged:
+        del latest[article]
+    report.unchanged += len(unchanged)
+    if not latest:
+        return
+
+    sql = _upsert_sql(update_fields)
+
+    def write(chunk):
+        with transaction.atomic(), connection.cursor() as cursor:
+            written = execute_values(
+                cursor, sql, [_row_values(row, groups, import_id, hashes[row.article]) for row in chunk],
+                page_size=len(chunk), fetch=True,
+            )
+            # Keep the normalized cross table in step with trading_numbers
+            if 'trading_numbers' in update_fields:
+                sync_product_crosses(
+                    (product_id, latest[article].trading_numbers) for product_id, article, _ in written
+                )
+        return written
+
+    failed_before = report.failed
+    try:
+        results = write(list(latest.values()))
+    except Exception as e:
+        logger.warning(f"Chunk write failed ({str(e).strip()}), retrying {len(latest)} rows one by one.")
+        results = []
+        for row in latest.values():
+            try:
+                results += write([row])
+            except Exception as row_error:
+                report.add_error(row.row_number, row.article, str(row_error).strip())
+
+    inserted = sum(1 for _, _, was_inserted in results if was_inserted)
+    report.created += inserted
+    report.updated += len(results) - inserted
+    # Rows skipped by the ON CONFLICT condition were superseded by a later row
+    # written by a parallel subtask of the same import
+    report.duplicates += len(latest) - len(results) - (report.failed - failed_before)
+
+
+def _copy_value(value):
+    """
+    Formats a single value for COPY ... FROM STDIN in PostgreSQL text format.
+    """
+    if value is None:
+        return '\\N'
+    return (
+        str(value)
+        .replace('\\', '\\\\')
+        .replace('\t', '\\t')
+        .replace('\n', '\\n')
+        .replace('\r', '\\r')
+    )
+
+
+class _CopyStream:
+    """
+    File-like object that feeds rows to cursor.copy_expert() as they are
+    requested, so the COPY payload is never built in memory as a whole.
+
+    With a `report`, the time COPY spends outside read(), sending and storing
+    the rows, is added to its 'write' stage; call finish() once copy_expert()
+    returns. Producing the rows is timed by whoever produces them.
+    """
+    def __init__(self, rows, report=None):
+        self._lines = ('\t'.join(_copy_value(value) for value in row) + '\n' for row in rows)
+        self._buffer = ''
+        self._report = report
+        self._returned_at = None
+
+    def read(self, size=-1):
+        self.finish()
+        data = self._read(size)
+        if self._report is not None:
+            self._returned_at = time.perf_counter()
+        return data
+
+    readline = read
+
+    def finish(self):
+        """Adds the time since the last read to the 'write' stage of the report."""
+        if self._returned_at is not None:
+            self._report.timings['write'] += time.perf_counter() - self._returned_at
+            self._returned_at = None
+
+    def _read(self, size):
+        parts = [self._buffer]
+        length = len(self._buffer)
+        while size < 0 or length < size:
+            line = next(self._lines, None)
+            if line is None:
+                break
+            parts.append(line)
+            length += len(line)
+        data = ''.join(parts)
+        if size < 0:
+            self._buffer = ''
+            return data
+        self._buffer = data[size:]
+        return data[:size]
+
+
+def copy_import_products(rows, update_fields, report, import_id, is_part=False):
+    """
+    Imports rows through an UNLOGGED staging table: the rows are streamed in
+    with COPY, product groups are resolved from the distinct staged names, and
+    products are merged with a single INSERT ... SELECT ... ON CONFLICT statement.
+    When an article occurs several times in the file, the last row wins. Rows
+    whose content hash and group match the stored product are left out of the
+    merge; in the subtasks of a split import they are stamped, see _stamp_sql().
+
+    Args:
+        rows (iterable): ProductRow tuples in file order, validated by ExcelBatchReader.
+        update_fields (set): Model fields present in the file.
+        report (ImportReport): Receives the counters and per-row errors.
+        import_id (str): Identifier shared by all subtasks of one import run.
+        is_part (bool): Whether the rows are a range of a split import.
+    """
+    if connection.vendor != 'postgresql':
+        raise ValueError(f"The '{ENGINE_COPY}' import engine requires PostgreSQL.")
+
+    qn = connection.ops.quote_name
+    stage = qn(f"{Product._meta.db_table}_stage_{uuid.uuid4().hex}")
+    product_columns = [Product._meta.get_field(field).column for field in PRODUCT_FIELDS]
+
+    timings = report.timings
+
+    # Cross numbers are parsed and normalized in Python while streaming, exactly like
+    # the other write paths, and staged as two separator-joined text columns
+    def staged_row(row):
+        started_at = time.perf_counter()
+        pairs = split_trading_numbers(row.trading_numbers)
+        staged = row + (
+            CROSS_SEPARATOR.join(number for number, _ in pairs),
+            CROSS_SEPARATOR.join(normalized for _, normalized in pairs),
+            content_hash(row, update_fields),
+        )
+        timings['write'] += time.perf_counter() - started_at
+        return staged
+
+    # Every stage is timed where it runs: pulling rows from `rows` runs the parse
+    # and normalize stages of the reader while COPY is in progress
+    with connection.cursor() as cursor:
+        with report.timing('write'):
+            cursor.execute(
+                f"CREATE UNLOGGED TABLE {stage} (row_number integer, "
+                + ', '.join(f"{qn(c)} text" for c in product_columns)
+                + ", product_group_name text, cross_numbers text, cross_normalized text, content_hash text)"
+            )
+        try:
+            stream = _CopyStream((staged_row(row) for row in rows), report)
+            cursor.copy_expert(f"COPY {stage} FROM STDIN", stream)
+            stream.finish()
+            with report.timing('groups'):
+                cursor.execute(f"SELECT DISTINCT coalesce(product_group_name, '') FROM {stage}")
+                groups = resolve_product_groups(name for (name,) in cursor.fetchall())
+
+            crosses_sql = ''
+            if 'trading_numbers' in update_fields:
+                # Replace the normalized crosses of every product written by the merge
+                cross_table = qn(ProductCross._meta.db_table)
+                crosses_sql = (
+                    f", dropped AS (DELETE FROM {cross_table} WHERE product_id IN (SELECT id FROM merged))"
+                    f", crosses AS (INSERT INTO {cross_table} (product_id, number, normalized_number) "
+                    f"SELECT m.id, c.number, c.normalized FROM merged m "
+                    f"JOIN changed s ON s.{qn('article')} = m.{qn('article')} "
+                    f"CROSS JOIN LATERAL unnest(string_to_array(s.cross_numbers, %s), "
+                    f"string_to_array(s.cross_normalized, %s)) AS c(number, normalized))"
+                )
+            if is_part:
+                # Stamped in the statement, see _stamp_sql()
+                unchanged_sql = (
+                    f"unchanged AS (UPDATE {qn(Product._meta.db_table)} p SET {qn('import_id')} = %s, "
+                    f"{qn('import_row')} = l.row_number FROM latest l WHERE p.{qn('article')} = l.{qn('article')} "
+                    f"AND p.content_hash = l.content_hash AND p.product_group_id = l.group_id "
+                    f"AND (p.{qn('import_id')} IS DISTINCT FROM %s OR p.{qn('import_row')} <= l.row_number) "
+                    f"RETURNING p.{qn('article')})"
+                )
+                unchanged_params = [import_id, import_id]
+            else:
+                unchanged_sql = (
+                    f"unchanged AS (SELECT l.{qn('article')} FROM latest l JOIN {qn(Product._meta.db_table)} p "
+                    f"ON p.{qn('article')} = l.{qn('article')} "
+                    f"AND p.content_hash = l.content_hash AND p.product_group_id = l.group_id)"
+                )
+                unchanged_params = []
+            with report.timing('write'), transaction.atomic():
+                cursor.execute(
+                    # The last row of every article, with its group id
+                    f"WITH latest AS (SELECT DISTINCT ON (s.{qn('article')}) s.*, g.id AS group_id FROM {stage} s "
+                    f"JOIN unnest(%s::text[], %s::bigint[]) AS g(name, id) "
+                    f"ON g.name = coalesce(s.product_group_name, '') "
+                    f"ORDER BY s.{qn('article')}, s.row_number DESC), "
+                    # ... without the rows identical to the stored product
+                    f"{unchanged_sql}, "
+                    f"changed AS (SELECT * FROM latest l WHERE NOT EXISTS ("
+                    f"SELECT 1 FROM unchanged u WHERE u.{qn('article')} = l.{qn('article')})), "
+                    f"merged AS ({_insert_columns_sql()} SELECT "
+                    + ', '.join(f"coalesce(s.{qn(c)}, '')" for c in product_columns)
+                    + f", s.group_id, %s, s.row_number, s.content_hash FROM changed s "
+                    f"{_on_conflict_sql(update_fields)} RETURNING id, {qn('article')}, (xmax = 0) AS inserted)"
+                    f"{crosses_sql} "
+                    "SELECT count(*) FILTER (WHERE inserted), count(*) FILTER (WHERE NOT inserted), "
+                    "(SELECT count(*) FROM changed) - count(*), (SELECT count(*) FROM unchanged) FROM merged",
+                    [list(groups), list(groups.values())] + unchanged_params + [import_id]
+                    + ([CROSS_SEPARATOR] * 2 if crosses_sql else []),
+                )
+                created, updated, superseded, unchanged = cursor.fetchone()
+            report.duplicates += superseded
+            report.unchanged += unchanged
+            report.created += created
+            report.updated += updated
+        finally:
+            with report.timing('write'):
+                cursor.execute(f"DROP TABLE IF EXISTS {stage}")
@@ -0,0 +1,77 @@
+import json
+import time
+
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand
+from django.db import connection
+from django.test import RequestFactory, override_settings
+from django.test.utils import CaptureQueriesContext
+from ninja.security import HttpBearer
+from rest_framework_simplejwt.tokens import AccessToken
+
+from myapp.auth import JWTAuth, user_status_cache
+
+
+class BaselineJWTAuth(HttpBearer):
+    """
+    The authenticator JWTAuth replaced, kept as it was: JWTAuthentication is
+    imported and instantiated twice on every request, and the user is fetched.
+    """
+    def authenticate(self, request, token):
+        try:
+            from rest_framework_simplejwt.authentication import JWTAuthentication
+            validated_token = JWTAuthentication().get_validated_token(token)
+            user = JWTAuthentication().get_user(validated_token)
+            if user and user.is_active:
+                request.auth_user = user
+                return user
+        except Exception:
+            return None
+
+
+class Command(BaseCommand):
+    help = (
+        "Measures the per-request overhead of the previous JWT authenticator against "
+        "JWTAuth with a database user lookup and in the stateless claims-only mode."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--requests', type=int, default=5000, help='Authenticated requests per mode.')
+        parser.add_argument('--username', default='benchmark_auth_user')
+
+    def handle(self, *args, **options):
+        user, created = get_user_model().objects.get_or_create(username=options['username'])
+        try:
+            results = self.run(user, options['requests'])
+        finally:
+            if created:
+                user.delete()
+        self.stdout.write(json.dumps(results, indent=2))
+
+    def run(self, user, count):
+        header = f"Bearer {AccessToken.for_user(user)}"
+        request = RequestFactory().get('/api/get_article_crosses', HTTP_AUTHORIZATION=header)
+
+        results = []
+        for mode, auth, stateless in (
+            ('baseline', BaselineJWTAuth(), False),
+            ('db_lookup', JWTAuth(), False),
+            ('stateless', JWTAuth(), True),
+        ):
+            user_status_cache.clear()
+            with override_settings(API_JWT_STATELESS=stateless), CaptureQueriesContext(connection) as queries:
+                started = time.perf_counter()
+                for _ in range(count):
+                    assert auth(request) is not None
+                duration = time.perf_counter() - started
+            results.append({
+                'mode': mode,
+                'requests': count,
+                'microseconds_per_request': round(duration / count * 1e6, 1),
+                'queries_per_request': round(len(queries) / count, 4),
+            })
+            self.stdout.write(
+                f"{mode:>9}: {duration / count * 1e6:.1f} us/request, "
+                f"{len(queries) / count:.4f} queries/request"
+            )
+        return results
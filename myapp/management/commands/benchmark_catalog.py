@@ -0,0 +1,210 @@
+import json
+import os
+import platform
+import random
+import shutil
+import statistics
+import subprocess
+import tempfile
+import time
+from datetime import datetime, timezone
+from urllib.parse import quote
+from uuid import uuid4
+
+import django
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.core.management import call_command
+from django.core.management.base import BaseCommand
+from django.db import connection
+from django.test import Client, override_settings
+from django.test.utils import setup_test_environment, teardown_test_environment
+from rest_framework_simplejwt.tokens import AccessToken
+
+from myapp.exports import EXPORT_XLSX, write_catalog_file
+from myapp.importers import IMPORT_ENGINES
+from myapp.management.commands.generate_catalog import generate_catalog_rows
+from myapp.models import Product, ProductCross, ProductGroup
+from myapp.tasks import import_products_from_excel
+
+# Settings for a run on a developer machine: nothing but the local PostgreSQL
+BENCHMARK_SETTINGS = {
+    'CACHES': {'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}},
+    'METRICS_REDIS_URL': '',
+}
+
+
+def _git_commit():
+    try:
+        return subprocess.run(
+            ['git', 'rev-parse', '--short', 'HEAD'], cwd=settings.BASE_DIR,
+            capture_output=True, text=True, check=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def _latency_summary(durations, statuses):
+    durations = sorted(durations)
+    return {
+        'requests': len(durations),
+        'errors': sum(1 for status in statuses if status >= 400),
+        'mean_ms': round(statistics.fmean(durations) * 1000, 2),
+        'p50_ms': round(durations[len(durations) // 2] * 1000, 2),
+        'p95_ms': round(durations[min(len(durations) - 1, int(len(durations) * 0.95))] * 1000, 2),
+        'max_ms': round(durations[-1] * 1000, 2),
+    }
+
+
+def api_scenarios(rng):
+    """
+    Returns (name, method, path, parameters) tuples covering the read endpoints;
+    path and parameters are functions drawing values from the imported catalog.
+    """
+    articles = list(Product.objects.order_by('?').values_list('article', flat=True)[:1000])
+    numbers = list(ProductCross.objects.order_by('?').values_list('number', flat=True)[:1000]) or ['0']
+    group_ids = list(ProductGroup.objects.values_list('id', flat=True))
+    no_params = dict
+    return (
+        ('article', 'get', lambda: f"/api/articles/{quote(rng.choice(articles))}", no_params),
+        ('batch_get_100', 'post', lambda: '/api/articles/batch_get',
+         lambda: {'articles': rng.sample(articles, min(100, len(articles)))}),
+        ('crosses_page_1000', 'get', lambda: '/api/get_article_crosses/page', lambda: {'limit': 1000}),
+        ('cross_lookup', 'get', lambda: '/api/crosses/lookup', lambda: {'number': rng.choice(numbers)}),
+        ('search_article', 'get', lambda: '/api/products/search', lambda: {'q': rng.choice(articles)[:6], 'limit': 100}),
+        ('search_words', 'get', lambda: '/api/products/search', lambda: {'q': 'колодки тормозные', 'limit': 100}),
+        ('filter_facets', 'get', lambda: '/api/products/filter',
+         lambda: {'spec.Сторона установки': rng.choice(('Левая', 'Правая')), 'facets': 'true', 'limit': 100}),
+        ('group_products', 'get', lambda: f"/api/groups/{rng.choice(group_ids)}/products", lambda: {'limit': 100}),
+        ('groups_tree', 'get', lambda: '/api/groups/tree', no_params),
+        ('changes_1000', 'get', lambda: '/api/articles/changes', lambda: {'limit': 1000}),
+    )
+
+
+class Command(BaseCommand):
+    help = (
+        "Benchmarks the Excel import and the read API on synthetic catalogs of several sizes, "
+        "in a separate test database. Prints the results as JSON on stdout and progress on stderr; needs only PostgreSQL."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--rows', type=int, nargs='+', default=[10000, 100000, 1000000],
+                            help='Catalog sizes to benchmark.')
+        parser.add_argument('--engines', nargs='+', choices=IMPORT_ENGINES, default=list(IMPORT_ENGINES))
+        parser.add_argument('--requests', type=int, default=50, help='Requests per API scenario.')
+        parser.add_argument('--duplicates', type=float, default=0.01, help='Share of duplicate articles.')
+        parser.add_argument('--seed', type=int, default=0)
+        parser.add_argument('--data-dir', help='Keeps the generated catalogs here for later runs.')
+        parser.add_argument('--keepdb', action='store_true', help='Keep the test database between runs.')
+        parser.add_argument('--output', help='Also write the JSON results to this file.')
+
+    def handle(self, *args, **options):
+        setup_test_environment()
+        # Imports and requests write and read the test database only
+        old_name = connection.creation.create_test_db(verbosity=0, autoclobber=True, keepdb=options['keepdb'], serialize=False)
+        data_dir = options['data_dir'] or tempfile.mkdtemp(prefix='benchmark_catalog_')
+        os.makedirs(data_dir, exist_ok=True)
+        # Rejects files of the imports
+        rejects_dir = tempfile.mkdtemp(prefix='benchmark_catalog_rejects_')
+        try:
+            with override_settings(**BENCHMARK_SETTINGS, PRODUCT_EXPORT_DIR=rejects_dir):
+                with connection.cursor() as cursor:
+                    cursor.execute("SHOW server_version")
+                    server_version = cursor.fetchone()[0]
+                results = {
+                    'commit': _git_commit(),
+                    'started_at': datetime.now(timezone.utc).isoformat(timespec='seconds'),
+                    'python': platform.python_version(),
+                    'django': django.get_version(),
+                    'postgresql': server_version,
+                    'cpu_count': os.cpu_count(),
+                    'settings': {
+                        'PRODUCT_IMPORT_CHUNK_SIZE': settings.PRODUCT_IMPORT_CHUNK_SIZE,
+                        'CONN_MAX_AGE': settings.DATABASES['default'].get('CONN_MAX_AGE'),
+                    },
+                    'options': {key: options[key] for key in ('engines', 'requests', 'duplicates', 'seed')},
+                    'sizes': [self.run_size(rows, data_dir, options) for rows in options['rows']],
+                }
+        finally:
+            connection.creation.destroy_test_db(old_name, verbosity=0, keepdb=options['keepdb'])
+            teardown_test_environment()
+            shutil.rmtree(rejects_dir, ignore_errors=True)
+            if not options['data_dir']:
+                shutil.rmtree(data_dir, ignore_errors=True)
+
+        output = json.dumps(results, indent=2, ensure_ascii=False)
+        if options['output']:
+            with open(options['output'], 'w') as f:
+                f.write(output + '\n')
+        self.stdout.write(output)
+
+    def run_size(self, rows, data_dir, options):
+        file_path = os.path.join(data_dir, f"catalog_{rows}_{options['seed']}_{options['duplicates']}.xlsx")
+        generate_seconds = None
+        if not os.path.exists(file_path):
+            started = time.perf_counter()
+            write_catalog_file(
+                file_path, EXPORT_XLSX, generate_catalog_rows(rows, options['duplicates'], options['seed']),
+            )
+            generate_seconds = round(time.perf_counter() - started, 3)
+            self.stderr.write(f"{rows} rows: generated {file_path} in {generate_seconds:.1f}s")
+
+        imports = []
+        for engine in options['engines']:
+            call_command('flush', interactive=False, verbosity=0)
+            # A first import into an empty catalog, then the same file again (all rows unchanged)
+            for run in ('initial', 'repeat'):
+                imports.append({'engine': engine, 'run': run, **self.run_import(file_path, engine)})
+                self.stderr.write(
+                    f"{rows} rows: {engine} {run} import in {imports[-1]['duration']:.1f}s "
+                    f"({imports[-1]['rows_per_sec']:.0f} rows/s)"
+                )
+
+        return {
+            'rows': rows,
+            'file_size_bytes': os.path.getsize(file_path),
+            'generate_seconds': generate_seconds,
+            'products': Product.objects.count(),
+            'imports': imports,
+            'api': self.run_api(rows, options),
+        }
+
+    def run_import(self, file_path, engine):
+        # The task removes the file it imported
+        work_path = f"{file_path}.{uuid4().hex}.xlsx"
+        shutil.copyfile(file_path, work_path)
+        # Called directly, the task runs in this process without a broker or result backend
+        result = import_products_from_excel(work_path, engine=engine, import_id=uuid4().hex)
+        keys = (
+            'total_rows', 'created', 'updated', 'unchanged', 'failed', 'duplicates', 'truncated',
+            'completed', 'duration', 'rows_per_sec', 'timings',
+        )
+        return {key: result[key] for key in keys}
+
+    def run_api(self, rows, options):
+        rng = random.Random(options['seed'])
+        user, _ = get_user_model().objects.get_or_create(username='benchmark_catalog_user')
+        client = Client(HTTP_AUTHORIZATION=f"Bearer {AccessToken.for_user(user)}")
+        results = {}
+        for name, method, path, params in api_scenarios(rng):
+            durations = []
+            statuses = []
+            for _ in range(options['requests']):
+                request_path = path()
+                request_params = params()
+                # Measure the database work, not the response cache
+                cache.clear()
+                started = time.perf_counter()
+                if method == 'get':
+                    response = client.get(request_path, request_params)
+                else:
+                    response = client.post(request_path, request_params, content_type='application/json')
+                durations.append(time.perf_counter() - started)
+                statuses.append(response.status_code)
+            results[name] = _latency_summary(durations, statuses)
+            self.stderr.write(
+                f"{rows} rows: {name}: p50 {results[name]['p50_ms']} ms, p95 {results[name]['p95_ms']} ms"
+                + (f", {results[name]['errors']} errors" if results[name]['errors'] else '')
+            )
+        return results
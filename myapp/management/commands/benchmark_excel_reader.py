@@ -0,0 +1,95 @@
+import json
+import os
+import tempfile
+import time
+import tracemalloc
+
+import openpyxl
+import pandas as pd
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from myapp.importers import COLUMN_MAPPING, ExcelBatchReader
+
+
+def build_scaled_workbook(source_path, target_path, rows):
+    """
+    Writes a workbook with `rows` data rows by repeating the rows of `source_path`,
+    suffixing articles so every row stays unique.
+    """
+    source = openpyxl.load_workbook(source_path, read_only=True)
+    source_rows = list(source.worksheets[0].iter_rows(values_only=True))
+    source.close()
+    header, data = source_rows[0], source_rows[1:]
+    article_index = [str(title).strip().lower() for title in header].index('уникальный артикул')
+
+    workbook = openpyxl.Workbook(write_only=True)
+    sheet = workbook.create_sheet()
+    sheet.append(header)
+    for index in range(rows):
+        row = list(data[index % len(data)])
+        row[article_index] = f"{row[article_index]}-{index}"
+        sheet.append(row)
+    workbook.save(target_path)
+
+
+def read_with_pandas(file_path, batch_size):
+    # The previous import path: load the whole sheet, then walk it with iterrows(),
+    # building the cleaned values of every row. Like the streaming reader, only
+    # rows with an article are counted
+    df = pd.read_excel(file_path, engine='openpyxl')
+    df.columns = df.columns.astype(str).str.strip().str.lower()
+    df = df.rename(columns=COLUMN_MAPPING)
+    count = 0
+    for index, row in df.iterrows():
+        product_data = {key: '' if pd.isna(value) else str(value).strip() for key, value in row.items()}
+        if product_data.get('article'):
+            count += 1
+    return count
+
+
+def read_with_stream(file_path, batch_size):
+    count = 0
+    with ExcelBatchReader(file_path, batch_size) as reader:
+        for batch in reader:
+            count += len(batch)
+    return count
+
+
+class Command(BaseCommand):
+    help = (
+        "Compares peak memory and throughput of the streaming Excel reader "
+        "against the previous pandas read_excel/iterrows path on a scaled-up copy of files/excel.xlsx."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--rows', type=int, nargs='+', default=[10000, 100000],
+                            help='Numbers of data rows to benchmark with.')
+        parser.add_argument('--batch-size', type=int, default=settings.PRODUCT_IMPORT_CHUNK_SIZE)
+        parser.add_argument('--source', default=os.path.join(settings.BASE_DIR, 'files', 'excel.xlsx'))
+
+    def handle(self, *args, **options):
+        results = []
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            for rows in options['rows']:
+                file_path = os.path.join(tmp_dir, f'catalog_{rows}.xlsx')
+                build_scaled_workbook(options['source'], file_path, rows)
+                for name, reader in (('pandas', read_with_pandas), ('stream', read_with_stream)):
+                    tracemalloc.start()
+                    started = time.perf_counter()
+                    count = reader(file_path, options['batch_size'])
+                    duration = time.perf_counter() - started
+                    _, peak = tracemalloc.get_traced_memory()
+                    tracemalloc.stop()
+                    results.append({
+                        'reader': name,
+                        'rows': count,
+                        'file_size_bytes': os.path.getsize(file_path),
+                        'seconds': round(duration, 3),
+                        'rows_per_second': round(count / duration) if duration else None,
+                        'peak_memory_mb': round(peak / 2 ** 20, 1),
+                    })
+                    self.stdout.write(
+                        f"{name:>6}: {count} rows in {duration:.2f}s, peak {peak / 2 ** 20:.1f} MB"
+                    )
+        self.stdout.write(json.dumps(results, indent=2))
@@ -0,0 +1,167 @@
+import os
+import random
+import time
+from collections import deque
+
+from django.core.management.base import BaseCommand, CommandError
+
+from myapp.exports import EXPORT_FORMATS, EXPORT_XLSX, ExportTooLargeError, check_xlsx_size, write_catalog_file
+
+# Brands with the shape of their article numbers; `n` is unique per row. Brands
+# with numeric articles get integer cells, as they come from real price lists
+BRANDS = (
+    ('Bosch', '0 986 {n:07d}'),
+    ('Mann-Filter', 'HU {n:07d} X'),
+    ('Mahle', 'OX {n:07d}D'),
+    ('Febi Bilstein', 'FE{n:07d}'),
+    ('Sachs', '31{n:07d}'),
+    ('Lemforder', '25{n:07d}'),
+    ('ZF', '8{n:07d}'),
+    ('TRW', 'GDB{n:07d}'),
+    ('Valeo', 'V-{n:07d}'),
+    ('NGK', 'BKR{n:07d}'),
+    ('Contitech', 'CT{n:07d}K1'),
+    ('Gates', '5PK{n:07d}'),
+    ('SKF', 'VKBA {n:07d}'),
+    ('KYB', '33{n:07d}'),
+    ('Brembo', '09.{n:07d}.11'),
+    ('Hella', '6PU {n:07d}'),
+)
+
+# Part types: description, product group ('' for the default group), specifications
+PARTS = (
+    ('Фильтр масляный', 'Фильтры', 'Тип: {filter_type}, Высота: {height} мм'),
+    ('Фильтр воздушный', 'Фильтры', 'Длина: {length} мм, Ширина: {width} мм'),
+    ('Фильтр салона', 'Фильтры', 'Тип: {cabin_filter}'),
+    ('Колодки тормозные', 'Тормозная система', 'Сторона установки: {axle}, Толщина: {thickness} мм'),
+    ('Диск тормозной', 'Тормозная система', 'Диаметр: {diameter} мм; Сторона установки: {axle}'),
+    ('Амортизатор', 'Подвеска колеса', 'Тип: {shock_type}, Сторона установки: {axle}'),
+    ('Рычаг подвески', 'Подвеска колеса', 'Материал: {material}, Сторона установки: {side}'),
+    ('Ступичный подшипник', 'Подвеска колеса', 'Диаметр: {bearing} мм, Сторона установки: {axle}'),
+    ('Рулевая тяга', 'Рулевое управление', 'Сторона установки: {side}, Длина: {rod} мм'),
+    ('Наконечник рулевой тяги', 'Рулевое управление', 'Сторона установки: {side}'),
+    ('Свеча зажигания', 'Электрооборудование', 'Межэлектродный зазор: {gap} мм'),
+    ('Датчик ABS', 'Электрооборудование', 'Сторона установки: {axle}; Длина кабеля: {cable} мм'),
+    ('Ремень приводной', 'Ремни и цепи', 'Количество ручейков: {ribs}, Длина: {belt} мм'),
+    ('Ремень ГРМ', 'Ремни и цепи', 'Количество зубьев: {teeth}, Ширина: {belt_width} мм'),
+    ('Прокладка ГБЦ', '', 'Материал: {gasket}, Толщина: {gasket_thickness} мм'),
+    ('Помпа водяная', '', 'Количество лопастей: {blades}'),
+)
+
+# Values of the specification placeholders
+SPEC_VALUES = {
+    'filter_type': ('Картридж', 'Навинчиваемый'),
+    'height': range(60, 160, 5),
+    'length': range(180, 400, 10),
+    'width': range(120, 260, 10),
+    'cabin_filter': ('Угольный', 'Стандартный', 'Антибактериальный'),
+    'axle': ('Передняя ось', 'Задняя ось'),
+    'thickness': range(14, 22),
+    'diameter': range(240, 360, 2),
+    'shock_type': ('Газомасляный', 'Масляный'),
+    'material': ('Алюминий', 'Сталь'),
+    'side': ('Левая', 'Правая'),
+    'bearing': range(60, 90),
+    'rod': range(250, 400, 5),
+    'gap': ('0.6', '0.7', '0.8', '0.9', '1.1'),
+    'cable': range(300, 1200, 50),
+    'ribs': range(3, 9),
+    'belt': range(700, 2200, 5),
+    'teeth': range(90, 160),
+    'belt_width': ('17', '19', '22', '25.4'),
+    'gasket': ('Металл', 'Паронит', 'Композит'),
+    'gasket_thickness': ('0.8', '1.05', '1.2', '1.5'),
+    'blades': range(5, 10),
+}
+
+VEHICLES = (
+    'Lada Vesta', 'Lada Granta', 'Kia Rio IV', 'Hyundai Solaris II', 'VW Polo sedan', 'VW Golf VII',
+    'Skoda Octavia A7', 'Toyota Camry XV70', 'Toyota RAV4 XA50', 'Renault Logan II', 'Ford Focus III',
+    'BMW 3 F30', 'Mercedes-Benz E W213', 'Nissan Qashqai J11', 'Mazda CX-5 KF',
+)
+
+STATUSES = (('Актуально', 70), ('Активный', 20), ('Снят с производства', 10))
+
+# Duplicated rows repeat one of this many previous articles
+DUPLICATE_WINDOW = 10000
+
+
+def _article(index):
+    # 7919 is prime to 10**7, so n is unique for the first 10**7 rows without
+    # following the row order
+    n = (index * 7919 + 12345) % 10 ** 7
+    brand, pattern = BRANDS[index % len(BRANDS)]
+    article = pattern.format(n=n)
+    return brand, int(article) if article.isdigit() else article
+
+
+def generate_catalog_rows(rows, duplicates=0.01, seed=0):
+    """
+    Yields `rows` synthetic catalog rows in the column order of the Excel import
+    (exports.EXPORT_HEADERS). The same arguments always yield the same rows.
+
+    Articles are unique, except for about `duplicates` of the rows, which
+    repeat a recent article with a changed description; the last one wins on import.
+    """
+    rng = random.Random(seed)
+    recent = deque(maxlen=DUPLICATE_WINDOW)
+    statuses, weights = zip(*STATUSES)
+    for index in range(rows):
+        if recent and rng.random() < duplicates:
+            row = list(rng.choice(recent))
+            row[3] += ' (уточнено)'
+            yield row
+            continue
+        brand, article = _article(index)
+        description, group, spec_pattern = PARTS[rng.randrange(len(PARTS))]
+        cross_count = rng.choice((0, 1, 1, 2, 2, 3))
+        crosses = ', '.join(
+            str(_article(rng.randrange(10 ** 7))[1]) if rng.random() < 0.5 else f"{rng.randrange(10 ** 10, 10 ** 11)}"
+            for _ in range(cross_count)
+        )
+        specifications = spec_pattern.format(**{
+            key: rng.choice(values) for key, values in SPEC_VALUES.items() if '{' + key + '}' in spec_pattern
+        })
+        row = [
+            brand,
+            article,
+            crosses,
+            description,
+            f"для {rng.choice(VEHICLES)}" if rng.random() < 0.8 else '',
+            group,
+            rng.choices(statuses, weights)[0],
+            specifications,
+        ]
+        recent.append(row)
+        yield row
+
+
+class Command(BaseCommand):
+    help = (
+        "Writes a synthetic catalog in the import format (.xlsx or .csv): auto part brands "
+        "and article numbers, crosses, the Russian product groups and a share of duplicate articles."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('output', help='File to write; its extension selects the format unless --format is given.')
+        parser.add_argument('--rows', type=int, default=10000, help='Number of data rows.')
+        parser.add_argument('--format', choices=EXPORT_FORMATS)
+        parser.add_argument('--duplicates', type=float, default=0.01, help='Share of rows repeating an earlier article.')
+        parser.add_argument('--seed', type=int, default=0, help='Seed of the generator; equal seeds give equal files.')
+
+    def handle(self, *args, **options):
+        output = options['output']
+        file_format = options['format'] or os.path.splitext(output)[1].lstrip('.').lower()
+        if file_format not in EXPORT_FORMATS:
+            raise CommandError(f"Unknown format '{file_format}', use --format {' or '.join(EXPORT_FORMATS)}.")
+        if file_format == EXPORT_XLSX:
+            try:
+                check_xlsx_size(options['rows'])
+            except ExportTooLargeError as e:
+                raise CommandError(str(e))
+        started = time.perf_counter()
+        write_catalog_file(output, file_format, generate_catalog_rows(options['rows'], options['duplicates'], options['seed']))
+        self.stdout.write(
+            f"Wrote {options['rows']} rows to {output} ({os.path.getsize(output) / 2 ** 20:.1f} MB) "
+            f"in {time.perf_counter() - started:.1f}s"
+        )
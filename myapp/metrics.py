@@ -0,0 +1,271 @@
+import logging
+import os
+import re
+import threading
+import time
+from collections import defaultdict
+from contextvars import ContextVar
+
+import redis
+from django.conf import settings
+
+logger = logging.getLogger(__name__)
+
+# Redis hash holding the totals of all processes, one field per series
+METRICS_KEY = 'metrics'
+
+# Content type of the Prometheus text exposition format
+PROMETHEUS_CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+# Upper bounds of the request latency histogram buckets (seconds)
+REQUEST_DURATION_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+
+# Metric families: name -> (type, help)
+METRICS = {
+    'http_requests_total': ('counter', 'HTTP requests, by route, method and status code.'),
+    'http_request_duration_seconds': ('histogram', 'HTTP request latency, by route and method.'),
+    'http_request_db_queries_total': ('counter', 'Database queries run by HTTP requests, by route.'),
+    'http_request_db_query_seconds_total': ('counter', 'Time spent in database queries by HTTP requests, by route.'),
+    'imports_total': ('counter', 'Finished Excel imports, by engine and status.'),
+    'import_rows_total': ('counter', 'Imported spreadsheet rows, by outcome.'),
+    'import_stage_seconds_total': ('counter', 'Time spent by imports in each stage.'),
+    'import_last_rows_per_second': ('gauge', 'Throughput of the last finished import.'),
+    'import_last_duration_seconds': ('gauge', 'Duration of the last finished import.'),
+    'db_connections_opened_total': ('counter', 'Database connections opened, by all processes.'),
+    'db_connect_seconds_total': ('counter', 'Time spent opening database connections.'),
+    'db_health_checks_total': ('counter', 'Health checks of persistent database connections.'),
+    'db_health_check_seconds_total': ('counter', 'Time spent checking persistent database connections.'),
+    'db_health_check_failures_total': ('counter', 'Dead persistent database connections replaced.'),
+    'api_cache_hits_total': ('counter', 'API response cache hits.'),
+    'api_cache_misses_total': ('counter', 'API response cache misses.'),
+}
+
+# Import report counters exported as import_rows_total{outcome=...}
+IMPORT_ROW_OUTCOMES = ('created', 'updated', 'unchanged', 'failed', 'duplicates', 'truncated')
+
+# Database queries of the current request: [count, seconds]; None outside requests
+_request_queries = ContextVar('request_queries', default=None)
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+
+
+def series_name(name, **labels):
+    """Returns the exposition name of a series, e.g. http_requests_total{method="GET"}."""
+    if not labels:
+        return name
+    return name + '{' + ','.join(f'{key}="{_escape(value)}"' for key, value in labels.items()) + '}'
+
+
+class MetricsRegistry:
+    """
+    Process-local counters, histograms and gauges.
+
+    Recording only updates memory; the pending increments are added to the
+    Redis hash METRICS_KEY, in one pipeline, at most every
+    settings.METRICS_FLUSH_INTERVAL seconds, so the totals cover every web
+    and Celery process. With an empty settings.METRICS_REDIS_URL
+    the totals stay in the process.
+
+    Periodic flushes run in a short-lived background thread, so a request
+    never waits on Redis; under ASGI recording happens on the event loop.
+    """
+    def __init__(self):
+        self._counters = defaultdict(float)
+        self._gauges = {}
+        self._totals = defaultdict(float) # Without Redis
+        self._lock = threading.Lock()
+        self._flushed_at = time.monotonic()
+        self._flush_thread = None
+        self._client = None
+
+    def inc(self, name, value=1, **labels):
+        with self._lock:
+            self._counters[series_name(name, **labels)] += value
+        self._maybe_flush()
+
+    def observe(self, name, value, buckets, **labels):
+        """Records one observation of a histogram."""
+        with self._lock:
+            # Empty buckets are recorded too: every bucket of a series must be exposed
+            for bound in buckets:
+                self._counters[series_name(f'{name}_bucket', **labels, le=bound)] += value <= bound
+            self._counters[series_name(f'{name}_bucket', **labels, le='+Inf')] += 1
+            self._counters[series_name(f'{name}_sum', **labels)] += value
+            self._counters[series_name(f'{name}_count', **labels)] += 1
+        self._maybe_flush()
+
+    def set(self, name, value, **labels):
+        with self._lock:
+            self._gauges[series_name(name, **labels)] = value
+        self._maybe_flush()
+
+    def _maybe_flush(self):
+        if self._flush_thread is not None or time.monotonic() - self._flushed_at < settings.METRICS_FLUSH_INTERVAL:
+            return
+        with self._lock:
+            # Another thread may have started the flush meanwhile
+            if self._flush_thread is not None:
+                return
+            self._flush_thread = threading.Thread(target=self._flush_in_background, name='metrics-flush', daemon=True)
+        self._flush_thread.start()
+
+    def _flush_in_background(self):
+        try:
+            self.flush()
+        finally:
+            self._flush_thread = None
+
+    def _after_fork(self):
+        # A forked worker has neither the flush thread nor whoever held the lock,
+        # and the pending increments are the parent's to flush
+        self._lock = threading.Lock()
+        self._flush_thread = None
+        self._client = None
+        self._counters = defaultdict(float)
+        self._gauges = {}
+
+    def _redis(self):
+        if self._client is None:
+            self._client = redis.Redis.from_url(settings.METRICS_REDIS_URL, socket_timeout=1)
+        return self._client
+
+    def flush(self):
+        with self._lock:
+            counters, self._counters = self._counters, defaultdict(float)
+            gauges, self._gauges = self._gauges, {}
+            self._flushed_at = time.monotonic()
+        if not counters and not gauges:
+            return
+        if not settings.METRICS_REDIS_URL:
+            with self._lock:
+                for series, value in counters.items():
+                    self._totals[series] += value
+                self._totals.update(gauges)
+            return
+        try:
+            pipeline = self._redis().pipeline(transaction=False)
+            for series, value in counters.items():
+                pipeline.hincrbyfloat(METRICS_KEY, series, value)
+            if gauges:
+                pipeline.hset(METRICS_KEY, mapping=gauges)
+            pipeline.execute()
+        except Exception as e:
+            # Dropped rather than retried, so a Redis outage cannot grow the process
+            logger.warning(f"Failed to flush {len(counters) + len(gauges)} metrics: {e}")
+
+    def totals(self):
+        """Returns the totals of all processes (series name -> value)."""
+        self.flush()
+        if not settings.METRICS_REDIS_URL:
+            with self._lock:
+                return dict(self._totals)
+        return {
+            series.decode(): float(value)
+            for series, value in self._redis().hgetall(METRICS_KEY).items()
+        }
+
+
+metrics = MetricsRegistry()
+# Pre-fork servers (bjoern, Celery) fork after importing this module
+os.register_at_fork(after_in_child=metrics._after_fork)
+
+
+def record_query(execute, sql, params, many, context):
+    """
+    Execute wrapper installed on every connection by myapp.db_backend: counts
+    the queries of the current request and their time.
+    """
+    queries = _request_queries.get()
+    if queries is None:
+        return execute(sql, params, many, context)
+    started = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        queries[0] += 1
+        queries[1] += time.perf_counter() - started
+
+
+def start_request():
+    """
+    Starts counting the database queries of a request in the current context,
+    which sync_to_async() passes on to the threads running the ORM calls.
+    """
+    return _request_queries.set([0, 0.0])
+
+
+def finish_request(token, route, method, status, seconds):
+    query_count, query_seconds = _request_queries.get()
+    _request_queries.reset(token)
+    metrics.inc('http_requests_total', route=route, method=method, status=status)
+    metrics.observe('http_request_duration_seconds', seconds, REQUEST_DURATION_BUCKETS, route=route, method=method)
+    if query_count:
+        metrics.inc('http_request_db_queries_total', query_count, route=route)
+        metrics.inc('http_request_db_query_seconds_total', query_seconds, route=route)
+
+
+def record_import(result, engine, finished=True):
+    """
+    Adds an import report to the metrics.
+
+    Args:
+        result (dict): ImportReport.as_dict() or merge_import_results() output.
+        engine (str): Import engine.
+        finished (bool): False for the subtasks of a split import, whose rows
+            and stage timings are counted while the import itself is counted
+            once, by finalize_product_import().
+    """
+    if finished:
+        metrics.inc('imports_total', engine=engine, status='success' if result['completed'] else 'failure')
+        metrics.set('import_last_rows_per_second', result['rows_per_sec'])
+        metrics.set('import_last_duration_seconds', result['duration'])
+    # The rows of a split import were counted by its subtasks
+    if 'chunks' not in result:
+        for outcome in IMPORT_ROW_OUTCOMES:
+            if result[outcome]:
+                metrics.inc('import_rows_total', result[outcome], outcome=outcome)
+        for stage, seconds in result['timings'].items():
+            metrics.inc('import_stage_seconds_total', seconds, stage=stage)
+    # Celery workers may stay idle for long after a task
+    metrics.flush()
+
+
+def _family(series):
+    name = series.split('{', 1)[0]
+    if name not in METRICS:
+        for suffix in ('_bucket', '_sum', '_count'):
+            if name.endswith(suffix) and name[:-len(suffix)] in METRICS:
+                return name[:-len(suffix)]
+    return name
+
+
+def _sort_key(series):
+    # Histogram buckets in increasing order of their bound, +Inf last
+    match = re.search(r',?le="([^"]*)"', series)
+    bound = float(match.group(1)) if match else 0.0
+    return _family(series), re.sub(r',?le="[^"]*"', '', series), bound
+
+
+def _format_value(value):
+    value = float(value)
+    return str(int(value)) if value.is_integer() else repr(round(value, 6))
+
+
+def render_metrics():
+    """
+    Returns all metrics in the Prometheus text exposition format.
+    """
+    totals = metrics.totals()
+    lines = []
+    family = None
+    for series in sorted(totals, key=_sort_key):
+        if _family(series) != family:
+            family = _family(series)
+            if family in METRICS:
+                metric_type, help_text = METRICS[family]
+                lines.append(f"# HELP {family} {help_text}")
+                lines.append(f"# TYPE {family} {metric_type}")
+        lines.append(f"{series} {_format_value(totals[series])}")
+    return '\n'.join(lines) + '\n'
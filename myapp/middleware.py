@@ -0,0 +1,46 @@
+import time
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+
+from .metrics import finish_request, start_request
+
+
+class MetricsMiddleware:
+    """
+    Counts requests and records their latency and database queries per route.
+
+    The route label is the URL pattern that matched, such as
+    'api/products/<int:product_id>', so it does not grow with the ids in the
+    paths; requests matching no pattern share the 'unmatched' label. Works
+    under both WSGI and ASGI without switching modes.
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.is_async = iscoroutinefunction(get_response)
+        if self.is_async:
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if self.is_async:
+            return self.__acall__(request)
+        started = time.perf_counter()
+        token = start_request()
+        response = self.get_response(request)
+        self._finish(token, request, response, started)
+        return response
+
+    async def __acall__(self, request):
+        started = time.perf_counter()
+        token = start_request()
+        response = await self.get_response(request)
+        self._finish(token, request, response, started)
+        return response
+
+    @staticmethod
+    def _finish(token, request, response, started):
+        match = request.resolver_match
+        route = match.route if match is not None else 'unmatched'
+        finish_request(token, route, request.method, response.status_code, time.perf_counter() - started)
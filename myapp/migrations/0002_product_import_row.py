@@ -0,0 +1,23 @@
+# Generated by Django 5.2.2 on 2026-10-17 05:14
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('myapp', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='product',
+            name='import_id',
+            field=models.CharField(editable=False, max_length=64, null=True),
+        ),
+        migrations.AddField(
+            model_name='product',
+            name='import_row',
+            field=models.IntegerField(editable=False, null=True),
+        ),
+    ]
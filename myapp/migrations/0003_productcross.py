@@ -0,0 +1,45 @@
+# Generated by Django 5.2.2 on 2026-10-17 05:16
+
+import re
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+def populate_crosses(apps, schema_editor):
+    """Parses the trading numbers of existing products into ProductCross rows."""
+    Product = apps.get_model('myapp', 'Product')
+    ProductCross = apps.get_model('myapp', 'ProductCross')
+    batch = []
+    for product_id, trading_numbers in Product.objects.values_list('id', 'trading_numbers').iterator(chunk_size=2000):
+        seen = set()
+        for number in (trading_numbers or '').split(','):
+            number = number.strip()
+            normalized = re.sub(r'[\s.\-]+', '', number).upper()
+            if normalized and normalized not in seen:
+                seen.add(normalized)
+                batch.append(ProductCross(product_id=product_id, number=number, normalized_number=normalized))
+        if len(batch) >= 2000:
+            ProductCross.objects.bulk_create(batch)
+            batch = []
+    ProductCross.objects.bulk_create(batch)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('myapp', '0002_product_import_row'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ProductCross',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('number', models.CharField(max_length=255)),
+                ('normalized_number', models.CharField(db_index=True, max_length=255)),
+                ('product', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='crosses', to='myapp.product')),
+            ],
+        ),
+        migrations.RunPython(populate_crosses, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,25 @@
+# Generated by Django 5.2.2 on 2026-10-17 05:24
+
+import django.contrib.postgres.indexes
+from django.contrib.postgres.operations import TrigramExtension
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('myapp', '0005_product_search_vector'),
+    ]
+
+    operations = [
+        # Requires the pg_trgm contrib module (shipped with the postgres Docker images)
+        TrigramExtension(),
+        migrations.AddIndex(
+            model_name='product',
+            index=django.contrib.postgres.indexes.GinIndex(fields=['article'], name='myapp_product_article_trgm_idx', opclasses=['gin_trgm_ops']),
+        ),
+        migrations.AddIndex(
+            model_name='product',
+            index=django.contrib.postgres.indexes.GinIndex(fields=['brand'], name='myapp_product_brand_trgm_idx', opclasses=['gin_trgm_ops']),
+        ),
+    ]
@@ -0,0 +1,39 @@
+# Generated by Django 5.2.2 on 2026-10-17 05:26
+
+from django.db import migrations, models
+
+# Same statement as myapp.groups.REFRESH_GROUP_PATHS_SQL at the time of this migration
+POPULATE_PATHS_SQL = """
+    WITH RECURSIVE tree (id, path) AS (
+        SELECT g.id, '/' || g.id || '/' FROM myapp_productgroup g
+        WHERE g.parent_id IS NULL
+            OR NOT EXISTS (SELECT 1 FROM myapp_productgroup p WHERE p.id = g.parent_id)
+        UNION ALL
+        SELECT g.id, t.path || g.id || '/' FROM myapp_productgroup g JOIN tree t ON g.parent_id = t.id
+    ), paths AS (
+        SELECT g.id, COALESCE(t.path, '/' || g.id || '/') AS path
+        FROM myapp_productgroup g LEFT JOIN tree t ON t.id = g.id
+    )
+    UPDATE myapp_productgroup g SET path = paths.path FROM paths
+    WHERE g.id = paths.id AND g.path IS DISTINCT FROM paths.path
+"""
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('myapp', '0006_product_trigram_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='productgroup',
+            name='path',
+            field=models.CharField(editable=False, max_length=1024, null=True),
+        ),
+        migrations.AddIndex(
+            model_name='productgroup',
+            index=models.Index(fields=['path'], name='myapp_productgroup_path_idx', opclasses=['varchar_pattern_ops']),
+        ),
+        migrations.RunSQL(POPULATE_PATHS_SQL, migrations.RunSQL.noop),
+    ]
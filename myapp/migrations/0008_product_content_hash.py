@@ -0,0 +1,32 @@
+# Generated by Django 5.2.2 on 2026-10-17 05:32
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('myapp', '0007_productgroup_path'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ProductImport',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('task_id', models.CharField(max_length=255, unique=True)),
+                ('file_hash', models.CharField(db_index=True, max_length=64)),
+                ('file_name', models.CharField(max_length=255)),
+                ('status', models.CharField(default='pending', max_length=16)),
+                ('result', models.JSONField(null=True)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('finished_at', models.DateTimeField(null=True)),
+                ('product_count', models.BigIntegerField(null=True)),
+            ],
+        ),
+        migrations.AddField(
+            model_name='product',
+            name='content_hash',
+            field=models.CharField(editable=False, max_length=32, null=True),
+        ),
+    ]
@@ -0,0 +1,46 @@
+# Generated by Django 5.2.2 on 2026-10-17 05:55
+
+import django.contrib.postgres.indexes
+from django.db import migrations, models
+
+
+# Parses "Key: value" pairs separated by commas, semicolons or newlines into a JSON
+# object. A separator only splits where the next pair starts (text followed by a
+# colon), so values may contain commas, e.g. "Weight: 1,5kg". Text before the first
+# colon of a pair is the key, the rest is the value, both trimmed; parts without a
+# colon are skipped, and the last of repeated keys wins.
+CREATE_PARSE_SPECIFICATIONS = r"""
+    CREATE FUNCTION myapp_parse_specifications(specifications text) RETURNS jsonb
+    LANGUAGE sql IMMUTABLE PARALLEL SAFE RETURNS NULL ON NULL INPUT AS $$
+        SELECT COALESCE(jsonb_object_agg(key, value ORDER BY ordinal), '{}'::jsonb)
+        FROM (
+            SELECT
+                btrim(split_part(part, ':', 1), E' \t\r\n') AS key,
+                btrim(substr(part, strpos(part, ':') + 1), E' \t\r\n') AS value,
+                ordinal
+            FROM regexp_split_to_table(specifications, '[,;\n]\s*(?=[^,;:\n]+:)') WITH ORDINALITY AS parts (part, ordinal)
+            WHERE strpos(part, ':') > 0
+        ) pairs
+        WHERE key <> ''
+    $$
+"""
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('myapp', '0009_product_upload'),
+    ]
+
+    operations = [
+        migrations.RunSQL(CREATE_PARSE_SPECIFICATIONS, 'DROP FUNCTION myapp_parse_specifications(text)'),
+        migrations.AddField(
+            model_name='product',
+            name='spec_attributes',
+            field=models.GeneratedField(db_persist=True, expression=models.Func(models.F('specifications'), function='myapp_parse_specifications', output_field=models.JSONField()), output_field=models.JSONField()),
+        ),
+        migrations.AddIndex(
+            model_name='product',
+            index=django.contrib.postgres.indexes.GinIndex(fields=['spec_attributes'], name='myapp_product_spec_attrs_idx', opclasses=['jsonb_path_ops']),
+        ),
+    ]
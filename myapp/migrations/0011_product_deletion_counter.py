@@ -0,0 +1,44 @@
+from django.db import migrations, models
+
+
+# Counts the DELETE and TRUNCATE statements run on the product table, including raw
+# SQL ones that leave no tombstone, in a sequence that is cheap to read at any catalog
+# size. A sequence is not transactional: rolled back statements are counted too
+CREATE_DELETION_COUNTER = """
+    CREATE SEQUENCE myapp_product_deletions;
+    CREATE FUNCTION myapp_count_product_deletions() RETURNS trigger LANGUAGE plpgsql AS $$
+    BEGIN
+        PERFORM nextval('myapp_product_deletions');
+        RETURN NULL;
+    END
+    $$;
+    CREATE TRIGGER myapp_product_deletions AFTER DELETE OR TRUNCATE ON myapp_product
+        FOR EACH STATEMENT EXECUTE FUNCTION myapp_count_product_deletions();
+"""
+
+DROP_DELETION_COUNTER = """
+    DROP TRIGGER myapp_product_deletions ON myapp_product;
+    DROP FUNCTION myapp_count_product_deletions();
+    DROP SEQUENCE myapp_product_deletions;
+"""
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('myapp', '0010_product_spec_attributes'),
+    ]
+
+    operations = [
+        migrations.RunSQL(CREATE_DELETION_COUNTER, DROP_DELETION_COUNTER),
+        # Imports recorded with a product count are never reused again
+        migrations.RemoveField(
+            model_name='productimport',
+            name='product_count',
+        ),
+        migrations.AddField(
+            model_name='productimport',
+            name='product_deletions',
+            field=models.BigIntegerField(null=True),
+        ),
+    ]
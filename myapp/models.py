@@ -1,8 +1,25 @@
+import uuid
+
+from django.conf import settings
+from django.contrib.postgres.indexes import GinIndex
+from django.contrib.postgres.search import SearchVector, SearchVectorField
 from django.db import models
+from django.db.models import F
+from django.db.models.functions import Now
 
 class ProductGroup(models.Model):
     name = models.CharField(max_length=255)
     parent_id = models.BigIntegerField(null=True)
+    # Materialized path of ids from the root, e.g. "/1/5/"; maintained by
+    # groups.refresh_group_paths() whenever groups are created or re-parented
+    path = models.CharField(max_length=1024, null=True, editable=False)
+
+    class Meta:
+        indexes = [
+            # Prefix (LIKE 'path%') lookups of a subtree, independent of the collation
+            models.Index(fields=['path'], opclasses=['varchar_pattern_ops'], name='myapp_productgroup_path_idx'),
+        ]
+
     def __str__(self):
         return self.name
 
@@ -15,6 +32,118 @@ class Product(models.Model):
     product_group = models.ForeignKey(ProductGroup, on_delete=models.SET_NULL, null=True)
     product_status = models.CharField(max_length=255)
     specifications = models.TextField()
+    # Import run and spreadsheet row that last wrote this product, used to resolve
+    # conflicts between parallel import subtasks (the last row of the file wins)
+    import_id = models.CharField(max_length=64, null=True, editable=False)
+    import_row = models.IntegerField(null=True, editable=False)
+    # Hash of the values last written by an import, so unchanged rows can be skipped;
+    # every other write path resets it to NULL
+    content_hash = models.CharField(max_length=32, null=True, editable=False)
+    # Change tracking for delta syncs. The database defaults cover raw SQL inserts;
+    # raw SQL updates must set updated_at = now() themselves
+    created_at = models.DateTimeField(auto_now_add=True, db_default=Now(), db_index=True)
+    updated_at = models.DateTimeField(auto_now=True, db_default=Now())
+    # Full-text search document, computed by PostgreSQL on every insert and update,
+    # so the GIN index below is maintained incrementally by every write path
+    search_vector = models.GeneratedField(
+        expression=(
+            SearchVector('additional_name', weight='A', config='russian')
+            + SearchVector('description', weight='B', config='russian')
+            + SearchVector('specifications', weight='C', config='russian')
+        ),
+        output_field=SearchVectorField(),
+        db_persist=True,
+    )
+    # Attributes parsed from specifications, e.g. "Dimension: 10x10, Weight: 1,5kg" ->
+    # {"Dimension": "10x10", "Weight": "1,5kg"}. Computed by PostgreSQL (the function is
+    # created by migration 0010) on every insert and update, like search_vector.
+    spec_attributes = models.GeneratedField(
+        expression=models.Func(F('specifications'), function='myapp_parse_specifications', output_field=models.JSONField()),
+        output_field=models.JSONField(),
+        db_persist=True,
+    )
+
+    class Meta:
+        indexes = [
+            # Keyset order of GET /api/articles/changes
+            models.Index(fields=['updated_at', 'id'], name='myapp_product_updated_idx'),
+            # GET /api/products/search: full-text match, and fuzzy article/brand match (pg_trgm)
+            GinIndex(fields=['search_vector'], name='myapp_product_search_idx'),
+            GinIndex(fields=['article'], opclasses=['gin_trgm_ops'], name='myapp_product_article_trgm_idx'),
+            GinIndex(fields=['brand'], opclasses=['gin_trgm_ops'], name='myapp_product_brand_trgm_idx'),
+            # GET /api/products/filter: attribute containment (@>)
+            GinIndex(fields=['spec_attributes'], opclasses=['jsonb_path_ops'], name='myapp_product_spec_attrs_idx'),
+        ]
+
     def __str__(self):
         return self.article
 
+
+class ProductCross(models.Model):
+    """
+    One cross number of a product, parsed from Product.trading_numbers, with an
+    indexed canonical form for fast "which articles cross to number X" lookups.
+    """
+    product = models.ForeignKey(Product, on_delete=models.CASCADE, related_name='crosses')
+    number = models.CharField(max_length=255) # As written in trading_numbers
+    normalized_number = models.CharField(max_length=255, db_index=True) # Uppercase, no spaces, dashes or dots
+    def __str__(self):
+        return self.number
+
+
+class ProductTombstone(models.Model):
+    """
+    Record of a deleted product, so delta syncs can report deletions.
+    Written by a post_delete receiver; rows deleted with raw SQL or TRUNCATE leave no tombstone.
+    """
+    product_id = models.BigIntegerField()
+    article = models.CharField(max_length=255)
+    deleted_at = models.DateTimeField(auto_now_add=True, db_index=True)
+    def __str__(self):
+        return self.article
+
+
+class ProductImport(models.Model):
+    """
+    One uploaded file and the result of its import, keyed by the SHA-256 of the
+    file so that an identical re-upload can return the previous result.
+    """
+    STATUS_PENDING = 'pending'
+    STATUS_SUCCESS = 'success'
+    STATUS_FAILURE = 'failure'
+
+    task_id = models.CharField(max_length=255, unique=True) # Id to poll with GET /api/import_status/{task_id}
+    file_hash = models.CharField(max_length=64, db_index=True)
+    file_name = models.CharField(max_length=255)
+    status = models.CharField(max_length=16, default=STATUS_PENDING)
+    result = models.JSONField(null=True) # ImportReport.as_dict() of the finished import
+    created_at = models.DateTimeField(auto_now_add=True)
+    finished_at = models.DateTimeField(null=True)
+    # changes.get_product_deletions() when the import finished; a different value means
+    # products were deleted since (even with raw SQL or TRUNCATE), so the file must be
+    # imported again
+    product_deletions = models.BigIntegerField(null=True)
+    def __str__(self):
+        return self.file_name
+
+
+class ProductUpload(models.Model):
+    """
+    A resumable upload of an Excel file, sent in chunks through /api/uploads.
+    Chunks are appended to `file_path` in order; `received` is the offset at
+    which the next one must start.
+    """
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    user = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE)
+    file_name = models.CharField(max_length=255) # Name of the file on the client
+    file_path = models.CharField(max_length=1024)
+    size = models.BigIntegerField() # Announced total size in bytes
+    received = models.BigIntegerField(default=0)
+    # importers.FileHasher state after `received` bytes, and its digest once all were received
+    block_digests = models.BinaryField(default=b'')
+    file_hash = models.CharField(max_length=64, null=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True, db_index=True)
+
+    def __str__(self):
+        return self.file_name
@@ -0,0 +1,160 @@
+import time
+import logging
+
+from celery.result import AsyncResult, GroupResult
+from django.conf import settings
+
+from .models import ProductImport
+
+logger = logging.getLogger(__name__)
+
+
+class ProgressReporter:
+    """
+    Throttled PROGRESS state updates for a long-running Celery task.
+
+    Every update_state() call is a write to the result backend (Redis), so
+    instead of reporting every row, the reporter only emits once `every_rows`
+    rows have been processed or `interval_ms` milliseconds have passed since
+    the previous emit, whichever comes first. Each emit carries rows/sec,
+    the ETA and the error count of the attached ImportReport, if any.
+
+    Usage:
+        progress = ProgressReporter(self, report, total_rows=1000)
+        for batch in batches:
+            ...
+            progress.advance(len(batch), current_row=batch[-1].row_number)
+    """
+    def __init__(self, task, report=None, total_rows=None, every_rows=None, interval_ms=None):
+        self.task = task
+        self.report = report
+        self.total_rows = total_rows
+        self.every_rows = every_rows or settings.PRODUCT_IMPORT_PROGRESS_EVERY_ROWS
+        self.interval = (interval_ms or settings.PRODUCT_IMPORT_PROGRESS_INTERVAL_MS) / 1000
+        self.processed_rows = 0
+        self.current_row = None
+        self.started_at = time.monotonic()
+        self._emitted_at = self.started_at
+        self._emitted_rows = 0
+
+    def advance(self, rows, current_row=None):
+        """
+        Records `rows` more processed rows and emits if the throttle allows it.
+        """
+        self.processed_rows += rows
+        if current_row is not None:
+            self.current_row = current_row
+        if (
+            self.processed_rows - self._emitted_rows >= self.every_rows
+            or time.monotonic() - self._emitted_at >= self.interval
+        ):
+            self.emit()
+
+    def track(self, rows):
+        """
+        Yields `rows` unchanged, advancing the progress for each one. Used for
+        engines that consume a flat row stream, such as COPY.
+        """
+        for row in rows:
+            yield row
+            self.advance(1, current_row=row.row_number)
+
+    def snapshot(self):
+        elapsed = time.monotonic() - self.started_at
+        rows_per_sec = self.processed_rows / elapsed if elapsed > 0 else 0.0
+        eta_seconds = None
+        if self.total_rows and rows_per_sec:
+            eta_seconds = round(max(self.total_rows - self.processed_rows, 0) / rows_per_sec, 1)
+        return {
+            'current_row': self.current_row,
+            'processed_rows': self.processed_rows,
+            'total_rows': self.total_rows,
+            'rows_per_sec': round(rows_per_sec, 1),
+            'eta_seconds': eta_seconds,
+            'errors': self.report.failed if self.report else 0,
+        }
+
+    def emit(self):
+        self._emitted_at = time.monotonic()
+        self._emitted_rows = self.processed_rows
+        if self.task.request.id: # Not bound to a task id when called directly
+            self.task.update_state(state='PROGRESS', meta=self.snapshot())
+
+
+def _merge_progress(progresses):
+    """
+    Combines the PROGRESS meta of the subtasks of a split import.
+    """
+    processed_rows = sum(p.get('processed_rows') or 0 for p in progresses)
+    rows_per_sec = sum(p.get('rows_per_sec') or 0 for p in progresses)
+    total_rows = sum(p.get('total_rows') or 0 for p in progresses) or None
+    eta_seconds = None
+    if total_rows and rows_per_sec:
+        eta_seconds = round(max(total_rows - processed_rows, 0) / rows_per_sec, 1)
+    return {
+        'current_row': None,
+        'processed_rows': processed_rows,
+        'total_rows': total_rows,
+        'rows_per_sec': round(rows_per_sec, 1),
+        'eta_seconds': eta_seconds,
+        'errors': sum(p.get('errors') or 0 for p in progresses),
+    }
+
+
+def get_task_status(task_id):
+    """
+    Reads the state of a single Celery task from the result backend.
+
+    Returns:
+        dict: 'task_id', 'state', and 'progress', 'result' or 'error' when available.
+    """
+    result = AsyncResult(task_id)
+    status = {'task_id': task_id, 'state': result.state, 'progress': None, 'result': None, 'error': None}
+
+    if result.state == 'PROGRESS':
+        status['progress'] = result.info
+    elif result.state == 'SUCCESS':
+        status['result'] = result.result
+    elif result.state == 'FAILURE':
+        status['error'] = str(result.info)
+    return status
+
+
+def get_import_status(task_id):
+    """
+    Reads the state of an import from the Celery result backend. The database
+    is only queried once the backend no longer knows the task, e.g. for a
+    reused import whose result has expired from the backend.
+
+    `task_id` is either a single import task, or the id shared by the chord
+    header group and the finalize_product_import callback of a split import.
+    While the callback is pending, the PROGRESS meta of the subtasks is merged.
+
+    Returns:
+        dict: 'task_id', 'state', and 'progress', 'result' or 'error' when available.
+    """
+    status = get_task_status(task_id)
+    if status['state'] == 'PENDING':
+        group_result = GroupResult.restore(task_id)
+        if group_result is not None:
+            children = [child for child in group_result.results if child.state in ('PROGRESS', 'SUCCESS')]
+            if children:
+                status['state'] = 'PROGRESS'
+                status['progress'] = _merge_progress([
+                    child.info if child.state == 'PROGRESS' else {
+                        'processed_rows': child.result['total_rows'],
+                        'total_rows': child.result['total_rows'],
+                        'errors': child.result['failed'],
+                    }
+                    for child in children
+                ])
+                status['progress']['chunks_done'] = sum(1 for child in children if child.state == 'SUCCESS')
+                status['progress']['chunks'] = len(group_result.results)
+        else:
+            product_import = ProductImport.objects.filter(task_id=task_id).exclude(
+                status=ProductImport.STATUS_PENDING,
+            ).first()
+            if product_import is not None:
+                status['state'] = 'SUCCESS'
+                status['result'] = product_import.result
+    return status
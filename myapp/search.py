@@ -0,0 +1,79 @@
+from django.contrib.postgres.search import SearchQuery, SearchRank, TrigramWordSimilarity
+from django.db.models import F, FloatField, Q
+from django.db.models.functions import Cast, Greatest
+
+from .models import Product
+
+# Text search configuration of Product.search_vector
+SEARCH_CONFIG = 'russian'
+
+
+class InvalidSearchCursorError(ValueError):
+    pass
+
+
+def encode_search_cursor(rank, product_id):
+    return f"{rank!r}_{product_id}"
+
+
+def decode_search_cursor(cursor):
+    try:
+        rank, product_id = cursor.split('_')
+        return float(rank), int(product_id)
+    except ValueError:
+        raise InvalidSearchCursorError(f"Invalid cursor '{cursor}'.")
+
+
+def search_products(q, limit, brand=None, group_id=None, after=None):
+    """
+    Searches products by full text and by fuzzy article/brand match.
+
+    A product matches if its search_vector (additional name, description and
+    specifications) matches `q` as a web-style query, or if `q` is similar to a
+    word of its article or brand (pg_trgm word similarity). Both conditions
+    are served by GIN indexes. Results are ordered by rank (text rank plus the
+    best trigram similarity), then by id, and paginated with a keyset cursor
+    on that order instead of OFFSET.
+
+    Args:
+        q (str): The search text.
+        limit (int): Maximum number of results.
+        brand (str): Only return products of this brand.
+        group_id (int): Only return products of this product group.
+        after (str): Cursor from a previous call.
+
+    Returns:
+        dict: 'items' (product dicts with 'rank') and 'next_cursor' (None on the last page).
+
+    Raises:
+        InvalidSearchCursorError: If `after` is malformed.
+    """
+    query = SearchQuery(q, search_type='websearch', config=SEARCH_CONFIG)
+    products = (
+        Product.objects
+        .filter(Q(search_vector=query) | Q(article__trigram_word_similar=q) | Q(brand__trigram_word_similar=q))
+        # Ranks are real; as double precision they survive the round trip through the cursor exactly
+        .annotate(rank=Cast(SearchRank(F('search_vector'), query) + Greatest(
+            TrigramWordSimilarity(q, 'article'), TrigramWordSimilarity(q, 'brand'),
+        ), FloatField()))
+    )
+    if brand:
+        products = products.filter(brand=brand)
+    if group_id is not None:
+        products = products.filter(product_group_id=group_id)
+    if after:
+        after_rank, after_id = decode_search_cursor(after)
+        products = products.filter(Q(rank__lt=after_rank) | Q(rank=after_rank, id__gt=after_id))
+
+    # Fetch one extra row to know whether there is a next page
+    rows = list(
+        products.order_by('-rank', 'id').values(
+            'id', 'article', 'brand', 'trading_numbers', 'additional_name', 'description',
+            'product_group_id', 'rank',
+        )[:limit + 1]
+    )
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        next_cursor = encode_search_cursor(rows[-1]['rank'], rows[-1]['id'])
+    return {'items': rows, 'next_cursor': next_cursor}
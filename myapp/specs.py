@@ -0,0 +1,123 @@
+from collections import defaultdict
+
+from django.db import connection
+from django.db.models import Q
+
+from .models import Product
+
+# Query parameters filtering on Product.spec_attributes, e.g. ?spec.Weight=1kg
+SPEC_PARAM_PREFIX = 'spec.'
+
+
+class InvalidSpecFilterError(ValueError):
+    pass
+
+
+def parse_spec_filters(query):
+    """
+    Collects the attribute filters of a request from its `spec.<attribute>` parameters.
+
+    Args:
+        query (QueryDict): request.GET.
+
+    Returns:
+        dict: Attribute name -> list of accepted values.
+
+    Raises:
+        InvalidSpecFilterError: If a parameter names no attribute.
+    """
+    filters = {}
+    for param, values in query.lists():
+        if not param.startswith(SPEC_PARAM_PREFIX):
+            continue
+        key = param[len(SPEC_PARAM_PREFIX):]
+        if not key:
+            raise InvalidSpecFilterError(f"'{param}' names no attribute, use e.g. '{SPEC_PARAM_PREFIX}Weight'.")
+        filters[key] = list(dict.fromkeys(values))
+    return filters
+
+
+def filter_by_specs(products, spec_filters):
+    """
+    Restricts a Product queryset to the products having all the attributes of
+    `spec_filters`, each with one of its listed values.
+
+    The conditions are JSONB containment (@>) tests served by the GIN index on
+    spec_attributes. Attributes with a single value are merged into one test.
+    """
+    single = {key: values[0] for key, values in spec_filters.items() if len(values) == 1}
+    if single:
+        products = products.filter(spec_attributes__contains=single)
+    for key, values in spec_filters.items():
+        if len(values) > 1:
+            any_value = Q()
+            for value in values:
+                any_value |= Q(spec_attributes__contains={key: value})
+            products = products.filter(any_value)
+    return products
+
+
+def get_spec_facets(products, max_values):
+    """
+    Counts the products of a queryset per attribute value, with one aggregate query.
+
+    Args:
+        products (QuerySet): The products to count.
+        max_values (int): Most frequent values kept per attribute.
+
+    Returns:
+        list: {'key', 'values': [{'value', 'count'}]} per attribute, sorted by
+            attribute name, values by descending count.
+    """
+    sql, params = products.values('spec_attributes').query.sql_with_params()
+    with connection.cursor() as cursor:
+        cursor.execute(f"""
+            SELECT key, value, count FROM (
+                SELECT attribute.key, attribute.value, count(*) AS count,
+                    row_number() OVER (PARTITION BY attribute.key ORDER BY count(*) DESC, attribute.value) AS position
+                FROM ({sql}) products CROSS JOIN LATERAL jsonb_each_text(products.spec_attributes) attribute
+                GROUP BY attribute.key, attribute.value
+            ) facets
+            WHERE position <= %s
+            ORDER BY key, position
+        """, [*params, max_values])
+        rows = cursor.fetchall()
+    facets = defaultdict(list)
+    for key, value, count in rows:
+        facets[key].append({'value': value, 'count': count})
+    return [{'key': key, 'values': values} for key, values in facets.items()]
+
+
+def filter_products(spec_filters, limit, brand=None, group_id=None, after=0, facets=False, max_facet_values=50):
+    """
+    Returns one keyset-paginated page of the products matching attribute filters.
+
+    Args:
+        spec_filters (dict): Attribute name -> accepted values, see parse_spec_filters().
+        limit (int): Page size.
+        brand (str): Only return products of this brand.
+        group_id (int): Only return products of this product group.
+        after (int): Id of the last product of the previous page.
+        facets (bool): Also count all matching products per attribute value.
+        max_facet_values (int): Most frequent values returned per attribute.
+
+    Returns:
+        dict: 'items', 'next_cursor' (None on the last page) and, with `facets`,
+            'facets' as returned by get_spec_facets().
+    """
+    products = filter_by_specs(Product.objects.all(), spec_filters)
+    if brand:
+        products = products.filter(brand=brand)
+    if group_id is not None:
+        products = products.filter(product_group_id=group_id)
+
+    # Fetch one extra row to know whether there is a next page
+    rows = list(
+        products.filter(id__gt=after).order_by('id')
+        .values('id', 'article', 'brand', 'trading_numbers', 'specifications', 'spec_attributes')[:limit + 1]
+    )
+    next_cursor = rows[limit - 1]['id'] if len(rows) > limit else None
+    result = {'items': rows[:limit], 'next_cursor': next_cursor}
+    if facets:
+        result['facets'] = get_spec_facets(products, max_facet_values)
+    return result
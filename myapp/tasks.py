@@ -1,170 +1,344 @@
-import pandas as pd
-from celery import shared_task
-from django.db import transaction
-from .models import Product, ProductGroup
+from itertools import chain
+from uuid import uuid4
+from celery import chord, group, shared_task
+from celery.result import AsyncResult
+from django.conf import settings
+from django.db.models.functions import Now
+from .cache import bump_catalog_version
+from .changes import get_product_deletions
+from .exports import delete_expired_exports, export_products, export_url
+from .importers import (
+    ENGINE_COPY, EmptyFileError, ExcelBatchReader, ImportReport, copy_import_products, count_excel_rows, hash_file,
+    merge_import_results, merge_rejects_files, resolve_product_groups, upsert_products,
+)
+from .metrics import record_import
+from .models import Product, ProductImport
+from .progress import ProgressReporter
 import os
+import time
 import logging
 
 logger = logging.getLogger(__name__)
 
 @shared_task(bind=True) # bind=True allows access to self (the task instance)
-def import_products_from_excel(self, file_path):
+def import_products_from_excel(self, file_path, engine=None, chunk_size=None, start_row=None, end_row=None, import_id=None):
     """
     Celery task to import product data from an Excel file.
 
+    The sheet is streamed in batches of `chunk_size` rows, so memory use does not
+    grow with the size of the file. With the default 'bulk' engine, the product
+    groups of each batch are resolved first, then the batch is written with one
+    INSERT ... ON CONFLICT statement and committed on its own, so a failing row
+    never rolls back the rest of the file. The 'copy' engine instead streams all
+    rows into an UNLOGGED staging table with COPY and merges them in one statement.
+
+    Rows are normalized and validated by ExcelBatchReader before either engine
+    sees them. Rejected, superseded and truncated rows are listed with their
+    reason in a CSV rejects file under settings.PRODUCT_EXPORT_DIR, downloadable
+    from the 'rejects_url' of the result and removed with expired exports.
+
+    When started by start_product_import() for a large file, the task only
+    imports the rows between `start_row` and `end_row`, and the file is left
+    in place for finalize_product_import() to remove.
+
     Args:
         file_path (str): The absolute path to the uploaded Excel file.
+        engine (str): 'bulk' or 'copy'; defaults to settings.PRODUCT_IMPORT_ENGINE.
+        chunk_size (int): Rows per batch; defaults to settings.PRODUCT_IMPORT_CHUNK_SIZE.
+        start_row (int): First sheet row to import (1-based, header is row 1).
+        end_row (int): Last sheet row to import; None for the end of the sheet.
+        import_id (str): Identifier shared by the subtasks of a split import;
+            defaults to the task id.
+
+    Returns:
+        dict: Created/updated/failed counts, the per-row error report and the duration.
     """
     task_id = self.request.id
-    logger.info(f"Task {task_id}: Starting Excel import for file: {file_path}")
+    engine = engine or settings.PRODUCT_IMPORT_ENGINE
+    chunk_size = chunk_size or settings.PRODUCT_IMPORT_CHUNK_SIZE
+    import_id = import_id or task_id
+    is_part = start_row is not None
+    report = ImportReport(rejects_path=rejects_path(import_id, start_row))
+    logger.info(
+        f"Task {task_id}: Starting Excel import ({engine} engine) for file: {file_path}"
+        + (f", rows {start_row}-{end_row or 'end'}" if is_part else "")
+    )
 
     try:
-        # Read the Excel file into a pandas DataFrame
-        # Assumes the first row contains headers.
-        df = pd.read_excel(file_path, engine='openpyxl')
-
-        # Define a mapping from expected Excel column headers (in Russian, case-insensitive)
-        # to Django model field names.
-        column_mapping = {
-            'бренд': 'brand',
-            'уникальный артикул': 'article',
-            'торговые номера': 'trading_numbers',
-            'описание': 'description',
-            'дополнительное описание': 'additional_name',
-            'товарная группа': 'product_group_name', # Custom key for FK handling
-            'статус изделия': 'product_status',
-            'характеристики': 'specifications',
-        }
-
-        # Normalize DataFrame column names: strip whitespace and convert to lowercase
-        df.columns = df.columns.str.strip().str.lower()
-
-        # Rename columns based on the mapping
-        current_cols = df.columns.tolist()
-        rename_dict = {
-            excel_col.lower(): model_field
-            for excel_col, model_field in column_mapping.items()
-            if excel_col.lower() in current_cols
-        }
-        df = df.rename(columns=rename_dict)
-
-        # Ensure only relevant columns are kept for processing
-        valid_model_fields = set(column_mapping.values())
-        df = df[[col for col in df.columns if col in valid_model_fields]]
-
-        # --- New logic for product groups ---
-
-        # 1. Get or create the parent "Автозапчасти" group
-        # This will be the default group if no other specific group is found or if it's the parent.
-        auto_parts_group, created = ProductGroup.objects.get_or_create(
-            name="Автозапчасти",
-            defaults={'parent_id': None} # Ensure parent_id is null for the top-level group
+        with ExcelBatchReader(file_path, chunk_size, start_row, end_row, report) as reader:
+            # PROGRESS updates are throttled rather than written for every row
+            progress = ProgressReporter(self, report, total_rows=reader.total_rows)
+            if engine == ENGINE_COPY:
+                # COPY consumes the reader; copy_import_products() times its own stages
+                copy_import_products(
+                    progress.track(chain.from_iterable(reader)), reader.fields, report, import_id, is_part,
+                )
+            else:
+                groups = None
+                for batch in reader:
+                    # Resolve the product groups of the batch before writing any of its products
+                    with report.timing('groups'):
+                        groups = resolve_product_groups({row.product_group_name for row in batch}, groups)
+                    with report.timing('write'):
+                        upsert_products(batch, reader.fields, groups, report, import_id, is_part)
+                    progress.advance(len(batch), current_row=batch[-1].row_number)
+
+        report.completed = True
+        logger.info(
+            f"Task {task_id}: Successfully processed Excel file: {file_path} "
+            f"(created: {report.created}, updated: {report.updated}, unchanged: {report.unchanged}, "
+            f"failed: {report.failed}, duplicates: {report.duplicates}, truncated: {report.truncated}; "
+            + ', '.join(f"{stage} {seconds:.2f}s" for stage, seconds in report.timings.items()) + ")"
         )
-        if created:
-            logger.info(f"Task {task_id}: Created new parent ProductGroup: {auto_parts_group.name}")
-        else:
-            logger.info(f"Task {task_id}: Found existing parent ProductGroup: {auto_parts_group.name}")
-
-        with transaction.atomic():
-            for index, row in df.iterrows():
-                row_number = index + 2 # Excel rows are 1-indexed, and we start from the second row (after headers)
-                self.update_state(state='PROGRESS', meta={'current_row': row_number, 'total_rows': len(df)})
-                try:
-                    product_group_name_from_excel = row.get('product_group_name')
-                    product_group_instance = None # Initialize as None
-
-                    # Clean product group name from excel
-                    if product_group_name_from_excel and pd.notna(product_group_name_from_excel):
-                        product_group_name_from_excel = str(product_group_name_from_excel).strip()
-                    else:
-                        product_group_name_from_excel = "" # Treat NaN or empty as empty string
-
-                    # Determine the correct product group and its parent
-                    if not product_group_name_from_excel:
-                        # If group is not specified in Excel, default to "Автозапчасти"
-                        product_group_instance = auto_parts_group
-                        logger.info(f"Task {task_id}: Row {row_number}: No product group specified, defaulting to '{auto_parts_group.name}'.")
-                    elif product_group_name_from_excel == "Автозапчасти":
-                        # If it's explicitly "Автозапчасти", use the already fetched instance
-                        product_group_instance = auto_parts_group
-                        # Ensure its parent_id is None, in case it was somehow linked before
-                        if product_group_instance.parent_id is not None:
-                            product_group_instance.parent_id = None
-                            product_group_instance.save()
-                            logger.info(f"Task {task_id}: Updated '{product_group_instance.name}' parent_id to None.")
-                    elif product_group_name_from_excel in ["Рулевое управление", "Подвеска колеса"]:
-                        # For child groups, create/get them and set their parent_id
-                        child_group, created = ProductGroup.objects.get_or_create(
-                            name=product_group_name_from_excel
-                        )
-                        if created:
-                            logger.info(f"Task {task_id}: Created new child ProductGroup: {child_group.name}")
-                        
-                        # Set or update parent_id to auto_parts_group's ID
-                        if child_group.parent_id != auto_parts_group.id:
-                            child_group.parent_id = auto_parts_group.id
-                            child_group.save()
-                            logger.info(f"Task {task_id}: Linked '{child_group.name}' to parent '{auto_parts_group.name}'.")
-                        
-                        product_group_instance = child_group
-                    else:
-                        # For any other product group name found in Excel
-                        product_group_instance, created = ProductGroup.objects.get_or_create(
-                            name=product_group_name_from_excel
-                        )
-                        if created:
-                            logger.info(f"Task {task_id}: Created non-auto-related ProductGroup: {product_group_instance.name}")
-                        # Other groups typically don't have a parent_id by this logic unless explicitly defined elsewhere
-                        # We don't touch their parent_id if it's already set by something else.
-
-                    # Prepare product data, excluding the 'product_group_name' placeholder
-                    product_data = {
-                        key: value for key, value in row.items()
-                        if key not in ['product_group_name'] # Exclude the placeholder field
-                    }
-
-                    # Clean up data: convert NaN to empty strings and ensure all values are strings
-                    for key, value in product_data.items():
-                        if pd.isna(value):
-                            product_data[key] = ''
-                        elif not isinstance(value, str):
-                            product_data[key] = str(value)
-
-                    # Add the ProductGroup foreign key instance
-                    product_data['product_group'] = product_group_instance
-
-                    # Check for 'article' as it's unique and required for update_or_create
-                    if 'article' not in product_data or not product_data['article']:
-                        logger.error(f"Task {task_id}: Row {row_number}: 'article' is missing or empty. Skipping product creation/update.")
-                        continue # Skip to the next row if article is missing
-
-                    # Create or update Product instance using 'article' as the unique identifier
-                    product, created = Product.objects.update_or_create(
-                        article=product_data['article'],
-                        defaults=product_data
-                    )
-                    if created:
-                        logger.info(f"Task {task_id}: Created new Product: {product.article}")
-                    else:
-                        logger.info(f"Task {task_id}: Updated existing Product: {product.article}")
-
-                except KeyError as e:
-                    logger.error(f"Task {task_id}: Row {row_number}: Missing expected column: {e}. Row data: {row.to_dict()}")
-                except Exception as e:
-                    logger.error(f"Task {task_id}: Error processing row {row_number}: {e}. Row data: {row.to_dict()}")
-                    # Continue to the next row even if one fails
-                    continue
-
-        logger.info(f"Task {task_id}: Successfully processed Excel file: {file_path}")
 
     except FileNotFoundError:
         logger.error(f"Task {task_id}: Error: File not found at {file_path}")
-    except pd.errors.EmptyDataError:
+    except EmptyFileError:
         logger.error(f"Task {task_id}: Error: The Excel file {file_path} is empty.")
     except Exception as e:
         logger.exception(f"Task {task_id}: An unexpected error occurred during Excel processing for file {file_path}: {e}")
     finally:
-        # Clean up the temporary file after processing
+        report.close()
+        # Drop cached API responses as soon as the imported rows are committed
+        if report.created or report.updated:
+            bump_catalog_version()
+        # Clean up the temporary file after processing, unless other parts still need it
+        if not is_part and os.path.exists(file_path):
+            os.remove(file_path)
+            logger.info(f"Task {task_id}: Cleaned up temporary file: {file_path}")
+
+    result = report.as_dict()
+    record_import(result, engine, finished=not is_part)
+    if not is_part:
+        result['rejects_url'] = _rejects_url(result['rejects_file'])
+        _finish_product_import(task_id, result)
+    return result
+
+
+def rejects_path(import_id, start_row=None):
+    """
+    Returns the path of the rejects file of an import, or of one of its parts.
+    """
+    suffix = f"_{start_row}" if start_row is not None else ''
+    return os.path.join(settings.PRODUCT_EXPORT_DIR, f"rejects_{import_id}{suffix}.csv")
+
+
+def _rejects_url(file_name):
+    return export_url(os.path.join(settings.PRODUCT_EXPORT_DIR, file_name)) if file_name else None
+
+
+def _finish_product_import(task_id, result):
+    # Records the result of an import started by enqueue_product_import(), if any
+    ProductImport.objects.filter(task_id=task_id).update(
+        status=ProductImport.STATUS_SUCCESS if result['completed'] else ProductImport.STATUS_FAILURE,
+        result=result,
+        finished_at=Now(),
+        product_deletions=get_product_deletions(),
+    )
+
+
+@shared_task(bind=True)
+def finalize_product_import(self, results, file_path, started_at, engine=None):
+    """
+    Chord callback of a split import: aggregates the subtask results and removes the file.
+
+    Args:
+        results (list): Result dicts returned by the import_products_from_excel subtasks.
+        file_path (str): The absolute path to the uploaded Excel file.
+        started_at (float): Enqueue time (UNIX timestamp), used for the overall duration.
+        engine (str): Import engine of the subtasks, for the metrics.
+
+    Returns:
+        dict: The merged report, with the wall-clock duration of the whole import.
+    """
+    report = merge_import_results(results)
+    duration = time.time() - started_at
+    report['duration'] = round(duration, 3)
+    report['rows_per_sec'] = round(report['total_rows'] / duration, 1) if duration > 0 else 0.0
+    # One rejects file for the whole import, in row order like the subtasks
+    merged_path = rejects_path(self.request.id)
+    part_paths = [
+        os.path.join(settings.PRODUCT_EXPORT_DIR, result['rejects_file'])
+        for result in results if result['rejects_file']
+    ]
+    has_rejects = merge_rejects_files(part_paths, merged_path)
+    report['rejects_file'] = os.path.basename(merged_path) if has_rejects else None
+    report['rejects_url'] = _rejects_url(report['rejects_file'])
+    record_import(report, engine or settings.PRODUCT_IMPORT_ENGINE)
+    bump_catalog_version()
+    logger.info(
+        f"Task {self.request.id}: Finished split import of {file_path} in {report['chunks']} chunks "
+        f"(created: {report['created']}, updated: {report['updated']}, unchanged: {report['unchanged']}, "
+        f"failed: {report['failed']})"
+    )
+    if os.path.exists(file_path):
+        os.remove(file_path)
+        logger.info(f"Task {self.request.id}: Cleaned up temporary file: {file_path}")
+    _finish_product_import(self.request.id, report)
+    return report
+
+
+def _find_reusable_import(file_hash):
+    """
+    Returns the last successful import of an identical file, provided no product
+    was written or deleted since it finished; None otherwise. Both checks are
+    index or counter lookups, independent of the size of the catalog.
+    """
+    previous = ProductImport.objects.filter(
+        file_hash=file_hash, status=ProductImport.STATUS_SUCCESS,
+    ).order_by('-finished_at').first()
+    if previous is None:
+        return None
+    if (
+        Product.objects.filter(updated_at__gt=previous.finished_at).exists()
+        or get_product_deletions() != previous.product_deletions
+    ):
+        return None
+    return previous
+
+
+def enqueue_product_import(file_path, engine=None, file_hash=None):
+    """
+    Starts the background import of an uploaded Excel file.
+
+    If an identical file (same SHA-256) was imported before and no product was
+    written or deleted since, the file is discarded and the previous import is
+    returned instead, so polling it yields the previous result right away.
+    Disabled with settings.PRODUCT_IMPORT_REUSE_IDENTICAL_FILES = False.
+
+    Only database writes happen here: reading the file (hashing it when the
+    upload did not, counting its rows to decide the split) is left to the
+    start_product_import() task, so requests do not wait on large files.
+
+    Args:
+        file_path (str): The absolute path to the uploaded Excel file.
+        engine (str): Import engine; defaults to settings.PRODUCT_IMPORT_ENGINE.
+        file_hash (str): importers.hash_file() of the file, if the upload already
+            computed it; otherwise the task hashes the file.
+
+    Returns:
+        AsyncResult: The import, under the id that the single import task, or the
+            chord header group and callback of a split import, will be sent with,
+            so progress.get_import_status() can follow either kind with one id.
+
+    Raises:
+        Exception: Whatever failed sending the task; the file is left in place.
+    """
+    if file_hash and settings.PRODUCT_IMPORT_REUSE_IDENTICAL_FILES:
+        previous = _find_reusable_import(file_hash)
+        if previous is not None:
+            logger.info(f"{file_path} is identical to the file of import {previous.task_id}, reusing its result")
+            os.remove(file_path)
+            return AsyncResult(previous.task_id)
+
+    # Recorded before the task is sent, so the tasks always find their record.
+    # An unknown hash is filled in by start_product_import()
+    import_id = uuid4().hex
+    ProductImport.objects.create(task_id=import_id, file_hash=file_hash or '', file_name=os.path.basename(file_path))
+    try:
+        start_product_import.apply_async(
+            (file_path, import_id), {'engine': engine, 'file_hash': file_hash, 'started_at': time.time()},
+        )
+    except Exception:
+        # Nothing was sent (broker down): the record would stay pending forever.
+        # The file is left to the caller, which may retry
+        ProductImport.objects.filter(task_id=import_id).delete()
+        raise
+    return AsyncResult(import_id)
+
+
+@shared_task(bind=True, ignore_result=True)
+def start_product_import(self, file_path, import_id, engine=None, file_hash=None, started_at=None):
+    """
+    Celery task sending the import of a file enqueued by enqueue_product_import().
+
+    Without `file_hash`, the file is hashed first and may turn out identical to
+    a previous import, whose result is then copied. Otherwise the rows of the
+    file are counted: files with more than settings.PRODUCT_IMPORT_PARALLEL_ROWS
+    data rows are split into row ranges of that size, or into
+    settings.PRODUCT_IMPORT_MAX_PARALLEL_TASKS larger ranges. Each range is
+    imported by its own subtask, so the import is spread over all worker
+    processes, and finalize_product_import() aggregates their results as the
+    chord callback. Smaller files are imported by a single task.
+
+    If the import cannot be sent, its record is marked failed and the file removed.
+
+    Args:
+        file_path (str): The absolute path to the uploaded Excel file.
+        import_id (str): Id of the ProductImport record, sent tasks run under it.
+        engine (str): Import engine; defaults to settings.PRODUCT_IMPORT_ENGINE.
+        file_hash (str): importers.hash_file() of the file, if known.
+        started_at (float): Enqueue time (UNIX timestamp), used for the overall duration.
+    """
+    try:
+        delete_expired_exports() # Rejects files of past imports
+        if not file_hash:
+            file_hash = hash_file(file_path)
+            ProductImport.objects.filter(task_id=import_id).update(file_hash=file_hash)
+            previous = _find_reusable_import(file_hash) if settings.PRODUCT_IMPORT_REUSE_IDENTICAL_FILES else None
+            if previous is not None:
+                logger.info(f"{file_path} is identical to the file of import {previous.task_id}, reusing its result")
+                os.remove(file_path)
+                ProductImport.objects.filter(task_id=import_id).update(
+                    status=previous.status, result=previous.result, finished_at=Now(),
+                    product_deletions=previous.product_deletions,
+                )
+                return
+
+        chunk_rows = settings.PRODUCT_IMPORT_PARALLEL_ROWS
+        total_rows = count_excel_rows(file_path)
+        if not total_rows or total_rows <= chunk_rows:
+            import_products_from_excel.apply_async((file_path,), {'engine': engine}, task_id=import_id)
+            return
+        # Every subtask parses the rows before its range too
+        chunk_rows = max(chunk_rows, -(-total_rows // settings.PRODUCT_IMPORT_MAX_PARALLEL_TASKS))
+
+        last_row = total_rows + 1 # Data rows start after the header row
+        subtasks = [
+            import_products_from_excel.s(
+                file_path, engine=engine, start_row=start_row,
+                # The last range is left open-ended in case the stored dimensions are stale
+                end_row=start_row + chunk_rows - 1 if start_row + chunk_rows <= last_row else None,
+                import_id=import_id,
+            )
+            for start_row in range(2, last_row + 1, chunk_rows)
+        ]
+        logger.info(
+            f"Task {self.request.id}: Splitting import of {file_path} ({total_rows} rows) into {len(subtasks)} subtasks"
+        )
+        result = chord(group(subtasks).set(task_id=import_id))(
+            finalize_product_import.s(file_path=file_path, started_at=started_at or time.time(), engine=engine),
+            task_id=import_id,
+        )
+    except Exception as e:
+        logger.exception(f"Task {self.request.id}: Could not start import {import_id} of {file_path}: {e}")
         if os.path.exists(file_path):
             os.remove(file_path)
-            logger.info(f"Task {task_id}: Cleaned up temporary file: {file_path}")
\ No newline at end of file
+        _finish_product_import(import_id, ImportReport().as_dict())
+        return
+    result.parent.save()
+
+
+@shared_task(bind=True)
+def export_catalog(self, file_format='xlsx'):
+    """
+    Celery task exporting the whole catalog to an Excel or CSV file in the
+    import format, downloadable from the returned URL (served by nginx).
+    Progress is reported like for imports, see ProgressReporter.
+
+    Args:
+        file_format (str): 'xlsx' or 'csv'.
+
+    Returns:
+        dict: As returned by exports.export_products().
+    """
+    delete_expired_exports()
+    progress = ProgressReporter(self, total_rows=Product.objects.count())
+    progress.emit()
+    logger.info(f"Task {self.request.id}: Exporting {progress.total_rows} products as {file_format}")
+    result = export_products(file_format, progress=progress)
+    logger.info(
+        f"Task {self.request.id}: Exported {result['rows']} products to {result['file_name']} "
+        f"({result['size']} bytes) in {result['duration']} s"
+    )
+    return result
@@ -1,3 +1,469 @@
-from django.test import TestCase
+import json
+import os
+import shutil
+import tempfile
+import threading
+from unittest import mock
 
-# Create your tests here.
+import openpyxl
+from django.contrib.auth import get_user_model
+from django.db import connection
+from django.http import QueryDict
+from django.test import RequestFactory, SimpleTestCase, TestCase, override_settings
+from django.utils import timezone
+
+from myapp.bulk import bulk_upsert_products
+from myapp.cache import acached_json_response
+from myapp.changes import InvalidCursorError, decode_cursor, get_product_deletions
+from myapp.crosses import normalize_cross_number, split_trading_numbers
+from myapp.dbstats import get_db_stats, record_connect, record_health_check
+from myapp.groups import get_group_products, get_group_tree, refresh_group_paths
+from myapp.importers import (
+    COLUMN_MAPPING, HASH_BLOCK_SIZE, IMPORT_ENGINES, PRODUCT_FIELDS, ExcelBatchReader, FileHasher, ImportReport,
+    InvalidExcelFileError, _CopyStream, count_excel_rows, hash_file, read_sheet_head,
+)
+from myapp.metrics import MetricsRegistry, metrics
+from myapp.models import Product, ProductGroup, ProductImport, ProductUpload
+from myapp.search import InvalidSearchCursorError, decode_search_cursor
+from myapp.specs import InvalidSpecFilterError, parse_spec_filters
+from myapp.tasks import _find_reusable_import, enqueue_product_import, import_products_from_excel, start_product_import
+from myapp.uploads import UploadUnavailableError, complete_upload
+
+# Column titles of the import format, by model field
+COLUMN_TITLES = {field: title.capitalize() for title, field in COLUMN_MAPPING.items()}
+
+
+def write_workbook(file_path, fields, rows, write_only=False):
+    """
+    Writes an .xlsx file with a header row for `fields` followed by `rows`.
+    Write-only workbooks, like the exports, do not store the sheet dimensions.
+    """
+    workbook = openpyxl.Workbook(write_only=write_only)
+    sheet = workbook.create_sheet() if write_only else workbook.active
+    sheet.append([COLUMN_TITLES[field] for field in fields])
+    for row in rows:
+        sheet.append(list(row))
+    workbook.save(file_path)
+
+
+class TemporaryDirectoryMixin:
+    def setUp(self):
+        super().setUp()
+        self.directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.directory)
+
+
+class FileHasherTests(TemporaryDirectoryMixin, SimpleTestCase):
+    def test_resumed_digest_equals_one_shot_digest(self):
+        data = os.urandom(HASH_BLOCK_SIZE * 2 + HASH_BLOCK_SIZE // 2)
+        file_path = os.path.join(self.directory, 'upload.bin')
+        with open(file_path, 'wb') as f:
+            f.write(data)
+
+        # Two chunks ending at a block boundary, each received by another process
+        first = FileHasher()
+        first.update(data[:HASH_BLOCK_SIZE * 2])
+        self.assertTrue(first.at_block_boundary)
+        resumed = FileHasher(bytes(first.block_digests))
+        resumed.update(data[HASH_BLOCK_SIZE * 2:])
+
+        one_shot = FileHasher()
+        for start in range(0, len(data), 1000):
+            one_shot.update(data[start:start + 1000])
+
+        self.assertEqual(resumed.size, len(data))
+        self.assertEqual(resumed.hexdigest(), hash_file(file_path))
+        self.assertEqual(one_shot.hexdigest(), hash_file(file_path))
+
+
+class ExcelBatchReaderTests(TemporaryDirectoryMixin, SimpleTestCase):
+    def read(self, rows, batch_size=100, **kwargs):
+        file_path = os.path.join(self.directory, 'catalog.xlsx')
+        write_workbook(file_path, ('brand', 'article', 'description'), rows)
+        report = ImportReport()
+        with ExcelBatchReader(file_path, batch_size, report=report, **kwargs) as reader:
+            batches = list(reader)
+        return batches, report
+
+    def test_rows_are_streamed_in_batches_without_blank_rows(self):
+        batches, report = self.read([
+            ('Bosch', 'A1', 'first'),
+            (None, None, None),
+            ('Bosch', 'A2', 'second'),
+            ('Bosch', 'A3', 'third'),
+        ], batch_size=2)
+        self.assertEqual(
+            [[(row.row_number, row.article) for row in batch] for batch in batches],
+            [[(2, 'A1'), (4, 'A2')], [(5, 'A3')]],
+        )
+        self.assertEqual(report.total_rows, 3)
+
+    def test_only_the_row_range_is_read(self):
+        batches, _ = self.read([('Bosch', f"A{n}", '') for n in range(1, 6)], start_row=3, end_row=4)
+        self.assertEqual([[row.row_number for row in batch] for batch in batches], [[3, 4]])
+
+    def test_values_are_stripped_strings_without_float_suffix(self):
+        [[row]], _ = self.read([(' Bosch ', 12345.0, 1.5)])
+        self.assertEqual((row.row_number, row.brand, row.article, row.description), (2, 'Bosch', '12345', '1.5'))
+        self.assertIsNone(row.specifications) # Not a column of the file
+
+    def test_last_occurrence_of_an_article_wins(self):
+        batches, report = self.read([
+            ('Bosch', 'A1', 'first'), # Row 2, superseded by row 3 of the same batch
+            ('Bosch', 'A1', 'second'), # Row 3, superseded by row 5 of the next batch
+            ('Bosch', 'B1', 'other'),
+            ('Bosch', 'A1', 'third'),
+        ], batch_size=2)
+        self.assertEqual(
+            [[(row.row_number, row.description) for row in batch] for batch in batches],
+            [[(3, 'second')], [(4, 'other'), (5, 'third')]],
+        )
+        self.assertEqual(report.duplicates, 2)
+
+    def test_rows_with_empty_or_too_long_articles_are_rejected(self):
+        [batch], report = self.read([('Bosch', '', 'empty'), ('Bosch', 'A' * 256, 'long'), ('Bosch', 'A1', 'ok')])
+        self.assertEqual([row.row_number for row in batch], [4])
+        self.assertEqual(report.failed, 2)
+        self.assertEqual([error['row'] for error in report.errors], [2, 3])
+
+    def test_long_values_are_truncated(self):
+        [[row]], report = self.read([('B' * 300, 'A1', 'D' * 300)])
+        self.assertEqual(row.brand, 'B' * 255)
+        self.assertEqual(row.description, 'D' * 300) # TextField, no limit
+        self.assertEqual(report.truncated, 1)
+
+    @override_settings(PRODUCT_IMPORT_TRUNCATE_LONG_VALUES=False)
+    def test_long_values_are_rejected_without_truncation(self):
+        batches, report = self.read([('B' * 300, 'A1', 'long')])
+        self.assertEqual(batches, [])
+        self.assertEqual((report.failed, report.truncated), (1, 0))
+
+
+class RowCountTests(TemporaryDirectoryMixin, SimpleTestCase):
+    def test_rows_are_counted_from_stored_dimensions(self):
+        file_path = os.path.join(self.directory, 'catalog.xlsx')
+        write_workbook(file_path, ('brand', 'article'), [('Bosch', str(n)) for n in range(10)])
+        self.assertEqual(count_excel_rows(file_path), 10)
+
+    def test_rows_are_counted_without_stored_dimensions(self):
+        file_path = os.path.join(self.directory, 'catalog.xlsx')
+        write_workbook(file_path, ('brand', 'article'), [('Bosch', str(n)) for n in range(10)], write_only=True)
+        self.assertEqual(count_excel_rows(file_path), 10)
+
+
+class SheetHeadTests(TemporaryDirectoryMixin, SimpleTestCase):
+    def test_header_and_stored_dimensions(self):
+        file_path = os.path.join(self.directory, 'catalog.xlsx')
+        write_workbook(file_path, ('brand', 'article'), [('Bosch', str(n)) for n in range(10)])
+        head = read_sheet_head(file_path)
+        self.assertEqual(head.header, [COLUMN_TITLES['brand'], COLUMN_TITLES['article']])
+        self.assertEqual(head.max_row, 11)
+
+    def test_header_without_stored_dimensions(self):
+        file_path = os.path.join(self.directory, 'catalog.xlsx')
+        write_workbook(file_path, ('brand', 'article'), [('Bosch', str(n)) for n in range(10)], write_only=True)
+        head = read_sheet_head(file_path)
+        self.assertEqual(head.header, [COLUMN_TITLES['brand'], COLUMN_TITLES['article']])
+        self.assertIsNone(head.max_row)
+
+    def test_other_files_are_rejected(self):
+        file_path = os.path.join(self.directory, 'catalog.xlsx')
+        with open(file_path, 'w') as f:
+            f.write('brand,article\n')
+        with self.assertRaises(InvalidExcelFileError):
+            read_sheet_head(file_path)
+
+
+class CopyStreamTests(SimpleTestCase):
+    def test_values_are_escaped_for_copy_text_format(self):
+        rows = [('a\tb', 'line\nbreak\r', 'back\\slash', None, 7)]
+        expected = 'a\\tb\tline\\nbreak\\r\tback\\\\slash\t\\N\t7\n'
+        self.assertEqual(_CopyStream(rows).read(), expected)
+
+    def test_reads_of_any_size_return_the_whole_payload(self):
+        rows = [(str(n), 'x' * n) for n in range(50)]
+        stream = _CopyStream(rows)
+        parts = iter(lambda: stream.read(7), '')
+        self.assertEqual(''.join(parts), _CopyStream(rows).read())
+
+    def test_time_outside_reads_is_write_time(self):
+        report = ImportReport()
+        stream = _CopyStream([('a',)], report)
+        with mock.patch('myapp.importers.time.perf_counter', side_effect=[1.0, 3.0, 3.5, 4.0]):
+            stream.read()
+            stream.read() # COPY spent 2s between the reads
+            stream.finish() # ... and 0.5s after the last one
+        self.assertEqual(report.timings['write'], 2.5)
+
+
+class ChangesCursorTests(SimpleTestCase):
+    def test_empty_cursor_starts_from_the_beginning(self):
+        self.assertEqual(decode_cursor('')[1], 0)
+
+    def test_malformed_cursors_are_rejected(self):
+        for cursor in ('abc', '1-2-3', '-5-3', '1.5-2', '9' * 30 + '-1'):
+            with self.subTest(cursor=cursor), self.assertRaises(InvalidCursorError):
+                decode_cursor(cursor)
+
+
+class SearchCursorTests(SimpleTestCase):
+    def test_cursor_holds_rank_and_id(self):
+        self.assertEqual(decode_search_cursor('0.25_7'), (0.25, 7))
+
+    def test_malformed_cursors_are_rejected(self):
+        for cursor in ('', 'abc', '0.25', '0.25_x', '0.25_7_1'):
+            with self.subTest(cursor=cursor), self.assertRaises(InvalidSearchCursorError):
+                decode_search_cursor(cursor)
+
+
+@override_settings(METRICS_FLUSH_INTERVAL=0)
+class MetricsFlushTests(SimpleTestCase):
+    def test_due_flush_runs_outside_the_recording_thread(self):
+        registry = MetricsRegistry()
+        flushed = threading.Event()
+        flush_threads = []
+
+        def flush():
+            flush_threads.append(threading.current_thread())
+            flushed.set()
+
+        with mock.patch.object(registry, 'flush', side_effect=flush):
+            registry.inc('http_requests_total', route='api/metrics', method='GET', status=200)
+            self.assertTrue(flushed.wait(5))
+        self.assertIsNot(flush_threads[0], threading.current_thread())
+
+
+@override_settings(METRICS_REDIS_URL='')
+class DbStatsTests(SimpleTestCase):
+    def test_acquisition_counters_are_read_from_the_metrics(self):
+        before = get_db_stats()
+        record_connect(0.004)
+        record_health_check(0.001, usable=True)
+        record_health_check(0.003, usable=False)
+        after = get_db_stats()
+        self.assertEqual(
+            [after[field] - before[field] for field in ('connects', 'health_checks', 'health_check_failures')],
+            [1, 2, 1],
+        )
+
+
+@override_settings(METRICS_REDIS_URL='')
+class CachedResponseTests(SimpleTestCase):
+    async def test_cache_errors_are_misses(self):
+        async def build():
+            return 200, {'items': []}
+
+        misses = metrics.totals().get('api_cache_misses_total', 0)
+        with mock.patch('myapp.cache.cache') as cache:
+            # The catalog version is read, then the response is not
+            cache.aget = mock.AsyncMock(side_effect=[3, ConnectionError('Redis is down')])
+            cache.aset = mock.AsyncMock(side_effect=ConnectionError('Redis is down'))
+            response = await acached_json_response(RequestFactory().get('/api/groups/tree'), 'groups_tree', {}, build)
+
+        self.assertEqual((response.status_code, json.loads(response.content)), (200, {'items': []}))
+        self.assertTrue(response['ETag'].startswith('"3-'))
+        self.assertEqual(metrics.totals()['api_cache_misses_total'], misses + 1)
+
+
+class SpecFilterTests(SimpleTestCase):
+    def test_spec_parameters_become_filters(self):
+        query = QueryDict('spec.Side=Left&spec.Side=Right&spec.Side=Left&spec.Weight=1kg&brand=Bosch&limit=5')
+        self.assertEqual(parse_spec_filters(query), {'Side': ['Left', 'Right'], 'Weight': ['1kg']})
+
+    def test_parameter_without_attribute_is_rejected(self):
+        with self.assertRaises(InvalidSpecFilterError):
+            parse_spec_filters(QueryDict('spec.=1'))
+
+
+class CrossNumberTests(SimpleTestCase):
+    def test_normalize_cross_number(self):
+        self.assertEqual(normalize_cross_number(' hu 711/51-x.'), 'HU711/51X')
+
+    def test_split_trading_numbers(self):
+        self.assertEqual(
+            split_trading_numbers('HU 711/51 X, hu711/51x, , 0 986-452 041'),
+            [('HU 711/51 X', 'HU711/51X'), ('0 986-452 041', '0986452041')],
+        )
+        self.assertEqual(split_trading_numbers(None), [])
+
+
+class BulkUpsertTests(TestCase):
+    def item(self, **values):
+        return {field: values.get(field) for field in PRODUCT_FIELDS}
+
+    def test_additions_and_partial_updates(self):
+        Product.objects.create(article='BULK-B1', brand='Bosch', description='old')
+        results = bulk_upsert_products(
+            [
+                self.item(article='BULK-A1', brand='Bosch', trading_numbers='0 986-452 041'),
+                self.item(article='BULK-B1', brand='Mann'), # Already exists
+                self.item(article='BULK-A1'), # Repeated in the request
+                self.item(article=''),
+            ],
+            [
+                self.item(article='BULK-B1', description='new'), # Other fields are not provided
+                self.item(article='BULK-C1', description='missing'),
+            ],
+            chunk_size=2,
+        )
+
+        self.assertEqual([(result['op'], result['index'], result['status']) for result in results], [
+            ('add', 0, 'created'), ('add', 1, 'conflict'), ('add', 2, 'conflict'), ('add', 3, 'invalid'),
+            ('update', 0, 'updated'), ('update', 1, 'not_found'),
+        ])
+        product = Product.objects.get(article='BULK-B1')
+        self.assertEqual((product.brand, product.description), ('Bosch', 'new'))
+        crosses = Product.objects.get(article='BULK-A1').crosses.values_list('normalized_number', flat=True)
+        self.assertEqual(list(crosses), ['0986452041'])
+
+
+class GroupTreeTests(TestCase):
+    def test_paths_tree_and_subtree_products(self):
+        root = ProductGroup.objects.create(name='Filters')
+        child = ProductGroup.objects.create(name='Oil filters', parent_id=root.id)
+        # Groups on a parent_id cycle become roots
+        first = ProductGroup.objects.create(name='Cycle A')
+        second = ProductGroup.objects.create(name='Cycle B', parent_id=first.id)
+        ProductGroup.objects.filter(id=first.id).update(parent_id=second.id)
+
+        refresh_group_paths()
+
+        paths = dict(ProductGroup.objects.filter(id__in=[root.id, child.id, first.id, second.id]).values_list('id', 'path'))
+        self.assertEqual(paths, {
+            root.id: f"/{root.id}/", child.id: f"/{root.id}/{child.id}/",
+            first.id: f"/{first.id}/", second.id: f"/{second.id}/",
+        })
+        roots = {node['id']: node for node in get_group_tree()}
+        self.assertEqual(roots[root.id]['children'], [{'id': child.id, 'name': 'Oil filters', 'children': []}])
+        self.assertEqual((roots[first.id]['children'], roots[second.id]['children']), ([], []))
+
+        Product.objects.create(article='GROUP-1', product_group_id=root.id)
+        Product.objects.create(article='GROUP-2', product_group_id=child.id)
+        root.refresh_from_db()
+        page = get_group_products(root, 0, 10)
+        self.assertEqual([item['article'] for item in page['items']], ['GROUP-1'])
+        page = get_group_products(root, 0, 1, recursive=True)
+        self.assertEqual([item['article'] for item in page['items']], ['GROUP-1'])
+        page = get_group_products(root, page['next_cursor'], 1, recursive=True)
+        self.assertEqual(([item['article'] for item in page['items']], page['next_cursor']), (['GROUP-2'], None))
+
+
+@override_settings(
+    CACHES={'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}},
+    METRICS_REDIS_URL='',
+)
+class SplitImportTests(TemporaryDirectoryMixin, TestCase):
+    """
+    Subtasks of a split import run in any order; the last occurrence of an
+    article in the file must win regardless.
+    """
+    def setUp(self):
+        super().setUp()
+        export_dir = override_settings(PRODUCT_EXPORT_DIR=os.path.join(self.directory, 'exports'))
+        export_dir.enable()
+        self.addCleanup(export_dir.disable)
+
+    def import_file(self, rows, engine, **kwargs):
+        file_path = os.path.join(self.directory, f"{len(os.listdir(self.directory))}.xlsx")
+        write_workbook(file_path, ('brand', 'article', 'description'), rows)
+        return import_products_from_excel(file_path, engine=engine, **kwargs)
+
+    def test_unchanged_last_occurrence_wins_over_earlier_range(self):
+        for engine in IMPORT_ENGINES:
+            with self.subTest(engine=engine):
+                article = f"SPLIT-{engine}"
+                self.import_file([('Bosch', article, 'new')], engine)
+
+                # Row 3 repeats the stored product, row 2 is an older version of it.
+                # The range of row 3 finishes first, then that of row 2
+                rows = [('Bosch', article, 'old'), ('Bosch', article, 'new')]
+                file_path = os.path.join(self.directory, f"split_{engine}.xlsx")
+                write_workbook(file_path, ('brand', 'article', 'description'), rows)
+                last = import_products_from_excel(
+                    file_path, engine=engine, start_row=3, end_row=3, import_id=f"split_{engine}",
+                )
+                first = import_products_from_excel(
+                    file_path, engine=engine, start_row=2, end_row=2, import_id=f"split_{engine}",
+                )
+
+                self.assertEqual(last['unchanged'], 1)
+                self.assertEqual((first['updated'], first['duplicates']), (0, 1))
+                product = Product.objects.get(article=article)
+                self.assertEqual(product.description, 'new')
+                self.assertEqual((product.import_id, product.import_row), (f"split_{engine}", 3))
+
+    def test_unchanged_rows_are_not_written_outside_split_imports(self):
+        for engine in IMPORT_ENGINES:
+            with self.subTest(engine=engine):
+                article = f"SINGLE-{engine}"
+                self.import_file([('Bosch', article, 'new')], engine, import_id='first')
+                updated_at = Product.objects.get(article=article).updated_at
+
+                result = self.import_file([('Bosch', article, 'new')], engine, import_id='second')
+
+                self.assertEqual((result['unchanged'], result['updated']), (1, 0))
+                product = Product.objects.get(article=article)
+                self.assertEqual((product.import_id, product.updated_at), ('first', updated_at))
+
+
+class ReusableImportTests(TestCase):
+    def test_deletes_without_tombstones_prevent_reuse(self):
+        file_hash = 'f' * 64
+        ProductImport.objects.create(
+            task_id='reusable', file_hash=file_hash, file_name='catalog.xlsx', status=ProductImport.STATUS_SUCCESS,
+            finished_at=timezone.now(), product_deletions=get_product_deletions(),
+        )
+        self.assertEqual(_find_reusable_import(file_hash).task_id, 'reusable')
+
+        with connection.cursor() as cursor:
+            cursor.execute("DELETE FROM myapp_product WHERE article = 'REUSE-MISSING'")
+        self.assertIsNone(_find_reusable_import(file_hash))
+
+
+@override_settings(PRODUCT_IMPORT_REUSE_IDENTICAL_FILES=False)
+class CompleteUploadTests(TemporaryDirectoryMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        self.file_path = os.path.join(self.directory, 'catalog.xlsx')
+        write_workbook(self.file_path, ('brand', 'article'), [('Bosch', 'A1')])
+        size = os.path.getsize(self.file_path)
+        self.user = get_user_model().objects.create(username='uploader')
+        self.upload = ProductUpload.objects.create(
+            user=self.user, file_name='catalog.xlsx', file_path=self.file_path, size=size, received=size,
+        )
+
+    def test_failed_enqueue_keeps_the_upload_for_a_retry(self):
+        with mock.patch.object(start_product_import, 'apply_async', side_effect=OSError('broker down')):
+            with self.assertRaises(UploadUnavailableError):
+                complete_upload(self.upload.id, self.user.id)
+
+        self.assertTrue(os.path.exists(self.file_path))
+        self.assertTrue(ProductUpload.objects.filter(id=self.upload.id).exists())
+        self.assertFalse(ProductImport.objects.filter(file_name='catalog.xlsx').exists())
+
+        with mock.patch.object(start_product_import, 'apply_async') as apply_async:
+            complete_upload(self.upload.id, self.user.id)
+        apply_async.assert_called_once()
+        self.assertFalse(ProductUpload.objects.filter(id=self.upload.id).exists())
+
+
+@override_settings(PRODUCT_IMPORT_REUSE_IDENTICAL_FILES=False, PRODUCT_IMPORT_PARALLEL_ROWS=5)
+class StartImportTests(TemporaryDirectoryMixin, TestCase):
+    def test_file_is_read_by_the_task_not_the_request(self):
+        file_path = os.path.join(self.directory, 'catalog.xlsx')
+        write_workbook(file_path, ('brand', 'article'), [('Bosch', f"A{n}") for n in range(10)])
+
+        with mock.patch.object(start_product_import, 'apply_async') as apply_async, \
+                mock.patch('myapp.tasks.count_excel_rows') as count_excel_rows:
+            result = enqueue_product_import(file_path)
+        count_excel_rows.assert_not_called()
+        self.assertEqual(ProductImport.objects.get(task_id=result.id).file_hash, '')
+        args, kwargs = apply_async.call_args.args
+        self.assertEqual(args, (file_path, result.id))
+
+        with override_settings(PRODUCT_EXPORT_DIR=self.directory), mock.patch('myapp.tasks.chord') as chord:
+            start_product_import.apply(args, kwargs)
+        self.assertEqual(ProductImport.objects.get(task_id=result.id).file_hash, hash_file(file_path))
+        header = chord.call_args.args[0]
+        self.assertEqual(header.id, result.id)
+        self.assertEqual([(task.kwargs['start_row'], task.kwargs['end_row']) for task in header.tasks], [(2, 6), (7, None)])
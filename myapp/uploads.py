@@ -0,0 +1,262 @@
+import logging
+import os
+from datetime import timedelta
+from uuid import uuid4
+
+from django.conf import settings
+from django.core.exceptions import SuspiciousFileOperation
+from django.core.files.uploadedfile import UploadedFile
+from django.core.files.uploadhandler import FileUploadHandler, SkipFile
+from django.db import transaction
+from django.utils import timezone
+from django.utils.text import get_valid_filename
+
+from .importers import HASH_BLOCK_SIZE, FileHasher, InvalidExcelFileError, validate_excel_header
+from .models import ProductUpload
+from .tasks import enqueue_product_import
+
+logger = logging.getLogger(__name__)
+
+# Form field of the Excel file on the upload page
+UPLOAD_FIELD_NAME = 'excel_file'
+
+
+class UploadError(ValueError):
+    pass
+
+
+class UploadUnavailableError(UploadError):
+    """Raised when a complete upload could not be handed to the workers; it can be completed again."""
+
+
+class UploadOffsetError(UploadError):
+    """Raised when a chunk does not start where the previous one ended."""
+    def __init__(self, message, received):
+        super().__init__(message)
+        self.received = received
+
+
+def upload_path(file_name):
+    """
+    Returns a new unique path under settings.PRODUCT_UPLOAD_DIR for an uploaded
+    file, so concurrent uploads of files with the same name never collide.
+    """
+    os.makedirs(settings.PRODUCT_UPLOAD_DIR, exist_ok=True)
+    try:
+        safe_name = get_valid_filename(os.path.basename(file_name))[-200:]
+    except SuspiciousFileOperation:
+        safe_name = 'upload.xlsx'
+    return os.path.join(settings.PRODUCT_UPLOAD_DIR, f"{uuid4().hex}_{safe_name}")
+
+
+def _remove(file_path):
+    try:
+        os.remove(file_path)
+    except FileNotFoundError:
+        pass
+
+
+class StoredUploadedFile(UploadedFile):
+    """
+    An uploaded file already written to its final path by StreamingUploadHandler.
+    """
+    def __init__(self, file, name, content_type, size, charset, content_type_extra, file_hash):
+        super().__init__(file, name, content_type, size, charset, content_type_extra)
+        self.file_hash = file_hash # importers.hash_file() of the content
+
+    def temporary_file_path(self):
+        return self.file.name
+
+
+class StreamingUploadHandler(FileUploadHandler):
+    """
+    Writes the Excel file of the upload form straight to a unique path under
+    settings.PRODUCT_UPLOAD_DIR as the request body is parsed, hashing it and
+    enforcing settings.PRODUCT_UPLOAD_MAX_SIZE on the way. The file is neither
+    held in memory nor copied from a temporary file afterwards.
+
+    Other file fields are skipped. A file over the size limit is skipped as well,
+    and `too_large` is set so the view can tell why the field is missing.
+    """
+    def __init__(self, request=None):
+        super().__init__(request)
+        # Not named `file`: MultiPartParser closes the `file` of every handler
+        self.destination = None
+        self.hasher = None
+        self.too_large = False
+
+    def new_file(self, *args, **kwargs):
+        super().new_file(*args, **kwargs)
+        self.destination = None
+        self.hasher = FileHasher()
+
+    def receive_data_chunk(self, raw_data, start):
+        if self.field_name != UPLOAD_FIELD_NAME:
+            raise SkipFile()
+        self.hasher.update(raw_data)
+        if self.hasher.size > settings.PRODUCT_UPLOAD_MAX_SIZE:
+            self.too_large = True
+            self.upload_interrupted()
+            raise SkipFile()
+        if self.destination is None:
+            self.destination = open(upload_path(self.file_name), 'wb')
+        self.destination.write(raw_data)
+        return None # Nothing is left for other handlers
+
+    def file_complete(self, file_size):
+        if self.destination is None:
+            return None # Skipped, or empty
+        self.destination.close()
+        return StoredUploadedFile(
+            self.destination, self.file_name, self.content_type, file_size,
+            self.charset, self.content_type_extra, self.hasher.hexdigest(),
+        )
+
+    def upload_interrupted(self):
+        if self.destination is not None:
+            self.destination.close()
+            _remove(self.destination.name)
+            self.destination = None
+
+
+def delete_expired_uploads():
+    """
+    Deletes the resumable uploads that received no chunk for
+    settings.PRODUCT_UPLOAD_EXPIRY_HOURS, with their files.
+    """
+    cutoff = timezone.now() - timedelta(hours=settings.PRODUCT_UPLOAD_EXPIRY_HOURS)
+    for upload in ProductUpload.objects.filter(updated_at__lt=cutoff):
+        logger.info(f"Deleting expired upload {upload.id} ({upload.file_name}, {upload.received}/{upload.size} bytes)")
+        discard_upload(upload)
+
+
+def discard_upload(upload):
+    _remove(upload.file_path)
+    upload.delete()
+
+
+def create_upload(user_id, file_name, size):
+    """
+    Starts a resumable upload of a file of `size` bytes.
+
+    Returns:
+        ProductUpload: The new upload; send its chunks with append_chunk().
+
+    Raises:
+        UploadError: If the size is not accepted.
+    """
+    if size <= 0:
+        raise UploadError("The file is empty.")
+    if size > settings.PRODUCT_UPLOAD_MAX_SIZE:
+        raise UploadError(f"The file is larger than {settings.PRODUCT_UPLOAD_MAX_SIZE} bytes.")
+    delete_expired_uploads()
+    return ProductUpload.objects.create(
+        user_id=user_id, file_name=file_name[:255], file_path=upload_path(file_name), size=size,
+    )
+
+
+def append_chunk(upload_id, user_id, offset, stream, length):
+    """
+    Appends one chunk of a resumable upload, read from `stream`.
+
+    Chunks are written and hashed as they are read, HASH_BLOCK_SIZE bytes at a
+    time. They must arrive in order: a chunk starting anywhere but at the bytes
+    received so far is refused, and the client resumes from that offset. Each
+    chunk is at most settings.PRODUCT_UPLOAD_CHUNK_SIZE long and, except for the
+    last one, a multiple of HASH_BLOCK_SIZE, so the hash state saved with the
+    upload is always complete.
+
+    Args:
+        upload_id (UUID): The upload.
+        user_id (int): The user who started it.
+        offset (int): Position of the chunk in the file.
+        stream: File-like object with the chunk, such as the request.
+        length (int): Length of the chunk (the Content-Length of the request).
+
+    Returns:
+        ProductUpload: The updated upload.
+
+    Raises:
+        ProductUpload.DoesNotExist: If the user has no such upload.
+        UploadOffsetError: If the chunk does not start at `received`.
+        UploadError: If the chunk length is not accepted.
+    """
+    with transaction.atomic():
+        # Serializes retries of the same chunk sent to different processes
+        upload = ProductUpload.objects.select_for_update().get(id=upload_id, user_id=user_id)
+        if offset != upload.received:
+            raise UploadOffsetError(f"Expected a chunk at offset {upload.received}.", upload.received)
+        end = offset + length
+        if length <= 0 or length > settings.PRODUCT_UPLOAD_CHUNK_SIZE:
+            raise UploadError(f"Chunks must be 1 to {settings.PRODUCT_UPLOAD_CHUNK_SIZE} bytes long.")
+        if end > upload.size:
+            raise UploadError(f"The chunk ends past the announced size of {upload.size} bytes.")
+        if end < upload.size and length % HASH_BLOCK_SIZE:
+            raise UploadError(f"All chunks but the last must be a multiple of {HASH_BLOCK_SIZE} bytes long.")
+
+        hasher = FileHasher(upload.block_digests)
+        with open(upload.file_path, 'r+b' if offset else 'wb') as f:
+            f.seek(offset)
+            f.truncate() # Drops what an interrupted attempt at this chunk left behind
+            remaining = length
+            while remaining:
+                data = stream.read(min(remaining, HASH_BLOCK_SIZE))
+                if not data:
+                    raise UploadError(f"The request body ended {remaining} bytes short of the chunk length.")
+                f.write(data)
+                hasher.update(data)
+                remaining -= len(data)
+
+        upload.received = end
+        upload.block_digests = bytes(hasher.block_digests)
+        if end == upload.size:
+            upload.file_hash = hasher.hexdigest()
+        upload.save(update_fields=['received', 'block_digests', 'file_hash', 'updated_at'])
+    return upload
+
+
+def complete_upload(upload_id, user_id, engine=None):
+    """
+    Checks the header of a fully received upload and starts its import.
+    A file the importers cannot read is deleted with its upload. If the import
+    cannot be started, the upload is restored, so completing it can be retried
+    without sending the file again.
+
+    Returns:
+        AsyncResult: As returned by tasks.enqueue_product_import().
+
+    Raises:
+        ProductUpload.DoesNotExist: If the user has no such upload.
+        UploadError: If chunks are missing.
+        InvalidExcelFileError: If the file is not an .xlsx workbook with the article column.
+        UploadUnavailableError: If the import could not be started.
+    """
+    with transaction.atomic():
+        upload = ProductUpload.objects.select_for_update().get(id=upload_id, user_id=user_id)
+        if upload.received != upload.size:
+            raise UploadError(f"Only {upload.received} of {upload.size} bytes were received.")
+        header_error = None
+        try:
+            validate_excel_header(upload.file_path)
+        except InvalidExcelFileError as e:
+            header_error = e
+            _remove(upload.file_path)
+        # Either way the upload is over; a valid file now belongs to the import,
+        # unless it cannot be started (see below)
+        upload.delete()
+    if header_error is not None:
+        raise header_error
+    logger.info(f"Upload {upload_id} of {upload.file_name} ({upload.size} bytes) completed")
+    try:
+        return enqueue_product_import(upload.file_path, engine=engine, file_hash=upload.file_hash)
+    except Exception as e:
+        logger.error(f"Failed to start the import of upload {upload_id}: {e}")
+        try:
+            # delete() cleared the primary key
+            upload.id = upload_id
+            upload.save(force_insert=True)
+        except Exception:
+            # Without its upload the file would never be deleted
+            _remove(upload.file_path)
+            raise UploadError("The import could not be started, please upload the file again.")
+        raise UploadUnavailableError("The import could not be started, please try again.")
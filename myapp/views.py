@@ -1,8 +1,13 @@
 import os
 from django.shortcuts import render, redirect
+from django.urls import reverse
 from django.conf import settings
+from django.template.defaultfilters import filesizeformat
+from django.views.decorators.csrf import csrf_exempt, csrf_protect
 from .forms import ExcelUploadForm, UserRegistrationForm, UserLoginForm
-from .tasks import import_products_from_excel
+from .importers import InvalidExcelFileError, validate_excel_header
+from .tasks import enqueue_product_import
+from .uploads import StreamingUploadHandler
 from django.contrib import messages
 from django.contrib.auth import login, logout, authenticate
 from django.contrib.auth.decorators import login_required
@@ -11,64 +16,71 @@ import logging
 logger = logging.getLogger(__name__)
 
 @login_required # Only authenticated users can access this view
+@csrf_exempt # Checked by _upload_excel_view, after the upload handlers are set
 def upload_excel_view(request):
     """
     Handles Excel file upload form submission. Requires user to be logged in.
     """
+    # Stream the file to its final unique path while the body is parsed. The handlers
+    # must be set before anything reads request.POST, which the CSRF check does.
+    request.upload_handlers = [StreamingUploadHandler(request)]
+    response = _upload_excel_view(request)
+    if request.method == 'POST' and response.status_code == 403:
+        # Failed the CSRF check, possibly after the file was written
+        for uploaded_file in request.FILES.values():
+            os.remove(uploaded_file.temporary_file_path())
+    return response
+
+@csrf_protect
+def _upload_excel_view(request):
     if request.method == 'POST':
         form = ExcelUploadForm(request.POST, request.FILES)
         if form.is_valid():
-            excel_file = request.FILES['excel_file']
-
-            # Ensure the 'media' directory exists within your project root
-            # defined by MEDIA_ROOT in settings.py
-            if not os.path.exists(settings.MEDIA_ROOT):
-                os.makedirs(settings.MEDIA_ROOT)
-                logger.info(f"Created MEDIA_ROOT directory: {settings.MEDIA_ROOT}")
-
-            # Define a unique temporary path to save the file
-            # Using excel_file.name directly might lead to conflicts if multiple files
-            # with the same name are uploaded. A UUID would be more robust.
-            file_name = excel_file.name
-            file_path = os.path.join(settings.MEDIA_ROOT, file_name)
+            excel_file = request.FILES['excel_file'] # Already saved by StreamingUploadHandler
+            file_path = excel_file.temporary_file_path()
+            logger.info(f"File {excel_file.name} ({excel_file.size} bytes) saved to: {file_path}")
 
-            # In case a file with the same name already exists (from a previous upload),
-            # append a timestamp or UUID to make it unique.
-            # For simplicity, we are overwriting, but for production, use a unique filename.
-            # Example for unique filename:
-            # from uuid import uuid4
-            # unique_filename = f"{uuid4()}_{file_name}"
-            # file_path = os.path.join(settings.MEDIA_ROOT, unique_filename)
-
-            # Save the uploaded file chunks
+            # Reject files the import could not read before they reach a worker
             try:
-                with open(file_path, 'wb+') as destination:
-                    for chunk in excel_file.chunks():
-                        destination.write(chunk)
-                logger.info(f"File saved temporarily to: {file_path}")
-            except IOError as e:
-                logger.error(f"Failed to save uploaded file {file_name} to {file_path}: {e}")
-                messages.error(request, 'Failed to save the uploaded file on the server.')
+                validate_excel_header(file_path)
+            except InvalidExcelFileError as e:
+                os.remove(file_path)
+                logger.warning(f"Rejected upload {excel_file.name}: {e}")
+                messages.error(request, f'The file cannot be imported: {e}')
                 return render(request, 'products_app/upload_excel.html', {'form': form})
 
-
-            # Enqueue the Celery task
-            # .delay() is a shortcut for .apply_async()
+            # Enqueue the Celery task (split into parallel subtasks for large files)
             try:
-                import_products_from_excel.delay(file_path)
+                result = enqueue_product_import(
+                    file_path, engine=form.cleaned_data['engine'] or None, file_hash=excel_file.file_hash,
+                )
                 messages.success(request, 'Excel file uploaded successfully! Processing started in the background.')
                 logger.info(f"Celery task 'import_products_from_excel' enqueued for file: {file_path}")
             except Exception as e:
                 logger.error(f"Failed to enqueue Celery task for {file_path}: {e}")
+                # Nobody will import or delete it
+                if os.path.exists(file_path):
+                    os.remove(file_path)
                 messages.error(request, 'Failed to start background processing. Please try again.')
+                return redirect('upload_excel')
 
-            return redirect('upload_excel')
+            # The upload page polls the import status of this task
+            return redirect(f"{reverse('upload_excel')}?task_id={result.id}")
         else:
-            messages.error(request, 'Error uploading file. Please correct the form errors.')
+            for uploaded_file in request.FILES.values():
+                os.remove(uploaded_file.temporary_file_path())
+            if request.upload_handlers[0].too_large:
+                messages.error(request, f'The file is larger than {filesizeformat(settings.PRODUCT_UPLOAD_MAX_SIZE)}.')
+            else:
+                messages.error(request, 'Error uploading file. Please correct the form errors.')
             logger.warning(f"Form validation failed: {form.errors}")
     else:
         form = ExcelUploadForm()
-    return render(request, 'products_app/upload_excel.html', {'form': form})
+    return render(request, 'products_app/upload_excel.html', {
+        'form': form,
+        'task_id': request.GET.get('task_id'),
+        'chunk_size': settings.PRODUCT_UPLOAD_CHUNK_SIZE,
+    })
 
 def register_view(request):
     """
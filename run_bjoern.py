@@ -1,10 +1,239 @@
+"""
+Pre-fork launcher for the Bjoern WSGI server.
+
+Bjoern serves one request at a time per process, so the master process imports
+the Django application once, binds the listen socket and forks BJOERN_WORKERS
+workers that inherit both; the kernel spreads connections over the workers.
+The master restarts workers that exit, and each worker stops gracefully after
+BJOERN_MAX_REQUESTS requests (plus a random jitter) to bound memory growth.
+
+Signals (send them to the master):
+    SIGHUP           Zero-downtime reload: once the new code imports, the master
+                     re-executes itself on the same socket, starts new workers,
+                     then gracefully stops the old ones.
+    SIGTERM, SIGINT  Graceful shutdown.
+"""
+import gc
+import logging
+import os
+import random
+import select
+import signal
+import socket
+import subprocess
+import sys
+import time
+
 import bjoern
 from django_project.wsgi import application
 
+logging.basicConfig(level=logging.INFO, format='[%(asctime)s] [%(process)d] %(levelname)s %(message)s')
+logger = logging.getLogger('run_bjoern')
+
 # Define the host and port
 host = '0.0.0.0'
 port = 8011
 
-# Start the Bjoern server
-bjoern.run(application, host, port)
+# Worker processes sharing the listen socket; defaults to one per CPU core
+workers = int(os.environ.get('BJOERN_WORKERS', os.cpu_count() or 1))
+# Requests after which a worker is replaced, to bound memory growth (0 disables recycling)
+max_requests = int(os.environ.get('BJOERN_MAX_REQUESTS', 10000))
+# Up to this many extra requests per worker, so workers are not all replaced at once
+max_requests_jitter = int(os.environ.get('BJOERN_MAX_REQUESTS_JITTER', 1000))
+# Seconds a stopping worker gets to finish its open requests before it is killed
+graceful_timeout = int(os.environ.get('BJOERN_GRACEFUL_TIMEOUT', 30))
+
+# Passed from a master to the one it re-executes on SIGHUP
+LISTEN_FD_ENV = 'BJOERN_LISTEN_FD'
+OLD_WORKERS_ENV = 'BJOERN_OLD_WORKERS'
+STOPPING_WORKERS_ENV = 'BJOERN_STOPPING_WORKERS'
+
+# Signals handled by the master
+MASTER_SIGNALS = {signal.SIGHUP, signal.SIGTERM, signal.SIGINT}
+
+# Workers dying sooner than this after their start are respawned with a delay
+MIN_WORKER_LIFETIME = 1.0
+
+
+def recycling(app, limit):
+    """
+    Wraps a WSGI application so the worker stops gracefully after `limit` requests.
+    """
+    served = 0
+
+    def wrapped(environ, start_response):
+        nonlocal served
+        served += 1
+        if served == limit:
+            # On SIGINT bjoern stops accepting and returns once its open requests are done
+            os.kill(os.getpid(), signal.SIGINT)
+        return app(environ, start_response)
+    return wrapped
+
+
+def run_worker(sock):
+    # The master's handlers are inherited through fork(); bjoern handles SIGINT itself
+    signal.set_wakeup_fd(-1)
+    for signum in (signal.SIGHUP, signal.SIGTERM, signal.SIGCHLD):
+        signal.signal(signum, signal.SIG_DFL)
+    signal.signal(signal.SIGINT, signal.default_int_handler)
+    random.seed() # Otherwise every worker draws the same jitter
+    app = application
+    if max_requests:
+        app = recycling(application, max_requests + random.randint(0, max_requests_jitter))
+    try:
+        bjoern.server_run(sock, app)
+    except KeyboardInterrupt:
+        pass
+    except Exception as e:
+        logger.error(f"Worker failed: {e}", exc_info=True)
+        os._exit(1)
+    os._exit(0)
+
+
+def _pids(name):
+    return [int(pid) for pid in os.environ.pop(name, '').split(',') if pid]
+
+
+class Master:
+    """
+    Keeps `workers` Bjoern workers running on one inherited listen socket.
+    """
+    def __init__(self, sock):
+        self.sock = sock
+        self.workers = {} # pid -> start time
+        self.stopping = {} # pid -> time after which it is killed
+        self.signals = []
+        self.shutting_down = False
+        self.spawn_after = 0.0
+        # Workers of the master this one replaced on SIGHUP; still children of this process
+        self.old_workers = _pids(OLD_WORKERS_ENV)
+        for pid in _pids(STOPPING_WORKERS_ENV):
+            self.stopping[pid] = time.monotonic() + graceful_timeout
+
+    def spawn(self):
+        pid = os.fork()
+        if pid == 0:
+            run_worker(self.sock)
+        self.workers[pid] = time.monotonic()
+        logger.info(f"Started worker {pid}")
+
+    def stop(self, pid):
+        """Asks a worker to finish its open requests and exit."""
+        self.workers.pop(pid, None)
+        try:
+            os.kill(pid, signal.SIGINT)
+        except ProcessLookupError:
+            return
+        self.stopping[pid] = time.monotonic() + graceful_timeout
+
+    def reap(self):
+        while True:
+            try:
+                pid, status = os.waitpid(-1, os.WNOHANG)
+            except ChildProcessError:
+                return
+            if pid == 0:
+                return
+            if self.stopping.pop(pid, None) is not None:
+                logger.info(f"Worker {pid} stopped")
+                continue
+            started_at = self.workers.pop(pid, None)
+            if started_at is None:
+                continue
+            exit_code = os.waitstatus_to_exitcode(status)
+            if exit_code == 0:
+                logger.info(f"Worker {pid} exited after reaching its request limit")
+            else:
+                logger.warning(f"Worker {pid} died with exit code {exit_code}")
+                if time.monotonic() - started_at < MIN_WORKER_LIFETIME:
+                    # Do not fork in a tight loop while something is broken
+                    self.spawn_after = time.monotonic() + MIN_WORKER_LIFETIME
+
+    def kill_overdue(self):
+        now = time.monotonic()
+        for pid, deadline in list(self.stopping.items()):
+            if now > deadline:
+                logger.warning(f"Worker {pid} did not stop within {graceful_timeout}s, killing it")
+                try:
+                    os.kill(pid, signal.SIGKILL)
+                except ProcessLookupError:
+                    pass
+                self.stopping[pid] = float('inf') # Reaped like any other stopped worker
+
+    def reload(self):
+        # Signals arriving from here on stay pending until a master handles them:
+        # this one if the reload is aborted, the new one otherwise
+        signal.pthread_sigmask(signal.SIG_BLOCK, MASTER_SIGNALS)
+        # A broken deploy must not take down the running workers
+        check = subprocess.run([sys.executable, '-c', 'import django_project.wsgi'])
+        if check.returncode != 0:
+            logger.error("Reload aborted: the application failed to import")
+            signal.pthread_sigmask(signal.SIG_UNBLOCK, MASTER_SIGNALS)
+            return
+        logger.info("Reloading")
+        self.sock.set_inheritable(True)
+        os.environ[LISTEN_FD_ENV] = str(self.sock.fileno())
+        os.environ[OLD_WORKERS_ENV] = ','.join(str(pid) for pid in [*self.workers, *self.old_workers])
+        os.environ[STOPPING_WORKERS_ENV] = ','.join(str(pid) for pid in self.stopping)
+        # Same pid, so the current workers remain children of the new master
+        os.execv(sys.executable, [sys.executable, *sys.argv])
+
+    def handle_signals(self):
+        signals, self.signals = self.signals, []
+        for signum in signals:
+            if signum == signal.SIGHUP and not self.shutting_down:
+                self.reload()
+            elif signum in (signal.SIGTERM, signal.SIGINT) and not self.shutting_down:
+                logger.info("Shutting down")
+                self.shutting_down = True
+                for pid in [*self.workers, *self.old_workers]:
+                    self.stop(pid)
+                self.old_workers = []
+
+    def run(self):
+        wakeup_read, wakeup_write = os.pipe()
+        os.set_blocking(wakeup_write, False)
+        signal.set_wakeup_fd(wakeup_write) # Wakes up select() below on every signal
+        for signum in MASTER_SIGNALS:
+            signal.signal(signum, lambda signum, frame: self.signals.append(signum))
+        signal.signal(signal.SIGCHLD, lambda signum, frame: None)
+        signal.pthread_sigmask(signal.SIG_UNBLOCK, MASTER_SIGNALS)
+
+        while True:
+            self.handle_signals()
+            self.reap()
+            if self.shutting_down:
+                if not self.workers and not self.stopping:
+                    logger.info("All workers stopped")
+                    return
+            else:
+                while len(self.workers) < workers and time.monotonic() >= self.spawn_after:
+                    self.spawn()
+                if self.old_workers and len(self.workers) == workers:
+                    # The new workers accept connections now
+                    for pid in self.old_workers:
+                        self.stop(pid)
+                    self.old_workers = []
+            self.kill_overdue()
+            if select.select([wakeup_read], [], [], 1.0)[0]:
+                os.read(wakeup_read, 4096)
+
+
+def listen_socket():
+    fd = os.environ.pop(LISTEN_FD_ENV, None)
+    if fd is not None:
+        # Re-executed on SIGHUP: keep the socket, so no connection is refused
+        sock = socket.socket(fileno=int(fd))
+        sock.set_inheritable(False)
+        return sock
+    return bjoern.bind_and_listen(host, port)
+
 
+if __name__ == '__main__':
+    # Keep the objects imported so far out of the garbage collector, so the workers
+    # do not copy the pages they share with the master by touching them
+    gc.freeze()
+    sock = listen_socket()
+    logger.info(f"Listening on {host}:{port} with {workers} workers")
+    Master(sock).run()
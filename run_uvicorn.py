@@ -0,0 +1,30 @@
+import os
+
+import uvicorn
+
+# Define the host and port (the same as run_bjoern.py, so Nginx works with either server)
+host = '0.0.0.0'
+port = int(os.environ.get('ASGI_PORT', 8011))
+
+# Worker processes, each with its own event loop; defaults to one per CPU core
+workers = int(os.environ.get('ASGI_WORKERS', os.cpu_count() or 1))
+# Open connections plus requests in flight per worker; beyond that new requests get a 503.
+# Every request in flight can hold a database connection of its own
+limit_concurrency = int(os.environ.get('ASGI_LIMIT_CONCURRENCY', 100))
+
+# Under ASGI every request runs its database work in a thread of its own, so persistent
+# connections would pile up per thread; use PgBouncer to pool connections instead
+os.environ.setdefault('POSTGRES_CONN_MAX_AGE', '0')
+
+# Start the Uvicorn server with the Django ASGI application
+if __name__ == '__main__': # Worker processes re-import this module
+    uvicorn.run(
+        'django_project.asgi:application',
+        host=host,
+        port=port,
+        workers=workers,
+        limit_concurrency=limit_concurrency,
+        lifespan='off', # Django does not implement the ASGI lifespan protocol
+        proxy_headers=True, # Trust X-Forwarded-For from Nginx
+        access_log=False, # Nginx already logs every request
+    )
@@ -43,6 +43,26 @@ curl -X GET \
 echo # Add a newline for cleaner output
 
 
+# --- 2a. Test GET /get_article_crosses/page (keyset pagination) ---
+echo -e "\n--- Testing GET /get_article_crosses/page (first page of 2 articles) ---"
+curl -X GET \
+  -H "Authorization: Bearer $ACCESS_TOKEN" \
+  "${API_BASE_URL}/get_article_crosses/page?limit=2"
+echo # Add a newline for cleaner output
+
+
+# --- 2b. Test GET /get_article_crosses/stream (NDJSON and CSV streaming) ---
+echo -e "\n--- Testing GET /get_article_crosses/stream (NDJSON) ---"
+curl -s -X GET \
+  -H "Authorization: Bearer $ACCESS_TOKEN" \
+  "${API_BASE_URL}/get_article_crosses/stream" | head -n 5
+
+echo -e "\n--- Testing GET /get_article_crosses/stream?format=csv ---"
+curl -s -X GET \
+  -H "Authorization: Bearer $ACCESS_TOKEN" \
+  "${API_BASE_URL}/get_article_crosses/stream?format=csv" | head -n 5
+
+
 # --- 3. Test POST /add_article_crosses (Add a new article) ---
 echo -e "\n--- Testing POST /add_article_crosses (Adding a new unique article) ---"
 NEW_ARTICLE_DATA='{
@@ -125,4 +145,105 @@ curl -s -o /dev/null -w "%{http_code}\n" -X POST \
 echo " (Expected HTTP 404 Not Found)"
 echo # Add a newline for cleaner output
 
+
+# --- 5. Test GET /crosses/lookup and POST /crosses/lookup (reverse cross search) ---
+echo -e "\n--- Testing GET /crosses/lookup (articles crossing to a number) ---"
+curl -X GET \
+  -H "Authorization: Bearer $ACCESS_TOKEN" \
+  "${API_BASE_URL}/crosses/lookup?number=api-test-cross"
+echo # Add a newline for cleaner output
+
+echo -e "\n--- Testing POST /crosses/lookup (batch lookup) ---"
+curl -X POST \
+  -H "Content-Type: application/json" \
+  -H "Authorization: Bearer $ACCESS_TOKEN" \
+  -d '{"numbers": ["TM901", "TNG-123", "0265005234"]}' \
+  "${API_BASE_URL}/crosses/lookup"
+echo # Add a newline for cleaner output
+
+# --- 6. Test POST /articles/batch_get (many articles in one call) ---
+echo -e "\n--- Testing POST /articles/batch_get ---"
+curl -X POST \
+  -H "Content-Type: application/json" \
+  -H "Authorization: Bearer $ACCESS_TOKEN" \
+  -d '{"articles": ["'"$UPDATE_ARTICLE"'", "'"$NON_EXISTENT_ARTICLE"'"]}' \
+  "${API_BASE_URL}/articles/batch_get"
+echo # Add a newline for cleaner output
+
+# --- 7. Test response caching (ETag / If-None-Match) and cache counters ---
+echo -e "\n--- Testing GET /articles/{article} (cached per-article read) ---"
+curl -X GET \
+  -H "Authorization: Bearer $ACCESS_TOKEN" \
+  "${API_BASE_URL}/articles/${UPDATE_ARTICLE}"
+echo # Add a newline for cleaner output
+
+echo -e "\n--- Testing GET /get_article_crosses with If-None-Match (expected 304 Not Modified) ---"
+ETAG=$(curl -s -D - -o /dev/null \
+  -H "Authorization: Bearer $ACCESS_TOKEN" \
+  "${API_BASE_URL}/get_article_crosses" | grep -i '^etag:' | cut -d' ' -f2 | tr -d '\r')
+curl -s -o /dev/null -w "%{http_code}\n" \
+  -H "Authorization: Bearer $ACCESS_TOKEN" \
+  -H "If-None-Match: $ETAG" \
+  "${API_BASE_URL}/get_article_crosses"
+echo " (Expected HTTP 304 Not Modified)"
+
+echo -e "\n--- Testing GET /cache/stats ---"
+curl -X GET \
+  -H "Authorization: Bearer $ACCESS_TOKEN" \
+  "${API_BASE_URL}/cache/stats"
+echo # Add a newline for cleaner output
+
+# --- 8. Test GET /articles/changes (delta sync) ---
+echo -e "\n--- Testing GET /articles/changes (first page of a full sync) ---"
+curl -X GET \
+  -H "Authorization: Bearer $ACCESS_TOKEN" \
+  "${API_BASE_URL}/articles/changes?limit=5"
+echo # Add a newline for cleaner output
+
+# --- 9. Test GET /products/search (full-text and fuzzy article/brand search) ---
+echo -e "\n--- Testing GET /products/search ---"
+curl -G \
+  -H "Authorization: Bearer $ACCESS_TOKEN" \
+  --data-urlencode "q=масляный фильтр" \
+  --data-urlencode "limit=5" \
+  "${API_BASE_URL}/products/search"
+echo # Add a newline for cleaner output
+
+# --- 9a. Test GET /products/filter (specification attributes, with facet counts) ---
+echo -e "\n--- Testing GET /products/filter ---"
+curl -G \
+  -H "Authorization: Bearer $ACCESS_TOKEN" \
+  --data-urlencode "spec.Weight=1kg" \
+  --data-urlencode "facets=true" \
+  --data-urlencode "limit=5" \
+  "${API_BASE_URL}/products/filter"
+echo # Add a newline for cleaner output
+
+# --- 9b. Test POST /exports and GET /exports/{task_id} (catalog export) ---
+echo -e "\n--- Testing POST /exports (CSV) ---"
+EXPORT_TASK_ID=$(curl -s -X POST \
+  -H "Authorization: Bearer $ACCESS_TOKEN" \
+  -H "Content-Type: application/json" \
+  -d '{"format": "csv"}' \
+  "${API_BASE_URL}/exports" | jq -r ".task_id")
+sleep 2
+curl -X GET \
+  -H "Authorization: Bearer $ACCESS_TOKEN" \
+  "${API_BASE_URL}/exports/${EXPORT_TASK_ID}"
+echo # Add a newline for cleaner output
+
+# --- 10. Test the product group tree and listing products by group ---
+echo -e "\n--- Testing GET /groups/tree ---"
+curl -X GET \
+  -H "Authorization: Bearer $ACCESS_TOKEN" \
+  "${API_BASE_URL}/groups/tree"
+echo # Add a newline for cleaner output
+
+echo -e "\n--- Testing GET /groups/{id}/products?recursive=true (first root group, subgroups included) ---"
+ROOT_GROUP_ID=$(curl -s -H "Authorization: Bearer $ACCESS_TOKEN" "${API_BASE_URL}/groups/tree" | jq -r '.[0].id')
+curl -X GET \
+  -H "Authorization: Bearer $ACCESS_TOKEN" \
+  "${API_BASE_URL}/groups/${ROOT_GROUP_ID}/products?recursive=true&limit=5"
+echo # Add a newline for cleaner output
+
 echo "--- API Endpoint Test Script Finished ---"